@@ -0,0 +1,74 @@
+"""
+Micro-benchmarks for server.py hot functions
+Order totals, order enrichment, response model construction and token
+handling run at 10, 1k and 100k rows; password hashing is timed per call.
+
+Run from backend/:
+    python -m pytest benchmarks/bench_hot_paths.py --benchmark-autosave
+"""
+from typing import List
+
+import jwt
+import pytest
+from pydantic import TypeAdapter
+
+from conftest import make_client_rows, make_order_rows
+from server import (
+    ALGORITHM, SECRET_KEY, ClientResponse, OrderResponse, calculate_order_totals, create_token,
+    enrich_order_response, hash_password, verify_password,
+)
+
+def test_calculate_order_totals(benchmark, scale):
+    orders = make_order_rows(scale)
+    benchmark.group = "calculate_order_totals"
+    benchmark(lambda: [calculate_order_totals(o["line_items"], o["tax_rate"]) for o in orders])
+
+def test_enrich_order_response(benchmark, scale):
+    orders = make_order_rows(scale)
+    benchmark.group = "enrich_order_response"
+    # Enrichment only adds derived keys, so re-running it on the same dicts is representative
+    result = benchmark(lambda: [enrich_order_response(o) for o in orders])
+    assert result[0]["total"] > 0
+
+@pytest.mark.parametrize("model,make_rows", [
+    (ClientResponse, make_client_rows),
+    (OrderResponse, lambda n: [enrich_order_response(o) for o in make_order_rows(n)]),
+], ids=["ClientResponse", "OrderResponse"])
+def test_model_list_construction(benchmark, scale, model, make_rows):
+    """[Model(**row) ...] as the older handlers build responses"""
+    rows = make_rows(scale)
+    benchmark.group = f"{model.__name__} list"
+    benchmark(lambda: [model(**row) for row in rows])
+
+@pytest.mark.parametrize("model,make_rows", [
+    (ClientResponse, make_client_rows),
+    (OrderResponse, lambda n: [enrich_order_response(o) for o in make_order_rows(n)]),
+], ids=["ClientResponse", "OrderResponse"])
+def test_model_list_validation(benchmark, scale, model, make_rows):
+    """TypeAdapter(List[Model]) validate + dump_json, the path model_response takes"""
+    rows = make_rows(scale)
+    adapter = TypeAdapter(List[model])
+    benchmark.group = f"{model.__name__} list"
+    benchmark(lambda: adapter.dump_json(adapter.validate_python(rows)))
+
+def test_create_token(benchmark, scale):
+    users = [(f"user-{i}", f"user{i}@example.com") for i in range(scale)]
+    benchmark.group = "jwt"
+    benchmark(lambda: [create_token(user_id, email) for user_id, email in users])
+
+def test_decode_token(benchmark, scale):
+    """The signature check get_current_user runs before its user lookup"""
+    tokens = [create_token(f"user-{i}", f"user{i}@example.com") for i in range(scale)]
+    benchmark.group = "jwt"
+    benchmark(lambda: [jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]) for token in tokens])
+
+def test_hash_password(benchmark):
+    """bcrypt is deliberately slow; this tracks the work factor, not throughput"""
+    benchmark.group = "password"
+    hashed = benchmark.pedantic(hash_password, args=("admin123",), rounds=5, iterations=1)
+    assert verify_password("admin123", hashed)
+
+def test_verify_password(benchmark):
+    hashed = hash_password("admin123")
+    benchmark.group = "password"
+    assert benchmark.pedantic(verify_password, args=("admin123", hashed), rounds=5, iterations=1)
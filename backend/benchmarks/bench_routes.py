@@ -0,0 +1,54 @@
+"""
+Route latency on the embedded backends
+Times the busiest endpoints (routing, auth, query matching, model validation
+and serialization) with no network round trip, over a synthetic dataset of
+10, 1k and 100k clients/orders/deals, on the in-memory and SQLite backends.
+
+Run from backend/:
+    python -m pytest benchmarks/bench_routes.py --benchmark-autosave
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from indexes import ensure_indexes
+from repositories import open_database
+from synthetic_data import SyntheticDataSpec, generate_dataset
+
+ROUTES = [
+    "/api/clients",
+    "/api/clients?search=Summit",
+    "/api/clients/{client_id}",
+    "/api/clients/{client_id}/orders",
+    "/api/orders",
+    "/api/deals",
+    "/api/dashboard/stats",
+]
+
+@pytest.fixture(scope="module")
+def app_client():
+    with TestClient(server.app) as client:
+        yield client
+
+@pytest.fixture(params=["memory", "sqlite"])
+def loaded(request, app_client, scale, tmp_path):
+    """A fresh database holding `scale` clients, orders and deals"""
+    server.db.bind(open_database(request.param, f"bench_{scale}", str(tmp_path / "bench.sqlite3")))
+    asyncio.run(ensure_indexes(server.db))
+    app_client.post("/api/seed")
+    response = app_client.post("/api/auth/login", json={"email": "scott@soaeast.com", "password": "admin123"})
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    spec = SyntheticDataSpec(clients=scale, products=50, orders=scale, deals=scale, notes=0, messages=0, seed=1)
+    asyncio.run(generate_dataset(server.db, spec))
+    client_id = app_client.get("/api/clients", headers=headers).json()[0]["id"]
+    return headers, {"client_id": client_id}
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_route(benchmark, app_client, loaded, route):
+    headers, ids = loaded
+    path = route.format(**ids)
+    benchmark.group = route
+    response = benchmark(app_client.get, path, headers=headers)
+    assert response.status_code == 200
@@ -0,0 +1,71 @@
+"""
+Micro-benchmark for list response serialization
+Compares the per-row cost of the old handler path (construct models, then
+FastAPI re-validates and encodes them through response_model) with
+model_response (validate once, serialize natively) and a trusted
+model_construct + orjson path.
+
+Run from backend/: python benchmarks/bench_serialization.py [rows ...]
+"""
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import orjson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'soa_crm_bench')
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from conftest import make_client_rows, make_order_rows  # noqa: E402
+from server import ClientResponse, OrderResponse, enrich_order_response, model_response  # noqa: E402
+
+def order_rows(count: int) -> list:
+    return [enrich_order_response(order) for order in make_order_rows(count)]
+
+async def legacy_path(rows: list, model: type) -> bytes:
+    """What the handlers did before: build models, FastAPI validates and encodes them again,
+    then the stdlib json encoder renders the body"""
+    field = create_response_field(name="Response", type_=List[model])
+    content = await serialize_response(field=field, response_content=[model(**r) for r in rows])
+    return JSONResponse(content).body
+
+def model_response_path(rows: list, model: type) -> bytes:
+    return model_response(rows, model).body
+
+def construct_path(rows: list, model: type) -> bytes:
+    """Trusted rows: skip validation entirely"""
+    return orjson.dumps([model.model_construct(**r).model_dump() for r in rows])
+
+def per_row_us(func, rows: list, model: type, repeat: int = 5) -> float:
+    import asyncio
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(rows, model)
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+        best = min(best, time.perf_counter() - start)
+    return best / len(rows) * 1e6
+
+def main(sizes: List[int]):
+    paths = [
+        ("legacy (construct + response_model)", legacy_path),
+        ("model_response (validate once)", model_response_path),
+        ("model_construct + orjson", construct_path),
+    ]
+    for model, make_rows in [(ClientResponse, make_client_rows), (OrderResponse, order_rows)]:
+        for size in sizes:
+            rows = make_rows(size)
+            print(f"\n{model.__name__} x {size} rows (best of 5, us/row)")
+            for name, func in paths:
+                print(f"  {name:<40} {per_row_us(func, rows, model):8.2f}")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
@@ -0,0 +1,117 @@
+"""
+Worker cold start
+Starts the API in a fresh process --runs times and reports, per run and as
+medians:
+    ready        process spawn until /health answers (import + lifespan startup)
+    first_request  an authenticated GET /api/clients right after login
+    lazy_router  the first GET /api/brokers (imports routers.brokers unless the
+                 warm-up task already has)
+    openapi      the first GET /openapi.json
+along with the worker's own lifespan phase timings from /metrics.
+
+Embedded backend (no mongod needed):
+    python benchmarks/cold_start.py --backend sqlite --runs 10
+
+Against Mongo:
+    python benchmarks/cold_start.py --backend mongo --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+from load_test import free_port
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30) -> float:
+    """Seconds until `url` answers 200, polled every 5ms"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise SystemExit("API process exited during startup")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+def timed(call) -> tuple:
+    started = time.perf_counter()
+    response = call()
+    response.raise_for_status()
+    return time.perf_counter() - started, response
+
+def startup_phases(base_url: str) -> dict:
+    phases = {}
+    for line in httpx.get(f"{base_url}/metrics").text.splitlines():
+        if line.startswith("app_startup_phase_seconds{"):
+            label, value = line.split(" ")
+            phases[label.split('"')[1]] = round(float(value), 4)
+    return phases
+
+def run_once(env: dict) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    try:
+        result = {"ready": wait_ready(f"{base_url}/health", process) - started}
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            client.post("/api/seed").raise_for_status()
+            token = client.post("/api/auth/login", json={"email": "scott@soaeast.com", "password": "admin123"}).json()
+            client.headers["Authorization"] = f"Bearer {token['access_token']}"
+            result["first_request"], _ = timed(lambda: client.get("/api/clients"))
+            result["lazy_router"], _ = timed(lambda: client.get("/api/brokers"))
+            result["openapi"], _ = timed(lambda: client.get("/openapi.json"))
+        result["phases"] = startup_phases(base_url)
+        return result
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="sqlite", choices=["mongo", "memory", "sqlite"])
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    env = {**os.environ, "DB_BACKEND": args.backend, "MONGO_URL": args.mongo_url}
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="crm-cold-") as scratch:
+        for i in range(args.runs):
+            # A new database each run, so every worker builds its indexes from scratch
+            env["DB_NAME"] = f"crm_cold_{uuid.uuid4().hex[:8]}"
+            env["DB_PATH"] = os.path.join(scratch, f"{env['DB_NAME']}.sqlite3")
+            try:
+                runs.append(run_once(env))
+            finally:
+                if args.backend == "mongo":
+                    from pymongo import MongoClient
+                    MongoClient(args.mongo_url).drop_database(env["DB_NAME"])
+            print(f"run {i + 1}: " + "  ".join(f"{k} {v * 1000:.1f}ms" for k, v in runs[-1].items() if k != "phases"))
+
+    report = {key: statistics.median(run[key] for run in runs) for key in ("ready", "first_request", "lazy_router", "openapi")}
+    report["phases"] = runs[-1]["phases"]
+    print("median: " + "  ".join(f"{k} {v * 1000:.1f}ms" for k, v in report.items() if k != "phases"))
+    print(f"lifespan phases (last run): {report['phases']}")
+    if args.json:
+        Path(args.json).write_text(json.dumps({"median": report, "runs": runs}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Shared setup for the pytest-benchmark suites in this directory.
+
+Results are saved under benchmarks/baselines (not committed: timings only mean
+something on the machine that produced them). Save a baseline first, then
+compare later runs on the same host against it:
+
+    python -m pytest benchmarks/bench_hot_paths.py --benchmark-save=baseline
+    python -m pytest benchmarks/bench_hot_paths.py --benchmark-compare=0001 --benchmark-compare-fail=mean:25%
+
+Set BENCH_SCALES (e.g. "10,1000") to skip the 100k-row cases locally.
+"""
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'soa_crm_bench')
+# Route benchmarks measure the Python layer, see bench_routes.py
+os.environ.setdefault('DB_BACKEND', 'memory')
+
+SCALES = [int(s) for s in os.environ.get('BENCH_SCALES', '10,1000,100000').split(',')]
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # Keep baselines next to the benchmarks instead of ./.benchmarks in the cwd
+    if config.pluginmanager.hasplugin("benchmark") and config.getoption("benchmark_storage") == "file://./.benchmarks":
+        config.option.benchmark_storage = f"file://{BENCH_DIR / 'baselines'}"
+
+def make_client_rows(count: int) -> list:
+    return [{
+        "id": str(uuid.uuid4()),
+        "name": f"Client {i}",
+        "email": f"client{i}@example.com",
+        "industry": "Technology",
+        "tier": "gold",
+        "total_revenue": 1000.0 + i,
+        "total_orders": i % 50,
+        "last_order_date": "2024-06-01T12:00:00+00:00",
+        "status": "active",
+        "created_at": "2024-01-01T12:00:00+00:00",
+        "phone": "(555) 123-4567",
+        "city": "Boston",
+        "state": "MA",
+        "version": 1
+    } for i in range(count)]
+
+def make_order_rows(count: int) -> list:
+    """Orders as stored in Mongo, before enrich_order_response adds the totals"""
+    return [{
+        "id": str(uuid.uuid4()),
+        "order_id": f"SOA-{1000 + i}",
+        "client_id": str(uuid.uuid4()),
+        "client_name": f"Client {i}",
+        "line_items": [
+            {"product_name": "Custom Polo Shirts", "quantity": 100, "unit_price": 24.99},
+            {"product_name": "Branded Tote Bags", "quantity": 250, "unit_price": 14.99},
+            {"product_name": "Embroidered Caps", "quantity": 75 + i % 10, "unit_price": 18.50},
+        ],
+        "tax_rate": 8.5,
+        "status": "production",
+        "progress_percent": 40,
+        "due_date": "2024-07-01",
+        "priority": "medium",
+        "created_at": "2024-06-01T12:00:00+00:00"
+    } for i in range(count)]
+
+@pytest.fixture(params=SCALES, ids=lambda n: f"{n}rows")
+def scale(request):
+    return request.param
@@ -0,0 +1,336 @@
+"""
+Async load test
+Replays the flows scripted in backend_test.py and tests/ (login, browsing,
+client CRUD with notes, orders with line items, broker sales) as an open
+workload: scenarios arrive as a Poisson process at --rate per second and run
+concurrently over httpx. Each scenario runs as one of --users virtual users,
+registered at the start (LOAD_* accounts), so per-user rate limits apply as
+they would in production. Reports throughput and p50/p95/p99 latency per
+endpoint (route template, not raw URL).
+
+Against a running API:
+    python benchmarks/load_test.py --base-url http://localhost:8001 --rate 20 --duration 60
+
+Or launch everything locally (scratch database, dropped afterwards when it is Mongo):
+    python benchmarks/load_test.py --launch --mongod /usr/bin/mongod --rate 20 --mix browse=6,client_crud=2,order_flow=1,broker_flow=1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+logger = logging.getLogger("load_test")
+
+class LoadSession:
+    """Records one latency sample per request, keyed by "METHOD /route/{template}" """
+
+    def __init__(self, client: httpx.AsyncClient, headers: dict, credentials: Optional[dict] = None):
+        self.client = client
+        self.headers = headers
+        self.credentials = credentials
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def for_user(self, token: str, credentials: dict) -> "LoadSession":
+        """Session acting as another user, recording into the same samples"""
+        session = LoadSession(self.client, {"Authorization": f"Bearer {token}"}, credentials)
+        session.latencies, session.errors = self.latencies, self.errors
+        return session
+
+    async def call(self, method: str, template: str, expected=(200,), **kwargs):
+        path_params = kwargs.pop("path", {})
+        endpoint = f"{method} {template}"
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, template.format(**path_params), headers=self.headers, **kwargs)
+        except httpx.HTTPError:
+            self.errors[endpoint] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if response.status_code not in expected:
+            self.errors[endpoint] += 1
+            return None
+        return response.json() if response.content else {}
+
+# ============== SCENARIOS ==============
+
+async def login(session: LoadSession):
+    await session.call("POST", "/api/auth/login", json=session.credentials)
+
+async def browse(session: LoadSession):
+    await session.call("GET", "/api/dashboard/stats")
+    await session.call("GET", "/api/dashboard/recent-deals")
+    clients = await session.call("GET", "/api/clients")
+    await session.call("GET", "/api/orders")
+    await session.call("GET", "/api/deals")
+    await session.call("GET", "/api/products")
+    if clients:
+        client_id = random.choice(clients)["id"]
+        await session.call("GET", "/api/clients/{client_id}", path={"client_id": client_id})
+        await session.call("GET", "/api/clients/{client_id}/orders", path={"client_id": client_id})
+
+async def client_crud(session: LoadSession):
+    suffix = uuid.uuid4().hex[:8]
+    client = await session.call("POST", "/api/clients", json={
+        "name": f"LOAD_Client_{suffix}", "email": f"load_{suffix}@soaeast.com", "industry": "Technology",
+        "phone": "(555) 010-0000", "city": "Boston", "state": "MA"
+    })
+    if not client:
+        return
+    path = {"client_id": client["id"]}
+    await session.call("GET", "/api/clients/{client_id}", path=path)
+    await session.call("PUT", "/api/clients/{client_id}", path=path, json={"tier": "silver", "status": "active"})
+    await session.call("POST", "/api/clients/{client_id}/notes", path=path,
+                       json={"content": "Called to confirm order details", "note_type": "call"})
+    await session.call("GET", "/api/clients/{client_id}/notes", path=path)
+    await session.call("DELETE", "/api/clients/{client_id}", path=path)
+
+async def order_flow(session: LoadSession):
+    clients = await session.call("GET", "/api/clients", params={"fields": "id,name"})
+    products = await session.call("GET", "/api/products")
+    if not clients or not products:
+        return
+    line_items = [
+        {"product_name": p["name"], "quantity": random.randint(10, 500), "unit_price": p["base_price"]}
+        for p in random.sample(products, min(3, len(products)))
+    ]
+    order = await session.call("POST", "/api/orders", json={
+        "client_id": random.choice(clients)["id"],
+        "line_items": line_items,
+        "due_date": (datetime.now(timezone.utc) + timedelta(days=30)).strftime("%Y-%m-%d"),
+        "notes": "LOAD test order"
+    })
+    if not order:
+        return
+    path = {"order_id": order["id"]}
+    await session.call("GET", "/api/orders/{order_id}", path=path)
+    await session.call("PUT", "/api/orders/{order_id}", path=path, json={"status": "production", "progress_percent": 25})
+    await session.call("DELETE", "/api/orders/{order_id}", path=path)
+
+async def broker_flow(session: LoadSession):
+    suffix = uuid.uuid4().hex[:8]
+    broker = await session.call("POST", "/api/brokers", json={
+        "name": f"LOAD_Broker_{suffix}", "company": "Load Test Brokers", "email": f"broker_{suffix}@soaeast.com",
+        "territory": "Northeast", "commission_rate": 12.5
+    })
+    await session.call("GET", "/api/brokers")
+    if not broker:
+        return
+    path = {"broker_id": broker["id"]}
+    await session.call("POST", "/api/brokers/{broker_id}/record-sale", path=path, params={"amount": 2500})
+    await session.call("GET", "/api/brokers/{broker_id}", path=path)
+    await session.call("DELETE", "/api/brokers/{broker_id}", path=path)
+
+SCENARIOS = {
+    "login": login,
+    "browse": browse,
+    "client_crud": client_crud,
+    "order_flow": order_flow,
+    "broker_flow": broker_flow,
+}
+
+# ============== RUNNER ==============
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+async def register_users(client: httpx.AsyncClient, count: int) -> list:
+    """Register `count` load-test users; returns (token, credentials) per user"""
+    run_id = uuid.uuid4().hex[:8]
+    users = []
+    for i in range(count):
+        credentials = {"email": f"load_{run_id}_{i}@soaeast.com", "password": f"load-{run_id}"}
+        while True:
+            response = await client.post("/api/auth/register", json={**credentials, "name": f"LOAD User {i}"})
+            if response.status_code != 429:
+                break
+            # Registrations share the per-address auth bucket
+            await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+        response.raise_for_status()
+        users.append((response.json()["access_token"], credentials))
+    return users
+
+async def run_load(base_url: str, rate: float, duration: float, mix: dict, max_concurrency: int, seed: int, users: int) -> dict:
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        await client.post("/api/seed")
+        session = LoadSession(client, {})
+        sessions = [session.for_user(token, credentials) for token, credentials in await register_users(client, users)]
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        tasks, dropped = set(), 0
+
+        async def run_scenario(name, user_session):
+            async with semaphore:
+                await SCENARIOS[name](user_session)
+
+        start = time.perf_counter()
+        next_arrival = start
+        while next_arrival - start < duration:
+            await asyncio.sleep(max(next_arrival - time.perf_counter(), 0))
+            if semaphore.locked():
+                # Open workload: count arrivals the system could not even start
+                dropped += 1
+            else:
+                task = asyncio.create_task(run_scenario(rng.choices(names, weights)[0], rng.choice(sessions)))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            next_arrival += rng.expovariate(rate)
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for endpoint, samples in sorted(session.latencies.items()):
+        ms = np.array(samples) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        endpoints[endpoint] = {
+            "count": len(samples),
+            "errors": session.errors.get(endpoint, 0),
+            "rps": round(len(samples) / elapsed, 2),
+            "p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2),
+            "max_ms": round(ms.max(), 2),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "errors": sum(session.errors.values()),
+        "dropped_arrivals": dropped,
+        "endpoints": endpoints,
+    }
+
+def print_report(report: dict):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s "
+          f"({report['throughput_rps']} req/s, {report['errors']} errors, {report['dropped_arrivals']} dropped arrivals)\n")
+    print(f"{'endpoint':<48} {'count':>7} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<48} {stats['count']:>7} {stats['errors']:>5} {stats['rps']:>8} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+
+# ============== LOCAL LAUNCH ==============
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Timed out waiting for {what}")
+
+def launch(args) -> tuple:
+    """Start mongod (optional) and uvicorn on free ports.
+
+    Returns (base_url, processes, cleanup paths, mongo_url), where mongo_url
+    is None unless the launched API stores its data in Mongo.
+    """
+    processes, paths = [], []
+    mongo_url = args.mongo_url
+    if args.mongod:
+        dbpath = tempfile.mkdtemp(prefix="crm-load-")
+        paths.append(dbpath)
+        port = free_port()
+        processes.append(subprocess.Popen(
+            [args.mongod, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+            stdout=subprocess.DEVNULL
+        ))
+        mongo_url = f"mongodb://127.0.0.1:{port}"
+        from pymongo import MongoClient
+        wait_for(lambda: MongoClient(mongo_url, serverSelectionTimeoutMS=500).admin.command("ping"), 30, "mongod")
+
+    api_port = free_port()
+    env = {**os.environ, "MONGO_URL": mongo_url, "DB_NAME": args.db_name}
+    processes.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(api_port), "--workers", str(args.workers),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    ))
+    base_url = f"http://127.0.0.1:{api_port}"
+    wait_for(lambda: httpx.get(f"{base_url}/health").status_code == 200, 30, "API")
+    return base_url, processes, paths, mongo_url if env.get("DB_BACKEND", "mongo") == "mongo" else None
+
+def drop_database(mongo_url: str, db_name: str):
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    try:
+        MongoClient(mongo_url, serverSelectionTimeoutMS=5000).drop_database(db_name)
+    except PyMongoError:
+        logger.exception("Could not drop load test database %s at %s", db_name, mongo_url)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--rate", type=float, default=10, help="scenario arrivals per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of arrivals")
+    parser.add_argument("--mix", default="browse=6,client_crud=2,order_flow=1,broker_flow=1,login=0.5")
+    parser.add_argument("--max-concurrency", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users", type=int, default=20, help="virtual users the scenarios are spread over")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--launch", action="store_true", help="start the API (and mongod with --mongod) locally")
+    parser.add_argument("--mongod", help="mongod binary to launch on a scratch dbpath")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=f"crm_load_{uuid.uuid4().hex[:8]}")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    processes, paths, mongo_url = [], [], None
+    base_url = args.base_url
+    if args.launch:
+        base_url, processes, paths, mongo_url = launch(args)
+    try:
+        report = asyncio.run(run_load(
+            base_url, args.rate, args.duration, parse_mix(args.mix), args.max_concurrency, args.seed, args.users
+        ))
+        print_report(report)
+        if args.json:
+            Path(args.json).write_text(json.dumps(report, indent=2))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=30)
+        # A launched mongod's data goes with its dbpath below
+        if mongo_url and not args.mongod:
+            drop_database(mongo_url, args.db_name)
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
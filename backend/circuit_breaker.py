@@ -0,0 +1,218 @@
+"""
+Circuit breaker with stale-response fallback
+Watches API outcomes for signs the database is degraded: 503s from the data
+layer (pool exhaustion, server selection, time budgets) and reads slower than
+slow_call_seconds. Slow writes don't count; seeding and snapshot restores are
+slow by design.
+
+States:
+- closed: requests pass through.
+- open: trips once `failure_ratio` of the last `window` requests failed
+  (with at least min_calls seen). For open_seconds requests fail fast
+  instead of each one waiting out the server selection timeout.
+- half-open: after open_seconds up to half_open_probes requests go through
+  as probes. That many successes close the circuit; any failure reopens it.
+
+Successful GETs on the stale-cacheable paths (catalog, settings, dashboard)
+are kept as their last known good response. While the circuit is open, or
+when the data layer answers 503, an authenticated request for one of those
+paths gets that copy back, marked with Age and Warning: 110 "Response is
+Stale". Anything else gets a 503 with Retry-After.
+"""
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Iterable
+
+import orjson
+
+from metrics import CIRCUIT_REJECTED, CIRCUIT_STATE, STALE_RESPONSES
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_ratio: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        open_seconds: float = 10.0,
+        half_open_probes: int = 3,
+    ):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        CIRCUIT_STATE.set(STATE_VALUES[CLOSED])
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self._opened_at + self.open_seconds - time.monotonic()))
+
+    def allow(self) -> bool:
+        """Whether a request may try the data layer; in half-open this takes a probe slot"""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        return False
+
+    def record(self, failed: bool):
+        if self.state == HALF_OPEN:
+            if failed:
+                self._transition(OPEN)
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(CLOSED)
+            return
+        if self.state == OPEN:
+            # Requests admitted before the trip finishing late
+            return
+        self._outcomes.append(failed)
+        if len(self._outcomes) >= self.min_calls and sum(self._outcomes) >= self.failure_ratio * len(self._outcomes):
+            self._transition(OPEN)
+
+    def _transition(self, state: str):
+        self.state = state
+        self._probes = self._probe_successes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state == CLOSED:
+            self._outcomes.clear()
+        CIRCUIT_STATE.set(STATE_VALUES[state])
+
+class StaleCache:
+    """Last good response per URL, least recently stored evicted first"""
+
+    def __init__(self, max_entries: int = 256, max_entry_bytes: int = 1 << 20):
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        return self._entries.get(key)
+
+    def put(self, key: str, headers: list, body: bytes):
+        if len(body) > self.max_entry_bytes:
+            return
+        self._entries[key] = (headers, body, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+# Response headers worth replaying from the cache
+STORED_HEADERS = {b"content-type", b"etag", b"cache-control"}
+
+class CircuitBreakerMiddleware:
+    """Apply the breaker to API requests.
+
+    Sits directly around the app, inside compression, so cached bodies are
+    the uncompressed JSON. authenticated(scope) decides whether a request
+    may be served a cached copy; the database can't be asked while it is down.
+    """
+
+    def __init__(
+        self,
+        app,
+        breaker: CircuitBreaker,
+        cache: StaleCache,
+        stale_paths: Iterable[str],
+        authenticated: Callable[[dict], bool],
+        slow_call_seconds: float = 2.0,
+        prefix: str = "/api/",
+    ):
+        self.app = app
+        self.breaker = breaker
+        self.cache = cache
+        self.stale_paths = tuple(stale_paths)
+        self.authenticated = authenticated
+        self.slow_call_seconds = slow_call_seconds
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        key = None
+        if scope["method"] == "GET" and scope["path"].startswith(self.stale_paths):
+            query = scope.get("query_string", b"")
+            key = scope["path"] + ("?" + query.decode("latin-1") if query else "")
+
+        if not self.breaker.allow():
+            if not await self.serve_stale(scope, key, send):
+                CIRCUIT_REJECTED.inc()
+                await self.unavailable(send)
+            return
+
+        status_code, start_message, body = 500, None, []
+
+        async def send_wrapper(message):
+            nonlocal status_code, start_message
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if key is not None and status_code in (200, 503):
+                    # Held back until the body is complete: stored if 200, swapped for a stale copy if 503
+                    start_message = message
+                    return
+            elif start_message is not None:
+                body.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                if status_code == 503 and await self.serve_stale(scope, key, send):
+                    return
+                await send(start_message)
+                message = {**message, "body": b"".join(body)}
+                if status_code == 200:
+                    headers = [(k, v) for k, v in start_message.get("headers", []) if k in STORED_HEADERS]
+                    self.cache.put(key, headers, message["body"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            slow = scope["method"] in ("GET", "HEAD") and time.perf_counter() - start > self.slow_call_seconds
+            self.breaker.record(status_code == 503 or slow)
+
+    async def serve_stale(self, scope, key, send) -> bool:
+        entry = self.cache.get(key) if key is not None else None
+        if entry is None or not self.authenticated(scope):
+            return False
+        headers, body, stored_at = entry
+        STALE_RESPONSES.labels(next(p for p in self.stale_paths if key.startswith(p))).inc()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                *headers,
+                (b"content-length", str(len(body)).encode()),
+                (b"age", str(int(time.monotonic() - stored_at)).encode()),
+                (b"warning", b'110 - "Response is Stale"'),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+        return True
+
+    async def unavailable(self, send):
+        body = orjson.dumps({"detail": "Database degraded, retry shortly"})
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.breaker.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
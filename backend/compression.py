@@ -0,0 +1,185 @@
+"""
+Response compression middleware
+Negotiates zstd / brotli / gzip from Accept-Encoding. brotli and zstd are used
+only when the optional `brotli` / `zstandard` packages are installed.
+"""
+import zlib
+from typing import Iterable, Optional
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "application/x-ndjson")
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync flush so every streamed chunk reaches the client immediately
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level: int):
+        # Brotli quality runs 0-11; mid-range keeps CPU cost close to gzip
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+def available_encoders() -> dict:
+    """Encoders in server preference order"""
+    encoders = {}
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    encoders["gzip"] = GzipEncoder
+    return encoders
+
+def negotiate_encoding(accept_encoding: str, encoders: dict) -> Optional[str]:
+    """Pick the preferred encoder the client accepts (q > 0), honouring "*" """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if token:
+            accepted[token.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for name in encoders:
+        quality = accepted.get(name, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+class CompressionMiddleware:
+    """Compress HTTP responses above a size threshold.
+
+    Responses are left alone when they are smaller than minimum_size, already
+    encoded, not a text/JSON type, or carry Cache-Control: no-transform, which
+    is how a route opts out. Streaming bodies are buffered only until the
+    threshold is reached and then compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, level: int = 6, exclude_paths: Iterable[str] = ()):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.exclude_paths = tuple(exclude_paths)
+        self.encoders = available_encoders()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = negotiate_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"), self.encoders)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingResponder(send, self.encoders[encoding], self.level, self.minimum_size)
+        await self.app(scope, receive, responder)
+
+class _CompressingResponder:
+    def __init__(self, send, encoder_class, level: int, minimum_size: int):
+        self.send = send
+        self.encoder_class = encoder_class
+        self.level = level
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.buffer = b""
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            self.passthrough = not self._eligible(message)
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            self.buffer += body
+            if len(self.buffer) < self.minimum_size:
+                if more_body:
+                    return
+                # Whole response is below the threshold: send it as is
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": self.buffer})
+                return
+            self.encoder = self.encoder_class(self.level)
+            await self._send_start()
+            body, self.buffer = self.buffer, b""
+
+        if more_body:
+            chunk = self.encoder.compress(body)
+            if chunk:
+                await self.send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            await self.send({"type": "http.response.body", "body": self.encoder.finish(body)})
+
+    def _eligible(self, message) -> bool:
+        if message["status"] < 200 or message["status"] in (204, 304):
+            return False
+        headers = {k.lower(): v for k, v in message.get("headers", [])}
+        if b"content-encoding" in headers:
+            return False
+        if b"no-transform" in headers.get(b"cache-control", b"").lower():
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def _send_start(self):
+        message = self.start_message
+        headers = [(k, v) for k, v in message.get("headers", []) if k.lower() != b"content-length"]
+        headers.append((b"content-encoding", self.encoder.name.encode("latin-1")))
+        vary = [v for k, v in headers if k.lower() == b"vary"]
+        if not any(b"accept-encoding" in v.lower() for v in vary):
+            headers.append((b"vary", b"Accept-Encoding"))
+        await self.send({**message, "headers": headers})
@@ -0,0 +1,79 @@
+"""
+Database handle
+deps.py creates the one `db` handle that server.py and the domain routers
+import at module level, before the app lifespan has connected anything. The lifespan
+connects it to Mongo or binds an embedded backend from
+repositories.open_database, and collection/command access is forwarded to
+whatever database it is bound to.
+
+Reads that can tolerate lag (analytics, exports, reports) go through
+`db.analytics`, which on Mongo is the same database with its own read
+preference, normally secondaryPreferred with a staleness bound. CRUD reads
+and all writes use `db` and stay on the primary. Embedded backends have no
+replicas, so there `db.analytics` is the database itself.
+"""
+import asyncio
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+class DatabaseHandle:
+    def __init__(self):
+        self._database = None
+        self._analytics = None
+        self._client = None
+
+    @property
+    def client(self) -> Optional[AsyncIOMotorClient]:
+        """The Motor client, or None on embedded backends"""
+        return self._client
+
+    @property
+    def analytics(self):
+        """The database for lag-tolerant reads"""
+        if self._database is None:
+            raise RuntimeError("Database is not connected; it is opened by the app lifespan")
+        return self._analytics if self._analytics is not None else self._database
+
+    def bind(self, database, client: Optional[AsyncIOMotorClient] = None, analytics=None):
+        """Point the handle at an already opened database"""
+        self._database = database
+        self._analytics = analytics
+        self._client = client
+
+    def connect(self, url: str, name: str, event_listeners=(), analytics_read_preference: str = "primary",
+                analytics_max_staleness: int = -1, **options):
+        """Create a Motor client (`options` are MongoClient keyword options) and bind its `name` database"""
+        client = AsyncIOMotorClient(url, event_listeners=list(event_listeners), **options)
+        analytics = client.get_database(
+            name, read_preference=read_preference(analytics_read_preference, analytics_max_staleness)
+        )
+        self.bind(client[name], client, analytics)
+
+    async def warm(self, connections: int):
+        """Open `connections` pooled connections now rather than on the first requests"""
+        if self._client is not None and connections > 0:
+            await asyncio.gather(*(self._client.admin.command("ping") for _ in range(connections)))
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+        self._database = self._analytics = self._client = None
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._database is None:
+            raise RuntimeError("Database is not connected; it is opened by the app lifespan")
+        return getattr(self._database, name)
+
+    def __getitem__(self, name: str):
+        if self._database is None:
+            raise RuntimeError("Database is not connected; it is opened by the app lifespan")
+        return self._database[name]
+
+def read_preference(mode: str, max_staleness: int = -1):
+    """Read preference from its URI name; max_staleness (seconds, -1 for none) is ignored for primary"""
+    mode_id = read_pref_mode_from_name(mode)
+    return make_read_preference(mode_id, None, -1 if mode == "primary" else max_staleness)
@@ -0,0 +1,166 @@
+"""
+Shared request dependencies
+The database handle, authentication, the time-budgeted route class, and the
+response and update helpers used by both server.py and the domain routers.
+They live here rather than in server.py so a router never imports the app
+module. Importing server.py under another name (backend.server, python -m)
+would otherwise load a second copy with its own, never connected, db handle.
+"""
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+import jwt
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, Response
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import TypeAdapter, create_model
+from pymongo import ReturnDocument, UpdateOne
+
+from database import DatabaseHandle
+from time_budgets import time_budget_route
+
+load_dotenv(Path(__file__).parent / '.env')
+
+# JWT Settings
+SECRET_KEY = os.environ.get('JWT_SECRET', 'soa-east-llc-crm-production-secret-key-2024-secure')
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+
+# Mongo time budget per request in ms, by route template; past it the request gets a 503.
+# None leaves a route unbounded: bulk admin jobs, and routes that start background
+# tasks (which would otherwise inherit the request's deadline)
+DEFAULT_TIME_BUDGET_MS = int(os.environ.get('DEFAULT_TIME_BUDGET_MS', 2000))
+ROUTE_TIME_BUDGETS_MS = {
+    "/api/dashboard/stats": 3000,
+    "/api/forecast/pipeline": 5000,
+    "/api/forecast/recalibrate": 10000,
+    "/api/analytics/pipeline-velocity": 5000,
+    "/api/export/clients": 10000,
+    "/api/export/orders": 10000,
+    "/api/export/deals": 10000,
+    "/api/export/products": 10000,
+    "/api/admin/slow-queries": 5000,
+    "/api/admin/index-advice": 10000,
+    "/api/seed": None,
+    "/api/roles/seed-defaults": None,
+    "/api/reset-demo": None,
+    "/api/admin/synthetic-data": None,
+    "/api/admin/snapshots": None,
+    "/api/admin/snapshots/{name}/restore": None,
+}
+BudgetedRoute = time_budget_route(ROUTE_TIME_BUDGETS_MS, DEFAULT_TIME_BUDGET_MS)
+
+# Connected by the app lifespan; handlers and the domain routers share this handle
+db = DatabaseHandle()
+security = HTTPBearer()
+
+# ============== AUTH ==============
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    try:
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        user_id = payload.get("sub")
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        return user
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+# ============== RESPONSES ==============
+
+@lru_cache(maxsize=256)
+def response_adapter(model: type, selected: Optional[tuple], many: bool) -> TypeAdapter:
+    """Validator/serializer for a response model, optionally trimmed to the selected fields"""
+    if selected:
+        model = create_model(
+            f"{model.__name__}Fields",
+            **{f: (model.model_fields[f].annotation, model.model_fields[f]) for f in selected}
+        )
+    return TypeAdapter(List[model] if many else model)
+
+def model_response(data, model: type, response: Optional[Response] = None, selected: Optional[tuple] = None) -> Response:
+    """Validate DB rows once and serialize them natively.
+
+    Returning a Response skips FastAPI's second validation/encoding pass
+    through response_model (which stays on the route for the OpenAPI schema).
+    Headers already set on the route's response (ETag) are carried over.
+    """
+    adapter = response_adapter(model, selected, isinstance(data, list))
+    return Response(
+        content=adapter.dump_json(adapter.validate_python(data)),
+        media_type="application/json",
+        headers=dict(response.headers) if response is not None else None
+    )
+
+# ============== UPDATES ==============
+
+async def bump_collection_versions(*collections: str):
+    """Advance the change counters behind collection ETags; call after every write"""
+    await db.collection_versions.bulk_write([
+        UpdateOne({"_id": name}, {"$inc": {"version": 1}}, upsert=True)
+        for name in collections
+    ])
+
+def version_filter(if_match: Optional[str], document_id: Optional[str] = None) -> dict:
+    """Turn an If-Match header into a filter on the document version.
+
+    Accepts a document ETag ("<id>:<version>") or a bare version ("3" or "\"3\"").
+    If-Match compares strongly, so weak tags (collection ETags) and tags of
+    another document match no version and the write fails with 412.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return {}
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        return {"version": -1}
+    parts = tag.strip('"').split(":")
+    try:
+        expected = int(parts[1] if len(parts) > 1 else parts[0])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+    if len(parts) > 1 and document_id is not None and parts[0] != document_id:
+        return {"version": -1}
+    # Documents written before versioning have no version field and count as 0
+    return {"version": {"$in": [0, None]}} if expected == 0 else {"version": expected}
+
+async def update_document(
+    collection,
+    query: dict,
+    update_data: dict,
+    not_found: str,
+    projection: Optional[dict] = None,
+    if_match: Optional[str] = None,
+    increments: Optional[dict] = None,
+    upsert: bool = False
+) -> dict:
+    """Apply an update and return the updated document in a single round trip.
+
+    Every update bumps the document's version. When If-Match is supplied the
+    write only applies to that version, so a concurrent edit surfaces as 412;
+    the document is only re-read to tell a conflict from a missing document.
+    """
+    expected = version_filter(if_match, query.get("id"))
+    update = {"$inc": {"version": 1, **(increments or {})}}
+    if update_data:
+        update["$set"] = update_data
+    
+    document = await collection.find_one_and_update(
+        {**query, **expected},
+        update,
+        projection={"_id": 0, **(projection or {})},
+        return_document=ReturnDocument.AFTER,
+        upsert=upsert and not expected
+    )
+    if document is None:
+        if expected and await collection.count_documents(query, limit=1):
+            raise HTTPException(status_code=412, detail="Document was modified by another request")
+        raise HTTPException(status_code=404, detail=not_found)
+    await bump_collection_versions(collection.name)
+    return document
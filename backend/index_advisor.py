@@ -0,0 +1,221 @@
+"""
+Query-shape index advisor
+Records the normalized shape (filter keys, sort, projection) of every query
+the app issues, derives the compound index each shape wants using the
+Equality-Sort-Range rule, drops suggestions an existing index already
+satisfies, and ranks the rest by how many documents they would save scanning.
+"""
+import threading
+from typing import List, NamedTuple, Optional
+
+from pymongo import monitoring
+
+from query_profiler import QueryShape, command_parts, command_shape
+from slow_queries import explain_command
+
+# Operators an index can serve as a point lookup
+EQUALITY_OPERATORS = {"$eq", "$in"}
+# Operators an index can serve as a bounded scan
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$exists", "$regex", "$all", "$elemMatch"}
+
+class IndexSuggestion(NamedTuple):
+    collection: str
+    keys: tuple  # ((field, direction), ...)
+    equality_count: int
+    branch_filter: dict  # predicates the index path must satisfy
+    indexed_filter: dict  # the subset of branch_filter on index fields
+
+def predicate_kind(value) -> Optional[str]:
+    """"equality", "range" or None (not indexable) for one field's predicate"""
+    if not isinstance(value, dict) or not any(key.startswith("$") for key in value):
+        return "equality"
+    operators = set(value) - {"$options"}
+    if operators <= EQUALITY_OPERATORS:
+        return "equality"
+    if operators & (RANGE_OPERATORS | EQUALITY_OPERATORS) == operators:
+        return "range"
+    return None
+
+def filter_branches(query: dict) -> List[dict]:
+    """Split a filter into the conjunctions an index must serve; each $or clause is its own branch"""
+    base, branches = {}, [{}]
+    for field, value in query.items():
+        if field == "$and":
+            for clause in value:
+                sub = filter_branches(clause)
+                branches = [{**branch, **s} for branch in branches for s in sub]
+        elif field == "$or":
+            branches = [{**branch, **s} for branch in branches for clause in value for s in filter_branches(clause)]
+        elif not field.startswith("$"):
+            base[field] = value
+    return [{**branch, **base} for branch in branches]
+
+def suggest_indexes(collection: str, query: dict, sort: Optional[dict]) -> List[IndexSuggestion]:
+    """Equality fields first, then the sort, then range fields (ESR)"""
+    suggestions = []
+    for branch in filter_branches(query or {}):
+        equality, ranges = [], []
+        for field, value in branch.items():
+            kind = predicate_kind(value)
+            if kind == "equality":
+                equality.append(field)
+            elif kind == "range":
+                ranges.append(field)
+        keys = [(field, 1) for field in equality]
+        keys += [(field, direction) for field, direction in (sort or {}).items() if field not in equality]
+        keys += [(field, 1) for field in ranges if field not in dict(keys)]
+        if not keys or keys[0][0] == "_id":
+            continue
+        indexed = {field: branch[field] for field, _ in keys if field in branch}
+        suggestions.append(IndexSuggestion(collection, tuple(keys), len(equality), branch, indexed))
+    return suggestions
+
+def index_satisfies(index_keys: list, suggestion: IndexSuggestion) -> bool:
+    """Whether an existing index serves the suggestion as well as the suggestion would.
+
+    Equality fields may appear in any order; the remaining fields must follow
+    in order, with sort directions all matching or all reversed.
+    """
+    wanted = list(suggestion.keys)
+    if len(index_keys) < len(wanted):
+        return False
+    n = suggestion.equality_count
+    if {field for field, _ in index_keys[:n]} != {field for field, _ in wanted[:n]}:
+        return False
+    tail, existing = wanted[n:], index_keys[n:len(wanted)]
+    if [field for field, _ in tail] != [field for field, _ in existing]:
+        return False
+    same = all(a == b for (_, a), (_, b) in zip(tail, existing))
+    reversed_ = all(a == -b for (_, a), (_, b) in zip(tail, existing))
+    return same or reversed_
+
+def is_prefix(shorter: tuple, longer: tuple) -> bool:
+    return len(shorter) < len(longer) and longer[:len(shorter)] == shorter
+
+class IndexAdvisor(monitoring.CommandListener):
+    """Counts query shapes seen on the driver and keeps one concrete example of each.
+
+    At most max_shapes distinct shapes are tracked so that unbounded literal
+    values (e.g. an unrecognised operator) cannot grow memory without limit.
+    """
+
+    def __init__(self, max_shapes: int = 1000):
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._shapes = {}  # key -> [QueryShape, count, example filter, example command, database]
+
+    def started(self, event):
+        shape = command_shape(event.command_name, event.command)
+        if shape is None or shape.command == "insert":
+            return
+        with self._lock:
+            entry = self._shapes.get(shape.key)
+            if entry is None:
+                if len(self._shapes) >= self.max_shapes:
+                    return
+                entry = self._shapes[shape.key] = [shape, 0, None, None, event.database_name]
+            entry[1] += 1
+            entry[2], entry[3] = command_parts(event.command_name, event.command)[0], event.command
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def shapes(self) -> List[tuple]:
+        """(shape, count, example filter, example command, database), most frequent first"""
+        with self._lock:
+            entries = [tuple(entry) for entry in self._shapes.values()]
+        return sorted(entries, key=lambda entry: entry[1], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+
+    async def report(self, db, limit: int = 20, explain: bool = True) -> List[dict]:
+        """Ranked suggestions for missing indexes, estimated against the live data.
+
+        current_ratio is docsExamined / nReturned from explain on a recorded
+        example (the collection size per match when explain is unavailable);
+        estimated_ratio is the documents matching the indexed fields per
+        document matching the whole filter.
+        """
+        candidates = {}
+        for shape, count, query, command, database in self.shapes():
+            for suggestion in suggest_indexes(shape.collection, query, shape.sort):
+                candidate = candidates.setdefault((suggestion.collection, suggestion.keys), {
+                    "suggestion": suggestion, "executions": 0, "shapes": [], "example": (command, database, shape),
+                })
+                candidate["executions"] += count
+                candidate["shapes"].append(shape.key)
+
+        # An index on (a, b) also serves queries wanting (a)
+        for key, candidate in list(candidates.items()):
+            longer = [other for other in candidates if other[0] == key[0] and is_prefix(key[1], other[1])]
+            if longer:
+                target = candidates[max(longer, key=lambda other: candidates[other]["executions"])]
+                target["executions"] += candidate["executions"]
+                target["shapes"] += candidate["shapes"]
+                del candidates[key]
+
+        existing = {}
+        for collection in {key[0] for key in candidates}:
+            info = await db[collection].index_information()
+            existing[collection] = [list(index["key"]) for index in info.values()]
+
+        missing = [
+            candidate for candidate in candidates.values()
+            if not any(index_satisfies(keys, candidate["suggestion"]) for keys in existing[candidate["suggestion"].collection])
+        ]
+        missing.sort(key=lambda candidate: candidate["executions"], reverse=True)
+
+        report = []
+        for candidate in missing[:limit]:
+            report.append(await self._estimate(db, candidate, explain))
+        report.sort(key=lambda row: row["score"], reverse=True)
+        return report
+
+    async def _estimate(self, db, candidate: dict, explain: bool) -> dict:
+        suggestion: IndexSuggestion = candidate["suggestion"]
+        command, database, shape = candidate["example"]
+        collection = db[suggestion.collection]
+
+        matching = await collection.count_documents(suggestion.branch_filter)
+        indexed = await collection.count_documents(suggestion.indexed_filter) if suggestion.indexed_filter else matching
+        docs_examined, returned, plan = None, None, None
+        if explain:
+            try:
+                plan = await explain_command(db.client, database, command)
+                docs_examined, returned = plan["docs_examined"], plan["n_returned"]
+            except Exception:
+                plan = None
+        if docs_examined is None:
+            docs_examined, returned = await collection.estimated_document_count(), matching
+
+        current_ratio = docs_examined / max(returned, 1)
+        estimated_ratio = indexed / max(matching, 1)
+        estimated_docs_examined = estimated_ratio * returned
+        return {
+            "collection": suggestion.collection,
+            "keys": [[field, direction] for field, direction in suggestion.keys],
+            "executions": candidate["executions"],
+            "shapes": candidate["shapes"],
+            "current_plan": plan["stages"] if plan else None,
+            "current_ratio": round(current_ratio, 2),
+            "estimated_ratio": round(estimated_ratio, 2),
+            "covered": is_covered(shape, suggestion),
+            # documents no longer read across all recorded executions
+            "score": round(candidate["executions"] * max(docs_examined - estimated_docs_examined, 0), 2),
+            "create_index": "db.%s.createIndex({%s})" % (
+                suggestion.collection, ", ".join('"%s": %d' % key for key in suggestion.keys)
+            ),
+        }
+
+def is_covered(shape: QueryShape, suggestion: IndexSuggestion) -> bool:
+    """Inclusion projection answerable from the index alone (no FETCH)"""
+    if not shape.projection:
+        return False
+    included = {field for field, value in shape.projection.items() if value and field != "_id"}
+    excluded_id = not shape.projection.get("_id", 1)
+    return bool(included) and excluded_id and included <= {field for field, _ in suggestion.keys}
@@ -0,0 +1,94 @@
+"""
+MongoDB indexes
+One entry per query the routes issue: equality fields first, then the sort.
+tests/test_query_plans.py asserts every route's queries are served by these,
+and /api/admin/index-advice reports shapes still missing one.
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("role_id", ASCENDING)]),
+    ],
+    "clients": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "client_notes": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("client_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING)]),
+        IndexModel([("category", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("client_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "deals": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("position", ASCENDING), ("date_entered", DESCENDING)]),
+        IndexModel([("stage", ASCENDING), ("position", ASCENDING), ("date_entered", DESCENDING)]),
+        IndexModel([("client_name", ASCENDING), ("date_entered", DESCENDING)]),
+        IndexModel([("date_entered", DESCENDING)]),
+    ],
+    "deal_stage_history": [
+        IndexModel([("deal_id", ASCENDING), ("changed_at", ASCENDING)]),
+        IndexModel([("to_stage", ASCENDING), ("from_stage", ASCENDING)]),
+    ],
+    "pipeline_stats": [
+        IndexModel([("day", ASCENDING), ("stage", ASCENDING)], unique=True),
+    ],
+    "roles": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "brokers": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "messages": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("sender_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("recipient_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "channels": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("created_at", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "integrations": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "settings": [
+        IndexModel([("type", ASCENDING)]),
+    ],
+    # Cross-worker rate limit counters, dropped once their bucket would have refilled
+    "rate_limit_usage": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+async def ensure_indexes(db):
+    """Create any missing indexes; existing ones are left untouched.
+
+    A collection whose data violates an index (e.g. duplicate ids left by an
+    old import) is logged and skipped so the API still starts.
+    """
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as exc:
+            logger.error("Could not create indexes on %s: %s", collection, exc)
@@ -0,0 +1,167 @@
+"""
+Adaptive concurrency limiting and load shedding
+Each pool of routes gets an AIMD limit on requests in flight. While requests
+finish within the pool's latency target, the limit grows by about one per
+limit's worth of completions. A request slower than the target, or one
+answered 503 (time budget or pool exhaustion downstream), cuts the limit by
+`backoff`, at most once per target interval. Requests over the limit wait in
+a FIFO queue for up to queue_timeout. Past that, or when the queue is full,
+they are shed with a 503 and Retry-After. Latency stays near the target
+instead of every request piling onto the Motor pool.
+
+Report and export routes get their own, smaller pool so a burst of them
+cannot take the slots interactive CRUD needs.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Iterable, Optional
+
+import orjson
+
+from metrics import CONCURRENCY_LIMIT, CONCURRENCY_IN_FLIGHT, CONCURRENCY_QUEUED, REQUESTS_SHED
+
+class AIMDLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 1000,
+        latency_target: float = 0.5,
+        backoff: float = 0.9,
+        queue_size: int = 100,
+        queue_timeout: float = 1.0,
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = deque()
+        self._last_decrease = 0.0
+        CONCURRENCY_LIMIT.labels(name).set(self.limit)
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.queue_timeout))
+
+    async def acquire(self) -> Optional[str]:
+        """Take a slot, waiting in the queue if needed; returns why the request was shed, or None"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self._admit()
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        CONCURRENCY_QUEUED.labels(self.name).inc()
+        admitted = False
+        try:
+            # release() admits the waiter (counting it in flight) before resolving it
+            await asyncio.wait_for(waiter, self.queue_timeout)
+            admitted = True
+            return None
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        finally:
+            CONCURRENCY_QUEUED.labels(self.name).dec()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif not admitted and waiter.done() and not waiter.cancelled():
+                # Admitted by release() but cancelled before it could run: hand the slot on
+                self._leave()
+                self._wake()
+
+    def release(self, latency: float, overloaded: bool = False):
+        self._leave()
+        now = time.monotonic()
+        if overloaded or latency > self.latency_target:
+            if now - self._last_decrease >= self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight * 2 >= self.limit:
+            # Only grow while the limit is actually in use
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+        self._wake()
+
+    def _wake(self):
+        """Admit queued requests while there are free slots"""
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._admit()
+                waiter.set_result(None)
+
+    def _admit(self):
+        self.in_flight += 1
+        CONCURRENCY_IN_FLIGHT.labels(self.name).inc()
+
+    def _leave(self):
+        self.in_flight -= 1
+        CONCURRENCY_IN_FLIGHT.labels(self.name).dec()
+
+class LoadSheddingMiddleware:
+    """Run each request under the limiter of the first pool whose path prefix it matches.
+
+    `pools` is a list of (path prefixes, limiter); requests matching none use
+    `default`. Paths in exclude_paths (probes, metrics) are never limited.
+    """
+
+    def __init__(self, app, default: AIMDLimiter, pools: Iterable[tuple] = (), exclude_paths=("/health", "/metrics")):
+        self.app = app
+        self.default = default
+        self.pools = [(tuple(prefixes), limiter) for prefixes, limiter in pools]
+        self.exclude_paths = tuple(exclude_paths)
+
+    def limiter_for(self, path: str) -> AIMDLimiter:
+        for prefixes, limiter in self.pools:
+            if path.startswith(prefixes):
+                return limiter
+        return self.default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiter_for(scope["path"])
+        reason = await limiter.acquire()
+        if reason is not None:
+            REQUESTS_SHED.labels(limiter.name, reason).inc()
+            await self.shed(limiter, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            limiter.release(time.perf_counter() - start, overloaded=status_code == 503)
+
+    @staticmethod
+    async def shed(limiter: AIMDLimiter, send):
+        body = orjson.dumps({"detail": "Server overloaded, retry shortly", "pool": limiter.name})
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(limiter.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,217 @@
+"""
+Prometheus metrics
+Request latency by route template, in-flight requests, time budget overruns,
+concurrency limits, shed and rate-limited requests, circuit breaker state and
+stale responses, event-loop lag, startup phase timings, MongoDB command timings
+and connection pool usage (via pymongo event listeners), served in the
+Prometheus text format.
+"""
+import asyncio
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+from starlette.responses import Response
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served", ["method"])
+REQUEST_BUDGET_EXCEEDED = Counter(
+    "request_budget_exceeded_total",
+    "Requests answered 503 because their Mongo time budget ran out",
+    ["route"],
+)
+
+CONCURRENCY_LIMIT = Gauge("concurrency_limit", "Current adaptive concurrency limit per route pool", ["pool"])
+CONCURRENCY_IN_FLIGHT = Gauge("concurrency_in_flight", "Requests holding a concurrency slot per route pool", ["pool"])
+CONCURRENCY_QUEUED = Gauge("concurrency_queued", "Requests waiting for a concurrency slot per route pool", ["pool"])
+REQUESTS_SHED = Counter(
+    "requests_shed_total",
+    "Requests answered 503 by the load shedder, by route pool and reason (queue_full, queue_timeout)",
+    ["pool", "reason"],
+)
+RATE_LIMITED = Counter("requests_rate_limited_total", "Requests answered 429 by the per-user rate limiter", ["limit_class"])
+CIRCUIT_STATE = Gauge("db_circuit_state", "Database circuit breaker state (0 closed, 1 half-open, 2 open)")
+CIRCUIT_REJECTED = Counter("db_circuit_rejected_total", "Requests answered 503 without trying the database while the circuit was open")
+STALE_RESPONSES = Counter(
+    "stale_responses_total",
+    "Last known good responses served while the database was degraded, by cached path prefix",
+    ["prefix"],
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between when the event loop should have woken a sleeper and when it did",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+STARTUP_PHASE_DURATION = Gauge(
+    "app_startup_phase_seconds",
+    "Time this worker spent in each lifespan startup phase",
+    ["phase"],
+)
+
+MONGO_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command duration by collection and command",
+    ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongodb_command_failures_total",
+    "Failed MongoDB commands by collection and command",
+    ["collection", "command"],
+)
+
+MONGO_POOL_CONNECTIONS = Gauge("mongodb_pool_connections", "Open pooled connections per server", ["address"])
+MONGO_POOL_CHECKED_OUT = Gauge("mongodb_pool_checked_out", "Pooled connections currently checked out per server", ["address"])
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongodb_pool_checkout_failures_total",
+    "Failed connection checkouts per server; reason=timeout means waitQueueTimeoutMS ran out",
+    ["address", "reason"],
+)
+
+# Commands whose first field is not a collection name
+_NON_COLLECTION_COMMANDS = {"getMore", "killCursors", "endSessions", "ping", "hello", "isMaster", "ismaster", "buildInfo"}
+
+def command_collection(command_name: str, command) -> str:
+    """Collection a command targets, or "" for admin/cursor commands"""
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    if command_name in _NON_COLLECTION_COMMANDS:
+        return ""
+    target = command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command the driver sends.
+
+    Register it through AsyncIOMotorClient(event_listeners=[...]); started
+    events are matched to their result by (connection, request_id).
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        self._pending[(event.connection_id, event.request_id)] = command_collection(event.command_name, event.command)
+
+    def succeeded(self, event):
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(collection, event.command_name).inc()
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Pool size and checkouts per server, for sizing maxPoolSize/waitQueueTimeoutMS"""
+
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event)).inc()
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.labels(self._address(event)).dec()
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(self._address(event)).inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(self._address(event)).dec()
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.labels(self._address(event), event.reason).inc()
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+class MetricsMiddleware:
+    """Observe latency and in-flight count for every HTTP request.
+
+    The route label is the matched path template (e.g. /api/clients/{client_id})
+    so cardinality stays bounded; unmatched paths are grouped together.
+    """
+
+    def __init__(self, app, exclude_paths=("/metrics",)):
+        self.app = app
+        self.exclude_paths = tuple(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                method, getattr(route, "path", "unmatched"), str(status_code)
+            ).observe(time.perf_counter() - start)
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Sample how late the loop wakes a sleeping task; long callbacks show up as lag"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - start - interval, 0))
+
+class StartupTimer:
+    """Times consecutive startup phases into STARTUP_PHASE_DURATION"""
+
+    def __init__(self):
+        self._last = time.perf_counter()
+        self.timings = {}
+
+    def mark(self, phase: str):
+        """End the current phase, started at the previous mark (or at creation)"""
+        now = time.perf_counter()
+        self.timings[phase] = round(now - self._last, 4)
+        STARTUP_PHASE_DURATION.labels(phase).set(now - self._last)
+        self._last = now
+
+    def finish(self) -> dict:
+        self.mark("tasks")
+        return self.timings
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,165 @@
+"""
+Per-request MongoDB query accounting
+A pymongo CommandListener attributes every command to the HTTP request that
+issued it through a contextvar (Motor copies the caller's context into its
+executor threads). The middleware reports the totals in a Server-Timing header
+and warns when one query shape repeats often enough to look like an N+1 loop.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+def value_shape(value):
+    """Replace literal values in a filter with 1, keeping field and operator names"""
+    if isinstance(value, dict):
+        return {key: value_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, dict) for item in value):
+        return [value_shape(item) for item in value]
+    return 1
+
+class QueryShape(NamedTuple):
+    command: str
+    collection: str
+    filter: Optional[dict]
+    sort: Optional[dict]
+    projection: Optional[dict]
+
+    @property
+    def key(self) -> str:
+        parts = [self.command, self.collection]
+        if self.filter is not None:
+            parts.append(json.dumps(self.filter, sort_keys=True))
+        if self.sort:
+            parts.append("sort=" + json.dumps(self.sort))
+        if self.projection:
+            parts.append("projection=" + ",".join(self.projection))
+        return " ".join(parts)
+
+def command_parts(command_name: str, command) -> Optional[tuple]:
+    """(filter, sort, projection) of a driver command with literal values, or None for non-query commands"""
+    filter_, sort, projection = None, None, None
+    if command_name == "find":
+        filter_, sort, projection = command.get("filter", {}), command.get("sort"), command.get("projection")
+    elif command_name == "findAndModify":
+        filter_, sort, projection = command.get("query", {}), command.get("sort"), command.get("fields")
+    elif command_name in ("count", "distinct"):
+        filter_ = command.get("query", {})
+    elif command_name == "update":
+        filter_ = (command.get("updates") or [{}])[0].get("q", {})
+    elif command_name == "delete":
+        filter_ = (command.get("deletes") or [{}])[0].get("q", {})
+    elif command_name == "aggregate":
+        for stage in command.get("pipeline", []):
+            if "$match" in stage and filter_ is None:
+                filter_ = stage["$match"]
+            elif "$sort" in stage and sort is None:
+                sort = stage["$sort"]
+        filter_ = filter_ if filter_ is not None else {}
+    elif command_name != "insert":
+        return None
+    return filter_, sort, projection
+
+def command_shape(command_name: str, command) -> Optional[QueryShape]:
+    """Normalize a driver command to its query shape, or None for non-query commands"""
+    parts = command_parts(command_name, command)
+    collection = command.get(command_name)
+    if parts is None or not isinstance(collection, str):
+        return None
+    filter_, sort, projection = parts
+    return QueryShape(
+        command=command_name,
+        collection=collection,
+        filter=value_shape(filter_) if filter_ is not None else None,
+        sort=dict(sort) if sort else None,
+        projection=dict(projection) if projection else None,
+    )
+
+class RequestQueries:
+    """Commands issued while serving one request.
+
+    Events arrive on the driver's executor threads, several at once when a
+    request runs queries concurrently, so updates take a lock.
+    """
+
+    def __init__(self, method: str = "", path: str = ""):
+        self.method = method
+        self.path = path
+        self.count = 0
+        self.duration_micros = 0
+        self.shapes = Counter()
+        self._lock = threading.Lock()
+
+    def record_started(self, shape: Optional[QueryShape]):
+        with self._lock:
+            self.count += 1
+            if shape is not None:
+                self.shapes[shape.key] += 1
+
+    def record_finished(self, duration_micros: int):
+        with self._lock:
+            self.duration_micros += duration_micros
+
+    def repeated(self, threshold: int):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+current_request_queries: ContextVar[Optional[RequestQueries]] = ContextVar("current_request_queries", default=None)
+
+class QueryAccountingListener(monitoring.CommandListener):
+    """Counts commands against the request in the current context; no-op outside requests"""
+
+    def started(self, event):
+        queries = current_request_queries.get()
+        if queries is not None:
+            queries.record_started(command_shape(event.command_name, event.command))
+
+    def succeeded(self, event):
+        queries = current_request_queries.get()
+        if queries is not None:
+            queries.record_finished(event.duration_micros)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+class QueryAccountingMiddleware:
+    """Add `Server-Timing: db;dur=..;desc="N queries"` and flag likely N+1 loops.
+
+    A warning is logged when a single query shape runs more than
+    n_plus_one_threshold times within one request.
+    """
+
+    def __init__(self, app, n_plus_one_threshold: int = 10):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(scope["method"], scope["path"])
+        token = current_request_queries.set(queries)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                timing = 'db;dur=%.1f;desc="%d queries", app;dur=%.1f' % (
+                    queries.duration_micros / 1000, queries.count, (time.perf_counter() - start) * 1000
+                )
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_queries.reset(token)
+            route = getattr(scope.get("route"), "path", scope["path"])
+            for shape, count in queries.repeated(self.n_plus_one_threshold):
+                logger.warning("Possible N+1 query in %s %s: %d x %s", scope["method"], route, count, shape)
@@ -0,0 +1,177 @@
+"""
+Per-user rate limiting
+Token buckets per (route class, user), keyed on the JWT subject. Requests
+without a valid token, such as logins, are keyed on the client address.
+Buckets live in the worker's memory, so a check costs a dict lookup and a
+little arithmetic. Responses carry RateLimit-Limit / RateLimit-Remaining /
+RateLimit-Reset, and a refused request gets a 429 with Retry-After.
+
+With several uvicorn workers each holds its own buckets. RateLimiter.start(db)
+syncs them through Mongo so a user's total across workers stays near the
+limit. Every sync interval a worker adds the tokens it handed out to a shared
+per-bucket counter. The same read returns what the other workers took, which
+is debited from its local bucket. Enforcement is therefore approximate
+within one sync interval, and each worker still allows its first burst.
+Counters expire (TTL index) once a bucket has been idle long enough to refill.
+"""
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, NamedTuple, Optional
+
+import orjson
+from pymongo import UpdateOne
+
+from metrics import RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+class RateLimit(NamedTuple):
+    rate: float  # tokens refilled per second
+    burst: int   # bucket size
+
+class Bucket:
+    __slots__ = ("tokens", "stamp", "unsynced", "pushed", "seen")
+
+    def __init__(self, tokens: float, stamp: float):
+        self.tokens = tokens
+        self.stamp = stamp
+        self.unsynced = 0   # tokens taken here and not yet written to Mongo
+        self.pushed = 0     # tokens written since the shared total was last read
+        self.seen = None    # shared total at the last read
+
+class RateLimiter:
+    def __init__(self, limits: dict, max_buckets: int = 100000, collection_name: str = "rate_limit_usage"):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.collection_name = collection_name
+        self._buckets = {}
+
+    def take(self, limit_class: str, key: str) -> tuple:
+        """Take a token; returns (allowed, remaining, seconds until full, seconds until the next token)"""
+        limit = self.limits[limit_class]
+        now = time.monotonic()
+        bucket = self._buckets.get((limit_class, key))
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune(now)
+            bucket = self._buckets[(limit_class, key)] = Bucket(limit.burst, now)
+        else:
+            bucket.tokens = min(limit.burst, bucket.tokens + (now - bucket.stamp) * limit.rate)
+            bucket.stamp = now
+        allowed = bucket.tokens >= 1
+        if allowed:
+            bucket.tokens -= 1
+            bucket.unsynced += 1
+        return (
+            allowed,
+            max(0, int(bucket.tokens)),
+            (limit.burst - bucket.tokens) / limit.rate,
+            max(0.0, 1 - bucket.tokens) / limit.rate,
+        )
+
+    def _prune(self, now: float):
+        """Forget buckets that have refilled; a full bucket is the same as a missing one"""
+        for (limit_class, key), bucket in list(self._buckets.items()):
+            limit = self.limits[limit_class]
+            if not bucket.unsynced and bucket.tokens + (now - bucket.stamp) * limit.rate >= limit.burst:
+                del self._buckets[(limit_class, key)]
+
+    async def start(self, db, interval: float) -> asyncio.Task:
+        """Sync buckets with the other workers through db every `interval` seconds"""
+        return asyncio.create_task(self._sync_loop(db, interval))
+
+    async def _sync_loop(self, db, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync(db[self.collection_name])
+            except Exception:
+                logger.exception("Rate limit sync failed")
+
+    async def sync(self, collection):
+        now = time.monotonic()
+        active = {
+            k: b for k, b in self._buckets.items()
+            if b.unsynced or b.tokens < self.limits[k[0]].burst
+        }
+        if not active:
+            return
+        expires = datetime.now(timezone.utc)
+        pushed, writes = [], []
+        for (limit_class, key), bucket in active.items():
+            if bucket.unsynced:
+                limit = self.limits[limit_class]
+                pushed.append((bucket, bucket.unsynced))
+                writes.append(UpdateOne(
+                    {"_id": f"{limit_class}:{key}"},
+                    {"$inc": {"taken": bucket.unsynced},
+                     "$max": {"expires_at": expires + timedelta(seconds=2 * limit.burst / limit.rate)}},
+                    upsert=True
+                ))
+        if writes:
+            await collection.bulk_write(writes, ordered=False)
+            # Requests served during the write stay unsynced for the next round
+            for bucket, count in pushed:
+                bucket.unsynced -= count
+                bucket.pushed += count
+        ids = {f"{limit_class}:{key}": bucket for (limit_class, key), bucket in active.items()}
+        totals = await collection.find({"_id": {"$in": list(ids)}}).to_list(None)
+        for doc in totals:
+            bucket = ids[doc["_id"]]
+            if bucket.seen is not None and doc["taken"] >= bucket.seen + bucket.pushed:
+                bucket.tokens -= doc["taken"] - bucket.seen - bucket.pushed
+            # First sight, or the counter expired and restarted: just take it as the baseline
+            bucket.seen = doc["taken"]
+            bucket.pushed = 0
+        logger.debug("Synced %d rate limit buckets in %.1fms", len(active), (time.monotonic() - now) * 1000)
+
+class RateLimitMiddleware:
+    """Apply the limiter per request.
+
+    classify(method, path) names the route's limit class, or None to skip
+    limiting; identify(scope) names the caller.
+    """
+
+    def __init__(self, app, limiter: RateLimiter, classify: Callable[[str, str], Optional[str]], identify: Callable[[dict], str]):
+        self.app = app
+        self.limiter = limiter
+        self.classify = classify
+        self.identify = identify
+
+    async def __call__(self, scope, receive, send):
+        limit_class = self.classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if limit_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        allowed, remaining, reset, retry_after = self.limiter.take(limit_class, self.identify(scope))
+        headers = [
+            (b"ratelimit-limit", str(self.limiter.limits[limit_class].burst).encode()),
+            (b"ratelimit-remaining", str(remaining).encode()),
+            (b"ratelimit-reset", str(math.ceil(reset)).encode()),
+        ]
+        if not allowed:
+            RATE_LIMITED.labels(limit_class).inc()
+            body = orjson.dumps({"detail": "Rate limit exceeded", "limit_class": limit_class})
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    *headers,
+                    (b"retry-after", str(math.ceil(retry_after)).encode()),
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), *headers]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,881 @@
+"""
+Repository layer
+Handlers talk to one repository per collection (db.clients, db.orders, ...)
+through the subset of the Motor collection API the app uses, described by
+the Repository protocol below. AsyncIOMotorCollection satisfies it as is;
+MemoryRepository implements it over plain dicts so the Python layer can be
+benchmarked and tested without a MongoDB server.
+
+Select the backend with DB_BACKEND (default "mongo"):
+    DB_BACKEND=memory uvicorn server:app
+    DB_BACKEND=sqlite DB_PATH=crm.sqlite3 uvicorn server:app  (see sqlite_repository.py)
+
+The in-memory backend supports the query operators, projections, sorts,
+update operators and aggregation stages the app issues, secondary lookups on
+the first field of every created index, and unique indexes.
+"""
+import re
+from contextlib import nullcontext
+from datetime import datetime
+from functools import lru_cache
+from itertools import count, islice
+from operator import itemgetter
+from typing import Any, Iterable, List, Optional, Protocol
+
+import bson
+from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo import DeleteMany, DeleteOne, IndexModel, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+class Cursor(Protocol):
+    def sort(self, key_or_list, direction=None) -> "Cursor": ...
+    def skip(self, skip: int) -> "Cursor": ...
+    def limit(self, limit: int) -> "Cursor": ...
+    async def to_list(self, length: Optional[int]) -> List[dict]: ...
+    def __aiter__(self): ...
+
+class Repository(Protocol):
+    """Collection operations the app relies on"""
+    name: str
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> Cursor: ...
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> Optional[dict]: ...
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Optional[dict] = None, **kwargs) -> Optional[dict]: ...
+    async def count_documents(self, filter: dict, **kwargs) -> int: ...
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult: ...
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True, **kwargs) -> InsertManyResult: ...
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult: ...
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult: ...
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult: ...
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult: ...
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult: ...
+    def aggregate(self, pipeline: list, **kwargs) -> Cursor: ...
+    async def create_indexes(self, indexes: list, **kwargs) -> List[str]: ...
+    async def index_information(self) -> dict: ...
+    async def drop(self) -> None: ...
+    async def rename(self, new_name: str, **kwargs) -> Any: ...
+
+def open_database(backend: str, name: str, path: Optional[str] = None):
+    """A database of repositories for a non-Mongo backend.
+
+    Mongo itself is opened by database.DatabaseHandle.connect, with the command listeners.
+    """
+    if backend == "memory":
+        return MemoryDatabase(name)
+    if backend == "sqlite":
+        from sqlite_repository import SQLiteDatabase, default_path
+        return SQLiteDatabase(path or default_path(name), name)
+    raise ValueError(f"Unknown DB_BACKEND {backend!r}")
+
+# ============== DOCUMENT HELPERS ==============
+
+def clone(value):
+    """Copy a JSON-like document; much cheaper than copy.deepcopy"""
+    if isinstance(value, dict):
+        return {k: clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone(v) for v in value]
+    return value
+
+def freeze(value):
+    """Hashable form of a value, for group keys, unique indexes and $addToSet"""
+    if isinstance(value, dict):
+        return tuple((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return ("__list__", tuple(freeze(v) for v in value))
+    return value
+
+def sort_value(value):
+    """Sort key following BSON comparison order across types"""
+    if value is None:
+        return (1, 0)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, tuple((k, sort_value(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return (5, tuple(sort_value(v) for v in value))
+    if isinstance(value, ObjectId):
+        return (7, value.binary)
+    if isinstance(value, datetime):
+        return (9, value.timestamp())
+    return (10, str(value))
+
+def resolve(document, path: str) -> list:
+    """Values at a dotted path, fanning out over arrays like Mongo does; [] when missing"""
+    values = [document]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit():
+                    if int(part) < len(value):
+                        found.append(value[int(part)])
+                else:
+                    found.extend(item[part] for item in value if isinstance(item, dict) and part in item)
+        values = found
+    return values
+
+def get_value(document, path: str):
+    values = resolve(document, path)
+    return values[0] if values else None
+
+def parent_of(document: dict, path: str, create: bool):
+    """(container, key) for the last component of a dotted path"""
+    *parents, key = path.split(".")
+    for part in parents:
+        child = document.get(part)
+        if not isinstance(child, dict):
+            if not create:
+                return None, key
+            child = document[part] = {}
+        document = child
+    return document, key
+
+# ============== QUERY MATCHING ==============
+
+def candidates(values: list) -> list:
+    """Values plus the elements of any array values, which equality matches against"""
+    expanded = list(values)
+    for value in values:
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+def same(a, b) -> bool:
+    """Equality that, like BSON, tells booleans from numbers"""
+    return a == b and isinstance(a, bool) == isinstance(b, bool)
+
+def equals(values: list, target) -> bool:
+    if isinstance(target, (re.Pattern, bson.Regex)):
+        return match_regex(values, target, None)
+    if not values:
+        return target is None
+    return any(same(value, target) for value in candidates(values))
+
+def compare(values: list, target, test) -> bool:
+    rank = sort_value(target)[0]
+    return any(sort_value(value)[0] == rank and test(sort_value(value), sort_value(target)) for value in candidates(values))
+
+@lru_cache(maxsize=256)
+def compile_regex(pattern: str, options: str) -> re.Pattern:
+    flags = 0
+    for option, flag in (("i", re.IGNORECASE), ("m", re.MULTILINE), ("s", re.DOTALL), ("x", re.VERBOSE)):
+        if option in options:
+            flags |= flag
+    return re.compile(pattern, flags)
+
+def match_regex(values: list, pattern, options: Optional[str]) -> bool:
+    if isinstance(pattern, bson.Regex):
+        pattern = pattern.try_compile()
+    if not isinstance(pattern, re.Pattern):
+        pattern = compile_regex(pattern, options or "")
+    return any(isinstance(value, str) and pattern.search(value) for value in candidates(values))
+
+def match_operators(values: list, condition: dict) -> bool:
+    for operator, argument in condition.items():
+        if operator == "$eq":
+            ok = equals(values, argument)
+        elif operator == "$ne":
+            ok = not equals(values, argument)
+        elif operator == "$in":
+            ok = any(equals(values, target) for target in argument)
+        elif operator == "$nin":
+            ok = not any(equals(values, target) for target in argument)
+        elif operator == "$gt":
+            ok = compare(values, argument, lambda a, b: a > b)
+        elif operator == "$gte":
+            ok = compare(values, argument, lambda a, b: a >= b)
+        elif operator == "$lt":
+            ok = compare(values, argument, lambda a, b: a < b)
+        elif operator == "$lte":
+            ok = compare(values, argument, lambda a, b: a <= b)
+        elif operator == "$exists":
+            ok = bool(values) == bool(argument)
+        elif operator == "$regex":
+            ok = match_regex(values, argument, condition.get("$options"))
+        elif operator == "$options":
+            continue
+        elif operator == "$all":
+            ok = all(equals(values, target) for target in argument)
+        elif operator == "$size":
+            ok = any(isinstance(value, list) and len(value) == argument for value in values)
+        elif operator == "$elemMatch":
+            ok = any(
+                match_element(element, argument)
+                for value in values if isinstance(value, list) for element in value
+            )
+        elif operator == "$not":
+            ok = not match_operators(values, argument) if isinstance(argument, dict) else not match_regex(values, argument, None)
+        else:
+            raise OperationFailure(f"unknown operator: {operator}")
+        if not ok:
+            return False
+    return True
+
+def match_element(element, condition: dict) -> bool:
+    if is_operator_dict(condition):
+        return match_operators([element], condition)
+    return isinstance(element, dict) and matches(element, condition)
+
+def is_operator_dict(value) -> bool:
+    return isinstance(value, dict) and bool(value) and all(key.startswith("$") for key in value)
+
+def matches(document: dict, query: Optional[dict]) -> bool:
+    """Whether a document satisfies a Mongo query filter"""
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            ok = all(matches(document, clause) for clause in condition)
+        elif key == "$or":
+            ok = any(matches(document, clause) for clause in condition)
+        elif key == "$nor":
+            ok = not any(matches(document, clause) for clause in condition)
+        elif is_operator_dict(condition):
+            ok = match_operators(resolve(document, key), condition)
+        else:
+            ok = equals(resolve(document, key), condition)
+        if not ok:
+            return False
+    return True
+
+# ============== PROJECTION, SORT & UPDATE ==============
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return clone(document)
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if any(fields.values()) if fields else include_id:
+        result = {"_id": document["_id"]} if include_id and "_id" in document else {}
+        for path in fields:
+            source, key = parent_of(document, path, create=False)
+            if source is not None and key in source:
+                target, key = parent_of(result, path, create=True)
+                target[key] = clone(source[key])
+        return result
+    result = clone(document)
+    for path in fields:
+        target, key = parent_of(result, path, create=False)
+        if target is not None:
+            target.pop(key, None)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+def sort_spec(key_or_list, direction=None) -> list:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+def sort_documents(items: list, spec: list, document=lambda item: item) -> list:
+    # Stable sorts applied from the least significant key give a compound order
+    for key, direction in reversed(spec):
+        items.sort(key=lambda item: sort_value(get_value(document(item), key)), reverse=direction == -1)
+    return items
+
+def apply_update(document: dict, update: dict, inserting: bool = False):
+    """Apply update operators (or a replacement document) in place"""
+    if not any(key.startswith("$") for key in update):
+        document_id = document.get("_id")
+        document.clear()
+        document.update(clone(update))
+        if document_id is not None:
+            document.setdefault("_id", document_id)
+        return
+    for operator, fields in update.items():
+        if operator == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            target, key = parent_of(document, path, create=operator != "$unset")
+            if operator in ("$set", "$setOnInsert"):
+                target[key] = clone(value)
+            elif operator == "$inc":
+                target[key] = target.get(key, 0) + value
+            elif operator == "$mul":
+                target[key] = target.get(key, 0) * value
+            elif operator == "$unset":
+                if target is not None:
+                    target.pop(key, None)
+            elif operator in ("$max", "$min"):
+                current = target.get(key)
+                if key not in target or (sort_value(value) > sort_value(current)) == (operator == "$max"):
+                    target[key] = clone(value)
+            elif operator in ("$push", "$addToSet"):
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                array = target.setdefault(key, [])
+                for item in items:
+                    if operator == "$push" or freeze(item) not in {freeze(x) for x in array}:
+                        array.append(clone(item))
+            elif operator == "$pull":
+                if isinstance(target.get(key), list):
+                    target[key] = [
+                        x for x in target[key]
+                        if not (match_element(x, value) if isinstance(value, dict) else x == value)
+                    ]
+            else:
+                raise OperationFailure(f"Unknown modifier: {operator}")
+
+def upsert_seed(query: dict) -> dict:
+    """The document an upsert starts from: the filter's equality conditions"""
+    document = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if is_operator_dict(condition):
+            if "$eq" not in condition:
+                continue
+            condition = condition["$eq"]
+        target, field = parent_of(document, key, create=True)
+        target[field] = clone(condition)
+    return document
+
+# ============== AGGREGATION ==============
+
+def truthy(value) -> bool:
+    if value is None or value is False:
+        return False
+    return not (isinstance(value, (int, float)) and value == 0)
+
+def evaluate(expression, document):
+    """Evaluate an aggregation expression against a document"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return get_value(document, expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(e, document) for e in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) != 1 or not next(iter(expression)).startswith("$"):
+        return {k: evaluate(v, document) for k, v in expression.items()}
+
+    operator, argument = next(iter(expression.items()))
+    if operator == "$literal":
+        return argument
+    if operator == "$cond":
+        if isinstance(argument, dict):
+            argument = [argument["if"], argument["then"], argument["else"]]
+        condition, then, otherwise = argument
+        return evaluate(then if truthy(evaluate(condition, document)) else otherwise, document)
+    args = [evaluate(a, document) for a in (argument if isinstance(argument, list) else [argument])]
+    if operator == "$ifNull":
+        return next((a for a in args if a is not None), None)
+    if operator == "$add":
+        return sum(a or 0 for a in args)
+    if operator == "$subtract":
+        return (args[0] or 0) - (args[1] or 0)
+    if operator == "$multiply":
+        product = 1
+        for a in args:
+            product *= a or 0
+        return product
+    if operator == "$divide":
+        return args[0] / args[1] if args[1] else None
+    if operator in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        a, b = sort_value(args[0]), sort_value(args[1])
+        return {"$eq": a == b, "$ne": a != b, "$gt": a > b, "$gte": a >= b, "$lt": a < b, "$lte": a <= b}[operator]
+    if operator == "$and":
+        return all(truthy(a) for a in args)
+    if operator == "$or":
+        return any(truthy(a) for a in args)
+    if operator == "$not":
+        return not truthy(args[0])
+    if operator == "$in":
+        return args[0] in (args[1] or [])
+    if operator == "$size":
+        return len(args[0] or [])
+    if operator == "$concat":
+        return None if any(a is None for a in args) else "".join(args)
+    if operator == "$toString":
+        return None if args[0] is None else str(args[0])
+    raise OperationFailure(f"Unrecognized expression '{operator}'")
+
+def group(documents: list, spec: dict) -> list:
+    groups = {}
+    averages = {}
+    for document in documents:
+        key = evaluate(spec["_id"], document)
+        state = groups.get(freeze(key))
+        if state is None:
+            state = groups[freeze(key)] = {"_id": key}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            operator, argument = next(iter(accumulator.items()))
+            value = evaluate(argument, document) if operator != "$count" else 1
+            if operator in ("$sum", "$count"):
+                number = value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+                state[field] = state.get(field, 0) + number
+            elif operator == "$avg":
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total, n = averages.get((freeze(key), field), (0, 0))
+                    averages[(freeze(key), field)] = (total + value, n + 1)
+                state.setdefault(field, None)
+            elif operator in ("$max", "$min"):
+                current = state.get(field)
+                if value is not None and (current is None or (sort_value(value) > sort_value(current)) == (operator == "$max")):
+                    state[field] = value
+                state.setdefault(field, None)
+            elif operator == "$first":
+                state.setdefault(field, value)
+            elif operator == "$last":
+                state[field] = value
+            elif operator == "$push":
+                state.setdefault(field, []).append(value)
+            elif operator == "$addToSet":
+                values = state.setdefault(field, [])
+                if value is not None and freeze(value) not in {freeze(v) for v in values}:
+                    values.append(value)
+            else:
+                raise OperationFailure(f"unknown group operator '{operator}'")
+    for (key, field), (total, n) in averages.items():
+        groups[key][field] = total / n
+    return list(groups.values())
+
+def run_pipeline(documents: list, pipeline: list) -> list:
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            documents = [d for d in documents if matches(d, spec)]
+        elif name == "$group":
+            documents = group(documents, spec)
+        elif name == "$sort":
+            documents = sort_documents(documents, list(spec.items()))
+        elif name == "$limit":
+            documents = documents[:spec]
+        elif name == "$skip":
+            documents = documents[spec:]
+        elif name == "$count":
+            documents = [{spec: len(documents)}] if documents else []
+        elif name == "$unwind":
+            path = (spec["path"] if isinstance(spec, dict) else spec)[1:]
+            documents = [
+                {**d, path: item} for d in documents
+                for item in (get_value(d, path) if isinstance(get_value(d, path), list) else [])
+            ]
+        elif name in ("$addFields", "$set"):
+            documents = [{**d, **{k: evaluate(v, d) for k, v in spec.items()}} for d in documents]
+        elif name == "$project":
+            if all(v in (0, 1, True, False) for v in spec.values()):
+                documents = [project(d, spec) for d in documents]
+            else:
+                documents = [
+                    {**({"_id": d.get("_id")} if spec.get("_id", 1) else {}),
+                     **{k: (get_value(d, k) if v in (1, True) else evaluate(v, d)) for k, v in spec.items() if k != "_id"}}
+                    for d in documents
+                ]
+        else:
+            raise OperationFailure(f"Unrecognized pipeline stage name: '{name}'")
+    return documents
+
+# ============== DOCUMENT REPOSITORY ==============
+
+class ResultCursor:
+    """find()/aggregate() cursor; results are computed when first read"""
+
+    def __init__(self, fetch):
+        self._fetch = fetch
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = sort_spec(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int):
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int):
+        return self
+
+    async def to_list(self, length: Optional[int]) -> list:
+        # The requested length caps the fetch like a limit, so backends can stop early
+        return self._fetch(self._sort, self._skip, min(filter(None, (self._limit, length)), default=0))
+
+    async def __aiter__(self):
+        for document in self._fetch(self._sort, self._skip, self._limit):
+            yield document
+
+class DocumentRepository:
+    """Collection semantics over a storage engine.
+
+    Subclasses store documents under integer positions and implement _scan,
+    _store, _replace and _discard; matching, sorting, projection, updates and
+    aggregation are shared so every embedded backend behaves the same.
+    """
+
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.database.name}.{self.name}"
+
+    # ---- storage primitives ----
+
+    def _scan(self, query: Optional[dict], sort: list) -> tuple:
+        """(iterable of (position, document) that may match, whether it is already in sort order)"""
+        raise NotImplementedError
+
+    def _store(self, document: dict) -> int:
+        raise NotImplementedError
+
+    def _replace(self, position: int, before: dict, after: dict):
+        raise NotImplementedError
+
+    def _discard(self, position: int, document: dict):
+        raise NotImplementedError
+
+    def _batch(self):
+        """Context grouping several writes (a transaction where the engine has them)"""
+        return nullcontext()
+
+    # ---- reads ----
+
+    def _select(self, query: Optional[dict], sort: list = (), skip: int = 0, limit: int = 0) -> list:
+        rows, ordered = self._scan(query, sort)
+        rows = ((p, d) for p, d in rows if matches(d, query))
+        if sort and not ordered:
+            rows = sort_documents(list(rows), sort, itemgetter(1))
+        return list(islice(rows, skip, skip + limit if limit else None))
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> ResultCursor:
+        cursor = ResultCursor(lambda sort, skip, limit: [project(d, projection) for _, d in self._select(filter, sort, skip, limit)])
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        return cursor.skip(kwargs.get("skip", 0)).limit(kwargs.get("limit", 0))
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> Optional[dict]:
+        documents = await self.find(filter, projection, **kwargs).to_list(1)
+        return documents[0] if documents else None
+
+    async def count_documents(self, filter: dict, skip: int = 0, limit: int = 0, **kwargs) -> int:
+        return len(self._select(filter, skip=skip, limit=limit))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._select({}))
+
+    async def distinct(self, key: str, filter: Optional[dict] = None, **kwargs) -> list:
+        seen = {}
+        for _, document in self._select(filter):
+            for value in candidates(resolve(document, key)):
+                if not isinstance(value, list):
+                    seen.setdefault(freeze(value), value)
+        return list(seen.values())
+
+    def aggregate(self, pipeline: list, **kwargs) -> ResultCursor:
+        def fetch(sort, skip, limit):
+            # A leading $match narrows the scan like it would use an index in Mongo
+            query = pipeline[0]["$match"] if pipeline and "$match" in pipeline[0] else None
+            documents = [clone(d) for _, d in self._select(query)]
+            return run_pipeline(documents, pipeline[1:] if query is not None else pipeline)
+        return ResultCursor(fetch)
+
+    async def find_raw_batches(self, filter: Optional[dict] = None, batch_size: int = 1000, **kwargs):
+        documents = [d for _, d in self._select(filter)]
+        for start in range(0, len(documents), batch_size):
+            yield b"".join(bson.encode(d) for d in documents[start:start + batch_size])
+
+    # ---- writes ----
+
+    def _insert(self, document) -> Any:
+        if isinstance(document, RawBSONDocument):
+            document = bson.decode(document.raw)
+        elif "_id" not in document:
+            # Like the driver, the caller's document gets the generated _id
+            document["_id"] = ObjectId()
+        self._store(clone(document))
+        return document["_id"]
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True, **kwargs) -> InsertManyResult:
+        inserted, errors = [], []
+        with self._batch():
+            for index, document in enumerate(documents):
+                try:
+                    inserted.append(self._insert(document))
+                except DuplicateKeyError as e:
+                    errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return InsertManyResult(inserted, True)
+
+    def _update(self, filter: dict, update: dict, upsert: bool, multi: bool, sort: list = ()) -> tuple:
+        """Apply an update; returns (matched, modified, upserted_id, before, after) of the first document"""
+        rows = self._select(filter, sort, limit=0 if multi else 1)
+        if not rows:
+            if not upsert:
+                return 0, 0, None, None, None
+            document = upsert_seed(filter)
+            apply_update(document, update, inserting=True)
+            return 0, 0, self._insert(document), None, document
+        modified = 0
+        first_before = first_after = None
+        with self._batch():
+            for position, before in rows:
+                after = clone(before)
+                apply_update(after, update)
+                if after != before:
+                    self._replace(position, before, after)
+                    modified += 1
+                if first_before is None:
+                    first_before, first_after = before, after
+        return len(rows), modified, None, first_before, first_after
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        matched, modified, upserted_id, _, _ = self._update(filter, update, upsert, multi=False)
+        return update_result(matched, modified, upserted_id)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        matched, modified, upserted_id, _, _ = self._update(filter, update, upsert, multi=True)
+        return update_result(matched, modified, upserted_id)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self.update_one(filter, replacement, upsert)
+
+    async def find_one_and_update(
+        self, filter: dict, update: dict, projection: Optional[dict] = None, sort=None,
+        upsert: bool = False, return_document: bool = False, **kwargs
+    ) -> Optional[dict]:
+        _, _, _, before, after = self._update(filter, update, upsert, multi=False, sort=sort_spec(sort) if sort else ())
+        document = after if return_document else before
+        return project(document, projection) if document is not None else None
+
+    def _delete(self, filter: dict, multi: bool) -> int:
+        rows = self._select(filter, limit=0 if multi else 1)
+        with self._batch():
+            for position, document in rows:
+                self._discard(position, document)
+        return len(rows)
+
+    async def find_one_and_delete(self, filter: dict, projection: Optional[dict] = None, **kwargs) -> Optional[dict]:
+        rows = self._select(filter, limit=1)
+        for position, document in rows:
+            self._discard(position, document)
+            return project(document, projection)
+        return None
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=False), "ok": 1}, True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=True), "ok": 1}, True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0, "upserted": [],
+                  "writeErrors": [], "writeConcernErrors": []}
+        with self._batch():
+            for index, request in enumerate(requests):
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    matched, modified, upserted_id, _, _ = self._update(
+                        request._filter, request._doc, request._upsert, multi=isinstance(request, UpdateMany)
+                    )
+                    result["nMatched"] += matched
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": upserted_id})
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    result["nRemoved"] += self._delete(request._filter, multi=isinstance(request, DeleteMany))
+        return BulkWriteResult(result, True)
+
+    async def create_index(self, keys, **kwargs) -> str:
+        return (await self.create_indexes([IndexModel(keys, **kwargs)]))[0]
+
+def update_result(matched: int, modified: int, upserted_id) -> UpdateResult:
+    raw = {"n": matched or int(upserted_id is not None), "nModified": modified, "ok": 1}
+    if upserted_id is not None:
+        raw["upserted"] = upserted_id
+    return UpdateResult(raw, True)
+
+def duplicate_key(repository: DocumentRepository, index: str, key=None) -> DuplicateKeyError:
+    return DuplicateKeyError(f"E11000 duplicate key error collection: {repository.full_name} index: {index} dup key: {key}", 11000)
+
+# ============== IN-MEMORY BACKEND ==============
+
+class MemoryRepository(DocumentRepository):
+    """One collection held in a dict, in insertion order"""
+
+    def __init__(self, database: "MemoryDatabase", name: str):
+        super().__init__(database, name)
+        self.exists = False
+        self._positions = count()
+        self._documents = {}
+        self._indexes = {"_id_": {"key": [("_id", 1)], "unique": True}}
+        # First indexed field -> value -> positions, for equality and $in lookups
+        self._lookups = {"_id": {}}
+        # Unique index name -> frozen key -> position
+        self._unique = {"_id_": {}}
+
+    def _lookup_keys(self, document: dict, field: str) -> set:
+        """Lookup entries for a document: its value and, for arrays, each element (missing is null)"""
+        return {freeze(value) for value in candidates(resolve(document, field))} or {None}
+
+    def _index_key(self, index: dict, document: dict) -> tuple:
+        return tuple(freeze(get_value(document, field)) for field, _ in index["key"])
+
+    def _add(self, position: int, document: dict):
+        for name, entries in self._unique.items():
+            key = self._index_key(self._indexes[name], document)
+            if entries.get(key, position) != position:
+                raise duplicate_key(self, name, key)
+        for name, entries in self._unique.items():
+            entries[self._index_key(self._indexes[name], document)] = position
+        for field, lookup in self._lookups.items():
+            for key in self._lookup_keys(document, field):
+                lookup.setdefault(key, set()).add(position)
+        self._documents[position] = document
+
+    def _remove(self, position: int, document: dict):
+        del self._documents[position]
+        for name, entries in self._unique.items():
+            entries.pop(self._index_key(self._indexes[name], document), None)
+        for field, lookup in self._lookups.items():
+            for key in self._lookup_keys(document, field):
+                lookup[key].discard(position)
+
+    def _scan(self, query: Optional[dict], sort: list) -> tuple:
+        """Narrow by an indexed equality or $in condition, else scan everything"""
+        for field, lookup in self._lookups.items():
+            if field not in (query or {}):
+                continue
+            condition = query[field]
+            if is_operator_dict(condition):
+                if set(condition) != {"$in"} or any(isinstance(v, (dict, list, re.Pattern, bson.Regex)) for v in condition["$in"]):
+                    continue
+                targets = condition["$in"]
+            elif isinstance(condition, (dict, list, re.Pattern, bson.Regex)):
+                continue
+            else:
+                targets = [condition]
+            positions = set()
+            for target in targets:
+                positions |= lookup.get(freeze(target), set())
+            return [(p, self._documents[p]) for p in sorted(positions)], False
+        return list(self._documents.items()), False
+
+    def _store(self, document: dict) -> int:
+        position = next(self._positions)
+        self._add(position, document)
+        self.exists = True
+        return position
+
+    def _replace(self, position: int, before: dict, after: dict):
+        self._remove(position, before)
+        try:
+            self._add(position, after)
+        except DuplicateKeyError:
+            self._add(position, before)
+            raise
+
+    def _discard(self, position: int, document: dict):
+        self._remove(position, document)
+
+    async def create_indexes(self, indexes: list, **kwargs) -> List[str]:
+        names = []
+        for model in indexes:
+            document = model.document
+            name = document["name"]
+            index = {"key": list(document["key"].items()), "unique": document.get("unique", False)}
+            if index["unique"] and name not in self._unique:
+                entries = {}
+                for position, stored in self._documents.items():
+                    key = self._index_key(index, stored)
+                    if key in entries:
+                        raise duplicate_key(self, name, key)
+                    entries[key] = position
+                self._unique[name] = entries
+            self._indexes[name] = index
+            first = index["key"][0][0]
+            if first not in self._lookups:
+                lookup = self._lookups[first] = {}
+                for position, stored in self._documents.items():
+                    for key in self._lookup_keys(stored, first):
+                        lookup.setdefault(key, set()).add(position)
+            names.append(name)
+        self.exists = True
+        return names
+
+    async def index_information(self) -> dict:
+        return {
+            name: {"key": index["key"], **({"unique": True} if index["unique"] and name != "_id_" else {})}
+            for name, index in self._indexes.items()
+        }
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._documents)
+
+    async def drop(self, **kwargs):
+        self.database._collections.pop(self.name, None)
+
+    async def rename(self, new_name: str, dropTarget: bool = False, **kwargs):
+        collections = self.database._collections
+        if new_name in collections and collections[new_name].exists and not dropTarget:
+            raise OperationFailure("target namespace exists")
+        collections.pop(self.name, None)
+        self.name = new_name
+        collections[new_name] = self
+        return {"ok": 1}
+
+class MemoryDatabase:
+    """Repositories by name, created on first use like Mongo collections"""
+
+    client = None
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryRepository:
+        repository = self._collections.get(name)
+        if repository is None:
+            repository = self._collections[name] = MemoryRepository(self, name)
+        return repository
+
+    def __getattr__(self, name: str) -> MemoryRepository:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryRepository:
+        return self[name]
+
+    async def list_collection_names(self, **kwargs) -> List[str]:
+        return [name for name, repository in self._collections.items() if repository.exists]
+
+    async def create_collection(self, name: str, **options) -> MemoryRepository:
+        # Options such as capped sizes have no in-memory equivalent and are ignored
+        if name in self._collections and self._collections[name].exists:
+            raise CollectionInvalid(f"collection {name} already exists")
+        repository = self[name]
+        repository.exists = True
+        return repository
+
+    async def drop_collection(self, name: str, **kwargs):
+        self._collections.pop(name, None)
+
+    async def command(self, command, *args, **kwargs):
+        raise OperationFailure(f"{command!r} is not supported by the in-memory backend")
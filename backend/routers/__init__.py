@@ -0,0 +1,105 @@
+"""
+Domain routers loaded on demand
+Each module here defines `router`, an APIRouter with the /api prefix, for a
+domain most requests never touch. create_app() installs a LazyRouter
+placeholder per prefix instead of importing them, which keeps their models
+and route tables out of worker cold start. The first request under a prefix
+imports the module and swaps its routes in; the lifespan's warm-up task
+loads the rest in the background once the worker is serving.
+"""
+import asyncio
+import copy
+import importlib
+from typing import Optional
+
+from fastapi import APIRouter, FastAPI
+from fastapi.routing import APIRoute, request_response
+from starlette.routing import BaseRoute, Match, NoMatchFound
+
+# URL prefix -> module defining `router`
+DOMAIN_ROUTERS = {
+    "/api/brokers": "routers.brokers",
+    "/api/messages": "routers.messages",
+    "/api/channels": "routers.channels",
+    "/api/integrations": "routers.integrations",
+}
+
+def include_routes(app: FastAPI, router: APIRouter, replace: Optional[BaseRoute] = None):
+    """Add copies of the router's routes to the app.
+
+    app.include_router() rebuilds every route (and its response model field),
+    which costs a few ms per route at startup. Shallow copies are used
+    instead, so the router must carry the full path prefix itself. Routers are
+    module-level and shared by every create_app() instance; each copy gets its
+    own handler bound to this app's dependency_overrides.
+    """
+    routes = [bind_route(app, route) for route in router.routes]
+    if replace is None:
+        app.router.routes.extend(routes)
+    else:
+        position = app.router.routes.index(replace)
+        app.router.routes[position:position + 1] = routes
+
+def bind_route(app: FastAPI, route: BaseRoute) -> BaseRoute:
+    if not isinstance(route, APIRoute):
+        return route
+    route = copy.copy(route)
+    route.dependency_overrides_provider = app
+    # The handler captures the overrides provider when it is built
+    route.app = request_response(route.get_route_handler())
+    return route
+
+class LazyRouter(BaseRoute):
+    """Placeholder matching every path under `prefix` until its module is loaded"""
+
+    def __init__(self, app: FastAPI, prefix: str, module: str):
+        self.app = app
+        self.prefix = prefix
+        self.module = module
+        self.router = None
+
+    def matches(self, scope):
+        if scope["type"] == "http" and (scope["path"] == self.prefix or scope["path"].startswith(self.prefix + "/")):
+            return Match.FULL, {}
+        return Match.NONE, {}
+
+    def url_path_for(self, name: str, /, **path_params):
+        raise NoMatchFound(name, path_params)
+
+    async def handle(self, scope, receive, send):
+        await self.load()
+        # Routes only under this prefix, so its own 404/405 handling applies
+        await self.router(scope, receive, send)
+
+    async def load(self):
+        if self.router is None:
+            module = await asyncio.to_thread(importlib.import_module, self.module)
+            self.swap_in(module.router)
+
+    def load_now(self):
+        if self.router is None:
+            self.swap_in(importlib.import_module(self.module).router)
+
+    def swap_in(self, router: APIRouter):
+        # Concurrent first requests may both import; only the first swaps
+        if self.router is None:
+            self.router = router
+            include_routes(self.app, router, replace=self)
+
+def install(app: FastAPI, routers: dict = DOMAIN_ROUTERS):
+    app.router.routes.extend(LazyRouter(app, prefix, module) for prefix, module in routers.items())
+
+    def openapi() -> dict:
+        # The schema documents every route, so load whatever is still pending first
+        if app.openapi_schema is None:
+            for route in pending(app):
+                route.load_now()
+        return FastAPI.openapi(app)
+    app.openapi = openapi
+
+def pending(app: FastAPI) -> list:
+    return [route for route in app.router.routes if isinstance(route, LazyRouter)]
+
+async def load_all(app: FastAPI):
+    for route in pending(app):
+        await route.load()
@@ -0,0 +1,123 @@
+"""
+Broker management
+Loaded on the first request under /api/brokers (see routers/__init__.py).
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Header
+from pydantic import BaseModel, EmailStr
+
+from deps import BudgetedRoute, db, get_current_user, model_response, update_document
+
+router = APIRouter(prefix="/api", route_class=BudgetedRoute)
+
+class BrokerCreate(BaseModel):
+    name: str
+    company: str
+    email: EmailStr
+    phone: str = ""
+    territory: str = ""
+    commission_rate: float = 10.0
+    status: str = "active"
+    notes: str = ""
+
+class BrokerResponse(BaseModel):
+    id: str
+    name: str
+    company: str
+    email: str
+    phone: str
+    territory: str
+    commission_rate: float
+    status: str
+    notes: str
+    total_sales: float
+    total_deals: int
+    created_at: str
+    version: int = 0
+
+class BrokerUpdate(BaseModel):
+    name: Optional[str] = None
+    company: Optional[str] = None
+    email: Optional[EmailStr] = None
+    phone: Optional[str] = None
+    territory: Optional[str] = None
+    commission_rate: Optional[float] = None
+    status: Optional[str] = None
+    notes: Optional[str] = None
+
+@router.get("/brokers", response_model=List[BrokerResponse])
+async def get_brokers(
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    query = {}
+    if status:
+        query["status"] = status
+    if search:
+        query["$or"] = [
+            {"name": {"$regex": search, "$options": "i"}},
+            {"company": {"$regex": search, "$options": "i"}},
+            {"email": {"$regex": search, "$options": "i"}}
+        ]
+    
+    brokers = await db.brokers.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    return model_response(brokers, BrokerResponse)
+
+@router.get("/brokers/{broker_id}", response_model=BrokerResponse)
+async def get_broker(broker_id: str, current_user: dict = Depends(get_current_user)):
+    broker = await db.brokers.find_one({"id": broker_id}, {"_id": 0})
+    if not broker:
+        raise HTTPException(status_code=404, detail="Broker not found")
+    return BrokerResponse(**broker)
+
+@router.post("/brokers", response_model=BrokerResponse)
+async def create_broker(broker: BrokerCreate, current_user: dict = Depends(get_current_user)):
+    broker_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    broker_doc = {
+        "id": broker_id,
+        **broker.model_dump(),
+        "total_sales": 0,
+        "total_deals": 0,
+        "created_at": now
+    }
+    await db.brokers.insert_one(broker_doc)
+    return BrokerResponse(**{k: v for k, v in broker_doc.items() if k != "_id"})
+
+@router.put("/brokers/{broker_id}", response_model=BrokerResponse)
+async def update_broker(
+    broker_id: str,
+    update: BrokerUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    
+    broker = await update_document(db.brokers, {"id": broker_id}, update_data, "Broker not found", if_match=if_match)
+    return BrokerResponse(**broker)
+
+@router.delete("/brokers/{broker_id}")
+async def delete_broker(broker_id: str, current_user: dict = Depends(get_current_user)):
+    result = await db.brokers.delete_one({"id": broker_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Broker not found")
+    return {"message": "Broker deleted"}
+
+@router.post("/brokers/{broker_id}/record-sale")
+async def record_broker_sale(
+    broker_id: str,
+    amount: float,
+    current_user: dict = Depends(get_current_user)
+):
+    """Record a sale for a broker"""
+    broker = await update_document(
+        db.brokers, {"id": broker_id}, {}, "Broker not found",
+        increments={"total_sales": amount, "total_deals": 1}
+    )
+    return BrokerResponse(**broker)
@@ -0,0 +1,93 @@
+"""
+Sales channels
+Loaded on the first request under /api/channels (see routers/__init__.py).
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Header
+from pydantic import BaseModel
+
+from deps import BudgetedRoute, db, get_current_user, model_response, update_document
+
+router = APIRouter(prefix="/api", route_class=BudgetedRoute)
+
+class ChannelCreate(BaseModel):
+    name: str
+    channel_type: str  # direct, retail, online, wholesale, referral
+    description: str = ""
+    contact_email: str = ""
+    commission_rate: float = 0.0
+    status: str = "active"
+
+class ChannelResponse(BaseModel):
+    id: str
+    name: str
+    channel_type: str
+    description: str
+    contact_email: str
+    commission_rate: float
+    status: str
+    total_revenue: float
+    total_orders: int
+    created_at: str
+    version: int = 0
+
+class ChannelUpdate(BaseModel):
+    name: Optional[str] = None
+    channel_type: Optional[str] = None
+    description: Optional[str] = None
+    contact_email: Optional[str] = None
+    commission_rate: Optional[float] = None
+    status: Optional[str] = None
+
+@router.get("/channels", response_model=List[ChannelResponse])
+async def get_channels(
+    status: Optional[str] = None,
+    channel_type: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    query = {}
+    if status:
+        query["status"] = status
+    if channel_type:
+        query["channel_type"] = channel_type
+    
+    channels = await db.channels.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+    return model_response(channels, ChannelResponse)
+
+@router.post("/channels", response_model=ChannelResponse)
+async def create_channel(channel: ChannelCreate, current_user: dict = Depends(get_current_user)):
+    channel_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    channel_doc = {
+        "id": channel_id,
+        **channel.model_dump(),
+        "total_revenue": 0,
+        "total_orders": 0,
+        "created_at": now
+    }
+    await db.channels.insert_one(channel_doc)
+    return ChannelResponse(**{k: v for k, v in channel_doc.items() if k != "_id"})
+
+@router.put("/channels/{channel_id}", response_model=ChannelResponse)
+async def update_channel(
+    channel_id: str,
+    update: ChannelUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    
+    channel = await update_document(db.channels, {"id": channel_id}, update_data, "Channel not found", if_match=if_match)
+    return ChannelResponse(**channel)
+
+@router.delete("/channels/{channel_id}")
+async def delete_channel(channel_id: str, current_user: dict = Depends(get_current_user)):
+    result = await db.channels.delete_one({"id": channel_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    return {"message": "Channel deleted"}
@@ -0,0 +1,97 @@
+"""
+Third-party integrations
+Loaded on the first request under /api/integrations (see routers/__init__.py).
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Header
+from pydantic import BaseModel
+
+from deps import BudgetedRoute, db, get_current_user, model_response, update_document
+
+router = APIRouter(prefix="/api", route_class=BudgetedRoute)
+
+class IntegrationCreate(BaseModel):
+    name: str
+    integration_type: str  # payment, email, shipping, analytics, crm
+    provider: str
+    api_key: str = ""
+    webhook_url: str = ""
+    settings: dict = {}
+    status: str = "inactive"
+
+class IntegrationResponse(BaseModel):
+    id: str
+    name: str
+    integration_type: str
+    provider: str
+    status: str
+    settings: dict
+    last_sync: Optional[str]
+    created_at: str
+    version: int = 0
+
+class IntegrationUpdate(BaseModel):
+    name: Optional[str] = None
+    api_key: Optional[str] = None
+    webhook_url: Optional[str] = None
+    settings: Optional[dict] = None
+    status: Optional[str] = None
+
+@router.get("/integrations", response_model=List[IntegrationResponse])
+async def get_integrations(current_user: dict = Depends(get_current_user)):
+    integrations = await db.integrations.find({}, {"_id": 0, "api_key": 0}).to_list(100)
+    return model_response(integrations, IntegrationResponse)
+
+@router.post("/integrations", response_model=IntegrationResponse)
+async def create_integration(integration: IntegrationCreate, current_user: dict = Depends(get_current_user)):
+    integration_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    integration_doc = {
+        "id": integration_id,
+        **integration.model_dump(),
+        "last_sync": None,
+        "created_at": now
+    }
+    await db.integrations.insert_one(integration_doc)
+    response_doc = {k: v for k, v in integration_doc.items() if k not in ["_id", "api_key", "webhook_url"]}
+    return IntegrationResponse(**response_doc)
+
+@router.put("/integrations/{integration_id}", response_model=IntegrationResponse)
+async def update_integration(
+    integration_id: str,
+    update: IntegrationUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    
+    integration = await update_document(
+        db.integrations, {"id": integration_id}, update_data, "Integration not found",
+        projection={"api_key": 0, "webhook_url": 0}, if_match=if_match
+    )
+    return IntegrationResponse(**integration)
+
+@router.delete("/integrations/{integration_id}")
+async def delete_integration(integration_id: str, current_user: dict = Depends(get_current_user)):
+    result = await db.integrations.delete_one({"id": integration_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Integration not found")
+    return {"message": "Integration deleted"}
+
+@router.post("/integrations/{integration_id}/test")
+async def test_integration(integration_id: str, current_user: dict = Depends(get_current_user)):
+    integration = await db.integrations.find_one({"id": integration_id}, {"_id": 0})
+    if not integration:
+        raise HTTPException(status_code=404, detail="Integration not found")
+    
+    # Simulate test - in production would actually test the API
+    await db.integrations.update_one(
+        {"id": integration_id}, 
+        {"$set": {"last_sync": datetime.now(timezone.utc).isoformat(), "status": "active"}}
+    )
+    return {"success": True, "message": f"Integration {integration['name']} tested successfully"}
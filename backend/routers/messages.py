@@ -0,0 +1,77 @@
+"""
+Internal and client messages
+Loaded on the first request under /api/messages (see routers/__init__.py).
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+
+from deps import BudgetedRoute, db, get_current_user, model_response
+
+router = APIRouter(prefix="/api", route_class=BudgetedRoute)
+
+class MessageCreate(BaseModel):
+    recipient_id: Optional[str] = None
+    recipient_name: str
+    subject: str
+    content: str
+    message_type: str = "internal"  # internal, client, system
+
+class MessageResponse(BaseModel):
+    id: str
+    sender_id: str
+    sender_name: str
+    recipient_id: Optional[str]
+    recipient_name: str
+    subject: str
+    content: str
+    message_type: str
+    is_read: bool
+    created_at: str
+
+@router.get("/messages", response_model=List[MessageResponse])
+async def get_messages(
+    message_type: Optional[str] = None,
+    is_read: Optional[bool] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    query = {"$or": [{"sender_id": current_user["id"]}, {"recipient_id": current_user["id"]}]}
+    if message_type:
+        query["message_type"] = message_type
+    if is_read is not None:
+        query["is_read"] = is_read
+    
+    messages = await db.messages.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
+    return model_response(messages, MessageResponse)
+
+@router.post("/messages", response_model=MessageResponse)
+async def create_message(message: MessageCreate, current_user: dict = Depends(get_current_user)):
+    message_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    message_doc = {
+        "id": message_id,
+        "sender_id": current_user["id"],
+        "sender_name": current_user["name"],
+        **message.model_dump(),
+        "is_read": False,
+        "created_at": now
+    }
+    await db.messages.insert_one(message_doc)
+    return MessageResponse(**{k: v for k, v in message_doc.items() if k != "_id"})
+
+@router.put("/messages/{message_id}/read")
+async def mark_message_read(message_id: str, current_user: dict = Depends(get_current_user)):
+    result = await db.messages.update_one({"id": message_id}, {"$set": {"is_read": True}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return {"message": "Message marked as read"}
+
+@router.delete("/messages/{message_id}")
+async def delete_message(message_id: str, current_user: dict = Depends(get_current_user)):
+    result = await db.messages.delete_one({"id": message_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return {"message": "Message deleted"}
@@ -1,43 +1,112 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import ConnectionFailure
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
+from functools import lru_cache
+from contextlib import asynccontextmanager
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
 import random
+import asyncio
+import time
+import numpy as np
+
+from compression import CompressionMiddleware
+from load_shedding import AIMDLimiter, LoadSheddingMiddleware
+from rate_limits import RateLimit, RateLimiter, RateLimitMiddleware
+from circuit_breaker import CircuitBreaker, CircuitBreakerMiddleware, StaleCache
+from metrics import MetricsMiddleware, MongoCommandMetrics, MongoPoolMetrics, StartupTimer, metrics_response, monitor_event_loop_lag
+from query_profiler import QueryAccountingListener, QueryAccountingMiddleware
+from slow_queries import SlowQueryLog
+from index_advisor import IndexAdvisor
+from indexes import ensure_indexes
+from synthetic_data import SyntheticDataSpec, generate_dataset
+from snapshots import SnapshotStore
+from repositories import open_database
+from deps import (
+    ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, DEFAULT_TIME_BUDGET_MS, SECRET_KEY, BudgetedRoute,
+    bump_collection_versions, db, get_current_user, model_response, response_adapter, update_document, version_filter,
+)
+import routers
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Database backend: "mongo", or an embedded one from repositories.open_database
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mongo')
+# Slow operations are logged with sampled explain plans, see /api/admin/slow-queries
+slow_query_log = SlowQueryLog(
+    threshold_ms=float(os.environ.get('SLOW_QUERY_MS', 100)),
+    sample_rate=float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 0.1)),
+)
+# Query shapes issued by the app, reported as index suggestions at /api/admin/index-advice
+index_advisor = IndexAdvisor()
+# Pooled connections opened at startup so the first requests don't pay for the handshakes
+DB_WARM_CONNECTIONS = int(os.environ.get('DB_WARM_CONNECTIONS', 4))
+# Motor pool and timeouts; these take precedence over the same options in MONGO_URL
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+    "minPoolSize": int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+    # Requests waiting longer than this for a pooled connection get a 503 instead of queueing
+    "waitQueueTimeoutMS": int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000)),
+    "serverSelectionTimeoutMS": int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    "connectTimeoutMS": int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+}
+# Dashboard, forecast, velocity and export reads (db.analytics) may be served by a
+# secondary at most this many seconds behind the primary; Mongo's minimum is 90
+MONGO_ANALYTICS_READ_PREFERENCE = os.environ.get('MONGO_ANALYTICS_READ_PREFERENCE', 'secondaryPreferred')
+MONGO_ANALYTICS_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_ANALYTICS_MAX_STALENESS_SECONDS', 120))
+
+# Collections written through update_document, whose per-document versions back ETag and If-Match
+VERSIONED_COLLECTIONS = ["clients", "products", "orders", "deals", "brokers", "channels", "roles"]
+# Named dataset snapshots; reset-demo restores DEMO_SNAPSHOT instead of rebuilding documents
+snapshot_store = SnapshotStore(os.environ.get('SNAPSHOT_DIR', ROOT_DIR / 'snapshots'), versioned=VERSIONED_COLLECTIONS)
+DEMO_SNAPSHOT = os.environ.get('DEMO_SNAPSHOT', 'demo')
+# Demo dates are relative to when the data was built, so an old snapshot is rebuilt
+DEMO_SNAPSHOT_MAX_AGE_HOURS = float(os.environ.get('DEMO_SNAPSHOT_MAX_AGE_HOURS', 24))
+DEMO_COLLECTIONS = ["deals", "deal_stage_history", "pipeline_stats", "orders", "clients", "products", "brokers"]
+
+# Per-user token buckets by route class (see rate_limit_class): tokens per second and burst
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMITS = {
+    # Logins and registrations, per client address; "reports" covers forecast, analytics and export
+    "auth": RateLimit(float(os.environ.get('RATE_LIMIT_AUTH_PER_SECOND', 1)), int(os.environ.get('RATE_LIMIT_AUTH_BURST', 30))),
+    "read": RateLimit(float(os.environ.get('RATE_LIMIT_READ_PER_SECOND', 20)), int(os.environ.get('RATE_LIMIT_READ_BURST', 200))),
+    "write": RateLimit(float(os.environ.get('RATE_LIMIT_WRITE_PER_SECOND', 10)), int(os.environ.get('RATE_LIMIT_WRITE_BURST', 100))),
+    "reports": RateLimit(float(os.environ.get('RATE_LIMIT_REPORTS_PER_SECOND', 1)), int(os.environ.get('RATE_LIMIT_REPORTS_BURST', 20))),
+}
+# Seconds between syncing buckets across uvicorn workers through Mongo; 0 keeps them per worker
+RATE_LIMIT_SYNC_SECONDS = float(os.environ.get('RATE_LIMIT_SYNC_SECONDS', 0))
+
+# Trips on database 503s and slow reads; while open, STALE_PATH_PREFIXES are served from their last good response
+CIRCUIT_BREAKER_ENABLED = os.environ.get('CIRCUIT_BREAKER_ENABLED', 'true').lower() == 'true'
 
-# JWT Settings
-SECRET_KEY = os.environ.get('JWT_SECRET', 'soa-east-llc-crm-production-secret-key-2024-secure')
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+api_router = APIRouter(prefix="/api", route_class=BudgetedRoute)
+# Unprefixed probe/scrape endpoints
+probe_router = APIRouter()
 
-app = FastAPI()
-api_router = APIRouter(prefix="/api")
-security = HTTPBearer()
 
 # ============== HEALTH CHECK ==============
 
-@app.get("/health")
+@probe_router.get("/health")
 async def health_check():
     """Health check endpoint for Kubernetes probes"""
     return {"status": "healthy", "service": "soa-crm-api"}
 
+@probe_router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint; unauthenticated like /health, keep it off the public ingress"""
+    return metrics_response()
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -105,6 +174,7 @@ class ClientResponse(BaseModel):
     contact_title: Optional[str] = None
     website: Optional[str] = None
     notes: Optional[str] = None
+    version: int = 0
 
 class ClientUpdate(BaseModel):
     name: Optional[str] = None
@@ -143,6 +213,7 @@ class ProductResponse(BaseModel):
     margin_percent: float
     image_url: Optional[str]
     created_at: str
+    version: int = 0
 
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
@@ -186,6 +257,7 @@ class OrderResponse(BaseModel):
     # Legacy fields for backward compatibility
     products_description: Optional[str] = None
     amount: Optional[float] = None
+    version: int = 0
 
 class OrderUpdate(BaseModel):
     line_items: Optional[List[LineItem]] = None
@@ -220,6 +292,9 @@ class DealResponse(BaseModel):
     date_entered: str
     date_closed: Optional[str]
     loss_reason: Optional[str]
+    stage_entered_at: Optional[str] = None
+    position: Optional[float] = None
+    version: int = 0
 
 class DealUpdate(BaseModel):
     client_name: Optional[str] = None
@@ -230,6 +305,18 @@ class DealUpdate(BaseModel):
     tags: Optional[List[str]] = None
     loss_reason: Optional[str] = None
 
+class DealMove(BaseModel):
+    id: str
+    stage: Optional[str] = None
+    position: Optional[float] = None
+
+class DealBulkUpdate(BaseModel):
+    moves: List[DealMove]
+
+class DealBulkResult(BaseModel):
+    updated: List[DealResponse]
+    not_found: List[str]
+
 class DashboardStats(BaseModel):
     total_revenue: float
     open_orders: int
@@ -260,20 +347,56 @@ def create_token(user_id: str, email: str) -> str:
     payload = {"sub": user_id, "email": email, "exp": expire}
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+# ============== CONDITIONAL REQUESTS ==============
+
+async def conditional_get(request: Request, response: Response, *collections: str) -> Optional[Response]:
+    """Answer 304 when the caller's ETag still matches the collections a GET reads.
+
+    The weak ETag is built from per-collection change counters, so checking it
+    costs one small read and the body is never queried or serialized on a hit.
+    """
+    versions = await db.collection_versions.find({"_id": {"$in": list(collections)}}).to_list(None)
+    counters = {v["_id"]: v["version"] for v in versions}
+    return not_modified(request, response, 'W/"' + "-".join(str(counters.get(name, 0)) for name in collections) + '"')
+
+def document_etag(document: dict, *related: Optional[dict]) -> str:
+    """Strong ETag "<id>:<version>" for one document, which PUT accepts back as If-Match.
+
+    Versions of `related` documents embedded in the response are appended so
+    their edits change the tag too.
+    """
+    versions = [document.get("version") or 0, *((r or {}).get("version") or 0 for r in related)]
+    return '"' + document["id"] + ":" + ":".join(map(str, versions)) + '"'
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """304 if If-None-Match matches `etag`; otherwise set ETag on the response"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # Weak comparison: W/"x" and "x" are equivalent
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags or etag.removeprefix("W/") in tags:
+            return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# ============== SPARSE FIELDS ==============
+
+def select_fields(fields: Optional[str], model: type) -> Optional[tuple]:
+    """Parse ?fields=a,b against a response model; "id" is always returned"""
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(["id", *requested]))
+
+def field_projection(selected: Optional[tuple], *dependencies: str) -> dict:
+    """Mongo projection for the selected fields plus any they are computed from"""
+    if not selected:
+        return {"_id": 0}
+    return {"_id": 0, **{f: 1 for f in (*selected, *dependencies)}}
 
 # ============== AUTH ROUTES ==============
 
@@ -325,12 +448,19 @@ async def get_me(current_user: dict = Depends(get_current_user)):
 
 @api_router.get("/clients", response_model=List[ClientResponse])
 async def get_clients(
+    request: Request,
+    response: Response,
     status: Optional[str] = None,
     tier: Optional[str] = None,
     industry: Optional[str] = None,
     search: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
+    selected = select_fields(fields, ClientResponse)
+    if cached := await conditional_get(request, response, "clients"):
+        return cached
+    
     query = {}
     if status:
         query["status"] = status
@@ -344,15 +474,24 @@ async def get_clients(
             {"email": {"$regex": search, "$options": "i"}}
         ]
     
-    clients = await db.clients.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return [ClientResponse(**c) for c in clients]
+    clients = await db.clients.find(query, field_projection(selected)).sort("created_at", -1).to_list(1000)
+    return model_response(clients, ClientResponse, response, selected)
 
 @api_router.get("/clients/{client_id}", response_model=ClientResponse)
-async def get_client(client_id: str, current_user: dict = Depends(get_current_user)):
-    client = await db.clients.find_one({"id": client_id}, {"_id": 0})
+async def get_client(
+    client_id: str,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    selected = select_fields(fields, ClientResponse)
+    client = await db.clients.find_one({"id": client_id}, field_projection(selected, "version"))
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
-    return ClientResponse(**client)
+    if cached := not_modified(request, response, document_etag(client)):
+        return cached
+    return model_response(client, ClientResponse, response, selected)
 
 @api_router.post("/clients", response_model=ClientResponse)
 async def create_client(client: ClientCreate, current_user: dict = Depends(get_current_user)):
@@ -365,19 +504,21 @@ async def create_client(client: ClientCreate, current_user: dict = Depends(get_c
         "created_at": now
     }
     await db.clients.insert_one(client_doc)
+    await bump_collection_versions("clients")
     return ClientResponse(**{k: v for k, v in client_doc.items() if k != "_id"})
 
 @api_router.put("/clients/{client_id}", response_model=ClientResponse)
-async def update_client(client_id: str, update: ClientUpdate, current_user: dict = Depends(get_current_user)):
+async def update_client(
+    client_id: str,
+    update: ClientUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    result = await db.clients.update_one({"id": client_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Client not found")
-    
-    client = await db.clients.find_one({"id": client_id}, {"_id": 0})
+    client = await update_document(db.clients, {"id": client_id}, update_data, "Client not found", if_match=if_match)
     return ClientResponse(**client)
 
 @api_router.delete("/clients/{client_id}")
@@ -385,6 +526,7 @@ async def delete_client(client_id: str, current_user: dict = Depends(get_current
     result = await db.clients.delete_one({"id": client_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Client not found")
+    await bump_collection_versions("clients")
     return {"message": "Client deleted"}
 
 # ============== CLIENT DETAIL ROUTES ==============
@@ -403,8 +545,11 @@ class ClientNoteResponse(BaseModel):
     created_at: str
 
 @api_router.get("/clients/{client_id}/orders")
-async def get_client_orders(client_id: str, current_user: dict = Depends(get_current_user)):
+async def get_client_orders(client_id: str, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get all orders for a specific client"""
+    if cached := await conditional_get(request, response, "orders"):
+        return cached
+    
     orders = await db.orders.find({"client_id": client_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
     
     # Enrich orders with calculated totals
@@ -415,8 +560,11 @@ async def get_client_orders(client_id: str, current_user: dict = Depends(get_cur
     return orders
 
 @api_router.get("/clients/{client_id}/deals")
-async def get_client_deals(client_id: str, current_user: dict = Depends(get_current_user)):
+async def get_client_deals(client_id: str, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get all deals/pipeline items for a specific client"""
+    if cached := await conditional_get(request, response, "clients", "deals"):
+        return cached
+    
     # First get client name
     client = await db.clients.find_one({"id": client_id}, {"_id": 0, "name": 1})
     if not client:
@@ -426,10 +574,13 @@ async def get_client_deals(client_id: str, current_user: dict = Depends(get_curr
     return deals
 
 @api_router.get("/clients/{client_id}/notes", response_model=List[ClientNoteResponse])
-async def get_client_notes(client_id: str, current_user: dict = Depends(get_current_user)):
+async def get_client_notes(client_id: str, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """Get all notes/activity log for a specific client"""
+    if cached := await conditional_get(request, response, "client_notes"):
+        return cached
+    
     notes = await db.client_notes.find({"client_id": client_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return [ClientNoteResponse(**n) for n in notes]
+    return model_response(notes, ClientNoteResponse, response)
 
 @api_router.post("/clients/{client_id}/notes", response_model=ClientNoteResponse)
 async def create_client_note(client_id: str, note: ClientNoteCreate, current_user: dict = Depends(get_current_user)):
@@ -451,6 +602,7 @@ async def create_client_note(client_id: str, note: ClientNoteCreate, current_use
         "created_at": now
     }
     await db.client_notes.insert_one(note_doc)
+    await bump_collection_versions("client_notes")
     return ClientNoteResponse(**{k: v for k, v in note_doc.items() if k != "_id"})
 
 @api_router.delete("/clients/{client_id}/notes/{note_id}")
@@ -459,17 +611,25 @@ async def delete_client_note(client_id: str, note_id: str, current_user: dict =
     result = await db.client_notes.delete_one({"id": note_id, "client_id": client_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Note not found")
+    await bump_collection_versions("client_notes")
     return {"message": "Note deleted"}
 
 # ============== PRODUCT ROUTES ==============
 
 @api_router.get("/products", response_model=List[ProductResponse])
 async def get_products(
+    request: Request,
+    response: Response,
     category: Optional[str] = None,
     badge: Optional[str] = None,
     search: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
+    selected = select_fields(fields, ProductResponse)
+    if cached := await conditional_get(request, response, "products"):
+        return cached
+    
     query = {}
     if category and category != "all":
         query["category"] = category
@@ -481,15 +641,24 @@ async def get_products(
             {"description": {"$regex": search, "$options": "i"}}
         ]
     
-    products = await db.products.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return [ProductResponse(**p) for p in products]
+    products = await db.products.find(query, field_projection(selected)).sort("created_at", -1).to_list(1000)
+    return model_response(products, ProductResponse, response, selected)
 
 @api_router.get("/products/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: str, current_user: dict = Depends(get_current_user)):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
+async def get_product(
+    product_id: str,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    selected = select_fields(fields, ProductResponse)
+    product = await db.products.find_one({"id": product_id}, field_projection(selected, "version"))
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return ProductResponse(**product)
+    if cached := not_modified(request, response, document_etag(product)):
+        return cached
+    return model_response(product, ProductResponse, response, selected)
 
 @api_router.post("/products", response_model=ProductResponse)
 async def create_product(product: ProductCreate, current_user: dict = Depends(get_current_user)):
@@ -503,19 +672,21 @@ async def create_product(product: ProductCreate, current_user: dict = Depends(ge
         "created_at": now
     }
     await db.products.insert_one(product_doc)
+    await bump_collection_versions("products")
     return ProductResponse(**{k: v for k, v in product_doc.items() if k != "_id"})
 
 @api_router.put("/products/{product_id}", response_model=ProductResponse)
-async def update_product(product_id: str, update: ProductUpdate, current_user: dict = Depends(get_current_user)):
+async def update_product(
+    product_id: str,
+    update: ProductUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    result = await db.products.update_one({"id": product_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
+    product = await update_document(db.products, {"id": product_id}, update_data, "Product not found", if_match=if_match)
     return ProductResponse(**product)
 
 @api_router.delete("/products/{product_id}")
@@ -523,6 +694,7 @@ async def delete_product(product_id: str, current_user: dict = Depends(get_curre
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await bump_collection_versions("products")
     return {"message": "Product deleted"}
 
 # ============== ORDER ROUTES ==============
@@ -537,6 +709,18 @@ def calculate_order_totals(line_items: list, tax_rate: float = 8.5):
     total = round(subtotal + tax_amount, 2)
     return subtotal, tax_amount, total
 
+# Stored fields each computed OrderResponse field is derived from
+ORDER_FIELD_DEPENDENCIES = {
+    "subtotal": ("line_items", "tax_rate"),
+    "tax_amount": ("line_items", "tax_rate"),
+    "total": ("line_items", "tax_rate"),
+    "client_name": ("client_id",),
+}
+
+def order_projection(selected: Optional[tuple], *dependencies: str) -> dict:
+    dependencies = [*dependencies, *(d for f in selected or () for d in ORDER_FIELD_DEPENDENCIES.get(f, ()))]
+    return field_projection(selected, *dependencies)
+
 def enrich_order_response(order: dict) -> dict:
     """Add calculated fields and ensure all required fields exist"""
     line_items = order.get('line_items', [])
@@ -553,12 +737,20 @@ def enrich_order_response(order: dict) -> dict:
 
 @api_router.get("/orders", response_model=List[OrderResponse])
 async def get_orders(
+    request: Request,
+    response: Response,
     status: Optional[str] = None,
     priority: Optional[str] = None,
     search: Optional[str] = None,
     client_id: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
+    selected = select_fields(fields, OrderResponse)
+    # Orders embed the client name, so client edits also invalidate the list
+    if cached := await conditional_get(request, response, "orders", "clients"):
+        return cached
+    
     query = {}
     if status and status != "all":
         query["status"] = status
@@ -572,29 +764,44 @@ async def get_orders(
             {"line_items.product_name": {"$regex": search, "$options": "i"}}
         ]
     
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    orders = await db.orders.find(query, order_projection(selected)).sort("created_at", -1).to_list(1000)
     
-    # Enrich with client names and calculated totals
+    # Enrich with client names (one query for all of them) and calculated totals
+    with_client_name = not selected or "client_name" in selected
+    client_ids = list({order["client_id"] for order in orders if order.get("client_id")}) if with_client_name else []
+    client_names = {}
+    if client_ids:
+        clients = await db.clients.find({"id": {"$in": client_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+        client_names = {client["id"]: client["name"] for client in clients}
     for order in orders:
-        if order.get("client_id"):
-            client = await db.clients.find_one({"id": order["client_id"]}, {"_id": 0, "name": 1})
-            order["client_name"] = client["name"] if client else "Unknown"
-        order = enrich_order_response(order)
+        if with_client_name and order.get("client_id"):
+            order["client_name"] = client_names.get(order["client_id"], "Unknown")
+        enrich_order_response(order)
     
-    return [OrderResponse(**o) for o in orders]
+    return model_response(orders, OrderResponse, response, selected)
 
 @api_router.get("/orders/{order_id}", response_model=OrderResponse)
-async def get_order(order_id: str, current_user: dict = Depends(get_current_user)):
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+async def get_order(
+    order_id: str,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    selected = select_fields(fields, OrderResponse)
+    order = await db.orders.find_one({"id": order_id}, order_projection(selected, "version"))
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    if order.get("client_id"):
-        client = await db.clients.find_one({"id": order["client_id"]}, {"_id": 0, "name": 1})
+    client = None
+    if (not selected or "client_name" in selected) and order.get("client_id"):
+        client = await db.clients.find_one({"id": order["client_id"]}, {"_id": 0, "name": 1, "version": 1})
         order["client_name"] = client["name"] if client else "Unknown"
+    if cached := not_modified(request, response, document_etag(order, client)):
+        return cached
     
     order = enrich_order_response(order)
-    return OrderResponse(**order)
+    return model_response(order, OrderResponse, response, selected)
 
 @api_router.post("/orders", response_model=OrderResponse)
 async def create_order(order: OrderCreate, current_user: dict = Depends(get_current_user)):
@@ -630,8 +837,9 @@ async def create_order(order: OrderCreate, current_user: dict = Depends(get_curr
     # Update client's last order date and order count
     await db.clients.update_one(
         {"id": order.client_id},
-        {"$set": {"last_order_date": now}, "$inc": {"total_orders": 1, "total_revenue": total}}
+        {"$set": {"last_order_date": now}, "$inc": {"total_orders": 1, "total_revenue": total, "version": 1}}
     )
+    await bump_collection_versions("orders", "clients")
     
     order_doc["client_name"] = None
     if order.client_id:
@@ -641,7 +849,12 @@ async def create_order(order: OrderCreate, current_user: dict = Depends(get_curr
     return OrderResponse(**{k: v for k, v in order_doc.items() if k != "_id"})
 
 @api_router.put("/orders/{order_id}", response_model=OrderResponse)
-async def update_order(order_id: str, update: OrderUpdate, current_user: dict = Depends(get_current_user)):
+async def update_order(
+    order_id: str,
+    update: OrderUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
     update_data = {}
     
     # Handle line items specially to recalculate totals
@@ -665,11 +878,7 @@ async def update_order(order_id: str, update: OrderUpdate, current_user: dict =
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    result = await db.orders.update_one({"id": order_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    order = await update_document(db.orders, {"id": order_id}, update_data, "Order not found", if_match=if_match)
     if order.get("client_id"):
         client = await db.clients.find_one({"id": order["client_id"]}, {"_id": 0, "name": 1})
         order["client_name"] = client["name"] if client else "Unknown"
@@ -682,17 +891,25 @@ async def delete_order(order_id: str, current_user: dict = Depends(get_current_u
     result = await db.orders.delete_one({"id": order_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Order not found")
+    await bump_collection_versions("orders")
     return {"message": "Order deleted"}
 
 # ============== DEAL/PIPELINE ROUTES ==============
 
 @api_router.get("/deals", response_model=List[DealResponse])
 async def get_deals(
+    request: Request,
+    response: Response,
     stage: Optional[str] = None,
     priority: Optional[str] = None,
     search: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
+    selected = select_fields(fields, DealResponse)
+    if cached := await conditional_get(request, response, "deals"):
+        return cached
+    
     query = {}
     if stage:
         query["stage"] = stage
@@ -704,15 +921,25 @@ async def get_deals(
             {"product_description": {"$regex": search, "$options": "i"}}
         ]
     
-    deals = await db.deals.find(query, {"_id": 0}).sort("date_entered", -1).to_list(1000)
-    return [DealResponse(**d) for d in deals]
+    # Cards without a persisted position (never reordered) come first, newest on top
+    deals = await db.deals.find(query, field_projection(selected)).sort([("position", 1), ("date_entered", -1)]).to_list(1000)
+    return model_response(deals, DealResponse, response, selected)
 
 @api_router.get("/deals/{deal_id}", response_model=DealResponse)
-async def get_deal(deal_id: str, current_user: dict = Depends(get_current_user)):
-    deal = await db.deals.find_one({"id": deal_id}, {"_id": 0})
+async def get_deal(
+    deal_id: str,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    selected = select_fields(fields, DealResponse)
+    deal = await db.deals.find_one({"id": deal_id}, field_projection(selected, "version"))
     if not deal:
         raise HTTPException(status_code=404, detail="Deal not found")
-    return DealResponse(**deal)
+    if cached := not_modified(request, response, document_etag(deal)):
+        return cached
+    return model_response(deal, DealResponse, response, selected)
 
 @api_router.post("/deals", response_model=DealResponse)
 async def create_deal(deal: DealCreate, current_user: dict = Depends(get_current_user)):
@@ -722,34 +949,93 @@ async def create_deal(deal: DealCreate, current_user: dict = Depends(get_current
         "id": deal_id,
         **deal.model_dump(),
         "date_entered": now,
+        "stage_entered_at": now,
         "date_closed": None,
         "loss_reason": None
     }
     await db.deals.insert_one(deal_doc)
+    await bump_collection_versions("deals")
+    await record_stage_transitions([(deal_id, None, deal.stage)], now, current_user)
     return DealResponse(**{k: v for k, v in deal_doc.items() if k != "_id"})
 
 @api_router.put("/deals/{deal_id}", response_model=DealResponse)
-async def update_deal(deal_id: str, update: DealUpdate, current_user: dict = Depends(get_current_user)):
+async def update_deal(
+    deal_id: str,
+    update: DealUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    # Set date_closed if stage is won or lost
-    if update.stage in ["won", "lost"]:
-        update_data["date_closed"] = datetime.now(timezone.utc).isoformat()
-    
-    result = await db.deals.update_one({"id": deal_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Deal not found")
+    if update.stage:
+        # Only a real stage change restarts the dwell clock. The pre-update
+        # document tells us which stage the deal is leaving; the $set is
+        # replayed on it to build the response without another read.
+        now = datetime.now(timezone.utc).isoformat()
+        changes = {**update_data, **deal_stage_fields(update.stage, now)}
+        previous = await db.deals.find_one_and_update(
+            {"id": deal_id, "stage": {"$ne": update.stage}, **version_filter(if_match, deal_id)},
+            {"$set": changes, "$inc": {"version": 1}},
+            projection={"_id": 0}
+        )
+        if previous:
+            await bump_collection_versions("deals")
+            await record_stage_transitions([(deal_id, previous, update.stage)], now, current_user)
+            return DealResponse(**{**previous, **changes, "version": previous.get("version", 0) + 1})
     
-    deal = await db.deals.find_one({"id": deal_id}, {"_id": 0})
+    deal = await update_document(db.deals, {"id": deal_id}, update_data, "Deal not found", if_match=if_match)
     return DealResponse(**deal)
 
+@api_router.patch("/deals/bulk", response_model=DealBulkResult)
+async def bulk_update_deals(update: DealBulkUpdate, current_user: dict = Depends(get_current_user)):
+    """Apply many Kanban stage/position changes in a single bulk write"""
+    if not update.moves:
+        raise HTTPException(status_code=400, detail="No moves to apply")
+    
+    deal_ids = list(dict.fromkeys(move.id for move in update.moves))
+    current = await db.deals.find(
+        {"id": {"$in": deal_ids}}, {**STAGE_TRANSITION_PROJECTION, "id": 1}
+    ).to_list(None)
+    previous = {d["id"]: d for d in current}
+    
+    now = datetime.now(timezone.utc).isoformat()
+    operations = []
+    transitions = []
+    for move in update.moves:
+        deal = previous.get(move.id)
+        if deal is None:
+            continue
+        fields = {}
+        if move.position is not None:
+            fields["position"] = move.position
+        if move.stage and move.stage != deal.get("stage"):
+            fields.update(deal_stage_fields(move.stage, now))
+            transitions.append((move.id, dict(deal), move.stage))
+            deal.update(stage=move.stage, stage_entered_at=now)
+        if fields:
+            operations.append(UpdateOne({"id": move.id}, {"$set": fields, "$inc": {"version": 1}}))
+    
+    if operations:
+        await db.deals.bulk_write(operations)
+        await bump_collection_versions("deals")
+    if transitions:
+        await record_stage_transitions(transitions, now, current_user)
+    
+    deals = await db.deals.find({"id": {"$in": list(previous)}}, {"_id": 0}).to_list(None)
+    by_id = {d["id"]: d for d in deals}
+    return DealBulkResult(
+        updated=[DealResponse(**by_id[i]) for i in deal_ids if i in by_id],
+        not_found=[i for i in deal_ids if i not in previous]
+    )
+
 @api_router.delete("/deals/{deal_id}")
 async def delete_deal(deal_id: str, current_user: dict = Depends(get_current_user)):
     result = await db.deals.delete_one({"id": deal_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Deal not found")
+    await bump_collection_versions("deals")
     return {"message": "Deal deleted"}
 
 # ============== DASHBOARD ROUTES ==============
@@ -757,13 +1043,13 @@ async def delete_deal(deal_id: str, current_user: dict = Depends(get_current_use
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     # Get total revenue from orders
-    orders = await db.orders.find({}, {"_id": 0, "amount": 1, "status": 1, "created_at": 1}).to_list(1000)
+    orders = await db.analytics.orders.find({}, {"_id": 0, "amount": 1, "status": 1, "created_at": 1}).to_list(1000)
     total_revenue = sum(o.get("amount", 0) for o in orders)
     open_orders = len([o for o in orders if o.get("status") not in ["delivered", "cancelled"]])
     
     # Get new clients (last 30 days)
     thirty_days_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
-    clients = await db.clients.find({}, {"_id": 0, "created_at": 1}).to_list(1000)
+    clients = await db.analytics.clients.find({}, {"_id": 0, "created_at": 1}).to_list(1000)
     new_clients = len([c for c in clients if c.get("created_at", "") >= thirty_days_ago])
     
     # Calculate avg order value
@@ -782,7 +1068,7 @@ async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
 
 @api_router.get("/dashboard/pipeline-summary", response_model=PipelineSummary)
 async def get_pipeline_summary(current_user: dict = Depends(get_current_user)):
-    deals = await db.deals.find({}, {"_id": 0, "stage": 1, "amount": 1}).to_list(1000)
+    deals = await db.analytics.deals.find({}, {"_id": 0, "stage": 1, "amount": 1}).to_list(1000)
     
     summary = {"prospecting": 0, "proposal": 0, "negotiation": 0, "won": 0, "lost": 0}
     for deal in deals:
@@ -804,9 +1090,327 @@ async def get_sales_trend(current_user: dict = Depends(get_current_user)):
 
 @api_router.get("/dashboard/recent-deals")
 async def get_recent_deals(current_user: dict = Depends(get_current_user)):
-    deals = await db.deals.find({}, {"_id": 0}).sort("date_entered", -1).limit(10).to_list(10)
+    deals = await db.analytics.deals.find({}, {"_id": 0}).sort("date_entered", -1).limit(10).to_list(10)
     return deals
 
+# ============== PIPELINE FORECAST ==============
+
+OPEN_STAGES = ["prospecting", "proposal", "negotiation"]
+
+# Typical stage-to-won rates, used as a Bayesian prior until enough deals have closed
+DEFAULT_STAGE_PROBABILITIES = {"prospecting": 0.1, "proposal": 0.3, "negotiation": 0.6}
+FORECAST_PRIOR_WEIGHT = 10  # pseudo-deals backing the prior
+DEFAULT_SALES_CYCLE_DAYS = 30
+FORECAST_RECALIBRATE_SECONDS = int(os.environ.get('FORECAST_RECALIBRATE_SECONDS', 3600))
+
+# Cached calibration, refreshed by forecast_recalibration_loop
+forecast_model: dict = {}
+
+class ForecastBucket(BaseModel):
+    month: Optional[str] = None
+    owner: Optional[str] = None
+    expected_revenue: float
+    deal_count: int
+
+class PipelineForecast(BaseModel):
+    calibrated_at: str
+    sample_size: int
+    sales_cycle_days: float
+    probabilities: dict
+    total_expected: float
+    by_month: List[ForecastBucket]
+    by_owner: List[ForecastBucket]
+    by_month_owner: List[ForecastBucket]
+
+def to_datetime64(values: list) -> np.ndarray:
+    """Parse stored UTC ISO timestamps into a datetime64[s] array (missing -> NaT)"""
+    return np.array([v[:19] if v else "NaT" for v in values], dtype="datetime64[s]")
+
+def prior_loss_share() -> dict:
+    """Fraction of lost deals expected to have reached each stage under the prior.
+
+    Deals lost before the stage history existed do not record the stage they
+    dropped out of, so their losses are apportioned with the shape implied by
+    the prior probabilities.
+    """
+    first = DEFAULT_STAGE_PROBABILITIES[OPEN_STAGES[0]]
+    reach = {s: first / DEFAULT_STAGE_PROBABILITIES[s] for s in OPEN_STAGES}
+    total_lost = 1 - first
+    return {s: (reach[s] - first) / total_lost for s in OPEN_STAGES}
+
+async def calibrate_forecast_model() -> dict:
+    """Derive stage-to-won probabilities and the sales cycle length from closed deals"""
+    closed = await db.analytics.deals.find(
+        {"stage": {"$in": ["won", "lost"]}},
+        {"_id": 0, "stage": 1, "date_entered": 1, "date_closed": 1}
+    ).to_list(None)
+
+    won = [d for d in closed if d["stage"] == "won"]
+    won_count = len(won) + FORECAST_PRIOR_WEIGHT * DEFAULT_STAGE_PROBABILITIES[OPEN_STAGES[0]]
+    lost_count = len(closed) - len(won)
+
+    # Losses recorded in the stage history tell us exactly how far a deal got
+    lost_from = await db.analytics.deal_stage_history.find(
+        {"to_stage": "lost", "from_stage": {"$in": OPEN_STAGES}},
+        {"_id": 0, "from_stage": 1}
+    ).to_list(None)
+    known_losses = np.bincount(
+        [OPEN_STAGES.index(t["from_stage"]) for t in lost_from], minlength=len(OPEN_STAGES)
+    )
+    unknown_lost = max(lost_count - int(known_losses.sum()), 0)
+    unknown_lost += FORECAST_PRIOR_WEIGHT * (1 - DEFAULT_STAGE_PROBABILITIES[OPEN_STAGES[0]])
+
+    loss_share = prior_loss_share()
+    probabilities = {}
+    for i, stage in enumerate(OPEN_STAGES):
+        lost_after = known_losses[i:].sum() + unknown_lost * loss_share[stage]
+        probabilities[stage] = round(float(won_count / (won_count + lost_after)), 4)
+
+    cycle_days = DEFAULT_SALES_CYCLE_DAYS
+    if won:
+        durations = (
+            to_datetime64([d.get("date_closed") for d in won])
+            - to_datetime64([d.get("date_entered") for d in won])
+        ).astype("timedelta64[s]").astype(float) / 86400
+        durations = durations[~np.isnan(durations) & (durations >= 0)]
+        if durations.size:
+            cycle_days = float(np.median(durations))
+
+    forecast_model.update({
+        "probabilities": probabilities,
+        "sales_cycle_days": round(cycle_days, 2),
+        "sample_size": len(closed),
+        "calibrated_at": datetime.now(timezone.utc).isoformat()
+    })
+    return forecast_model
+
+async def forecast_recalibration_loop():
+    while True:
+        try:
+            await calibrate_forecast_model()
+        except Exception:
+            logger.exception("Forecast recalibration failed")
+        await asyncio.sleep(FORECAST_RECALIBRATE_SECONDS)
+
+def group_sum(keys: np.ndarray, values: np.ndarray):
+    """Sum values per distinct key, returning (keys, sums, counts) sorted by key"""
+    if keys.size == 0:
+        return [], [], []
+    unique, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=unique.size)
+    counts = np.bincount(inverse, minlength=unique.size)
+    return unique.tolist(), sums.tolist(), counts.tolist()
+
+@api_router.get("/forecast/pipeline", response_model=PipelineForecast)
+async def get_pipeline_forecast(current_user: dict = Depends(get_current_user)):
+    """Expected revenue of open deals by close month and owner"""
+    model = forecast_model or await calibrate_forecast_model()
+
+    deals = await db.analytics.deals.find(
+        {"stage": {"$in": OPEN_STAGES}},
+        {"_id": 0, "amount": 1, "stage": 1, "owner_initials": 1, "date_entered": 1}
+    ).to_list(None)
+
+    amounts = np.array([d.get("amount", 0) or 0 for d in deals], dtype=float)
+    stage_index = np.array([OPEN_STAGES.index(d["stage"]) for d in deals], dtype=int)
+    probabilities = np.array([model["probabilities"][s] for s in OPEN_STAGES])
+    expected = amounts * probabilities[stage_index]
+
+    # Expected close = entry + median cycle; overdue deals are expected this month
+    now = np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), "s")
+    cycle = np.timedelta64(int(model["sales_cycle_days"] * 86400), "s")
+    close = to_datetime64([d.get("date_entered") for d in deals]) + cycle
+    close = np.where(np.isnat(close) | (close < now), now, close)
+
+    months = close.astype("datetime64[M]").astype(str)
+    owners = np.array([d.get("owner_initials") or "--" for d in deals], dtype=str)
+    month_owners = np.char.add(np.char.add(months, "|"), owners)
+
+    by_month = [
+        ForecastBucket(month=k, expected_revenue=round(v, 2), deal_count=c)
+        for k, v, c in zip(*group_sum(months, expected))
+    ]
+    by_owner = [
+        ForecastBucket(owner=k, expected_revenue=round(v, 2), deal_count=c)
+        for k, v, c in zip(*group_sum(owners, expected))
+    ]
+    by_month_owner = [
+        ForecastBucket(month=k.split("|")[0], owner=k.split("|")[1], expected_revenue=round(v, 2), deal_count=c)
+        for k, v, c in zip(*group_sum(month_owners, expected))
+    ]
+
+    return PipelineForecast(
+        calibrated_at=model["calibrated_at"],
+        sample_size=model["sample_size"],
+        sales_cycle_days=model["sales_cycle_days"],
+        probabilities=model["probabilities"],
+        total_expected=round(float(expected.sum()), 2),
+        by_month=by_month,
+        by_owner=by_owner,
+        by_month_owner=by_month_owner
+    )
+
+@api_router.post("/forecast/recalibrate")
+async def recalibrate_forecast(current_user: dict = Depends(get_current_user)):
+    model = await calibrate_forecast_model()
+    return {"message": "Forecast recalibrated", **model}
+
+# ============== PIPELINE VELOCITY ==============
+
+CLOSED_STAGES = ["won", "lost"]
+PIPELINE_STAGES = OPEN_STAGES + CLOSED_STAGES
+
+# Upper bounds (in days) of the dwell-time histogram buckets
+DWELL_BUCKETS = [(1, "lt_1d"), (3, "1_3d"), (7, "3_7d"), (14, "7_14d"), (30, "14_30d"), (60, "30_60d"), (90, "60_90d")]
+DWELL_OVERFLOW_BUCKET = "gte_90d"
+
+STAGE_TRANSITION_PROJECTION = {"_id": 0, "stage": 1, "stage_entered_at": 1, "date_entered": 1}
+
+class StageTransitionResponse(BaseModel):
+    id: str
+    deal_id: str
+    from_stage: Optional[str]
+    to_stage: str
+    changed_at: str
+    changed_by: Optional[str]
+    dwell_seconds: Optional[float]
+
+class StageVelocity(BaseModel):
+    stage: str
+    entered: int
+    exited: int
+    conversion_from_previous: Optional[float]
+    avg_dwell_days: Optional[float]
+    dwell_histogram: dict
+
+class PipelineVelocity(BaseModel):
+    start: str
+    end: str
+    win_rate: Optional[float]
+    stages: List[StageVelocity]
+
+def dwell_bucket(dwell_seconds: float) -> str:
+    days = dwell_seconds / 86400
+    for upper, label in DWELL_BUCKETS:
+        if days < upper:
+            return label
+    return DWELL_OVERFLOW_BUCKET
+
+def deal_stage_fields(stage: str, now: str) -> dict:
+    """Fields that move with the stage: dwell clock restarts, date_closed tracks closure"""
+    return {
+        "stage": stage,
+        "stage_entered_at": now,
+        "date_closed": now if stage in CLOSED_STAGES else None
+    }
+
+async def record_stage_transitions(transitions: list, now: str, user: Optional[dict] = None):
+    """Append stage transitions and fold them into the daily per-stage rollups.
+
+    transitions holds (deal_id, previous deal document or None, to_stage).
+    pipeline_stats holds one document per (day, stage) with $inc-maintained
+    counters, so funnel queries read a handful of rollups instead of the deals.
+    """
+    history = []
+    rollups = {}
+    for deal_id, previous, to_stage in transitions:
+        from_stage = previous.get("stage") if previous else None
+        entered_at = (previous.get("stage_entered_at") or previous.get("date_entered")) if previous else None
+        dwell_seconds = None
+        if entered_at:
+            dwell_seconds = max((datetime.fromisoformat(now) - datetime.fromisoformat(entered_at)).total_seconds(), 0)
+
+        history.append({
+            "id": str(uuid.uuid4()),
+            "deal_id": deal_id,
+            "from_stage": from_stage,
+            "to_stage": to_stage,
+            "changed_at": now,
+            "changed_by": user["id"] if user else None,
+            "dwell_seconds": dwell_seconds
+        })
+
+        entered = rollups.setdefault(to_stage, {})
+        entered["entered"] = entered.get("entered", 0) + 1
+        if from_stage:
+            exited = rollups.setdefault(from_stage, {})
+            increments = {"exited": 1}
+            if dwell_seconds is not None:
+                increments.update({
+                    "dwell_seconds_total": dwell_seconds,
+                    "dwell_samples": 1,
+                    f"dwell_histogram.{dwell_bucket(dwell_seconds)}": 1
+                })
+            for key, value in increments.items():
+                exited[key] = exited.get(key, 0) + value
+
+    if not history:
+        return
+    day = now[:10]
+    await db.deal_stage_history.insert_many(history)
+    await db.pipeline_stats.bulk_write([
+        UpdateOne({"day": day, "stage": stage}, {"$inc": increments}, upsert=True)
+        for stage, increments in rollups.items()
+    ])
+
+@api_router.get("/deals/{deal_id}/history", response_model=List[StageTransitionResponse])
+async def get_deal_history(deal_id: str, current_user: dict = Depends(get_current_user)):
+    """Stage transitions of a deal, oldest first"""
+    transitions = await db.deal_stage_history.find({"deal_id": deal_id}, {"_id": 0}).sort("changed_at", 1).to_list(1000)
+    return model_response(transitions, StageTransitionResponse)
+
+@api_router.get("/analytics/pipeline-velocity", response_model=PipelineVelocity)
+async def get_pipeline_velocity(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stage funnel and dwell-time histograms for transitions within [start, end] (YYYY-MM-DD)"""
+    today = datetime.now(timezone.utc)
+    end = (end or today.isoformat())[:10]
+    start = (start or (today - timedelta(days=90)).isoformat())[:10]
+
+    rows = await db.analytics.pipeline_stats.find({"day": {"$gte": start, "$lte": end}}, {"_id": 0}).to_list(None)
+
+    totals = {
+        stage: {"entered": 0, "exited": 0, "dwell_seconds_total": 0.0, "dwell_samples": 0,
+                "dwell_histogram": {label: 0 for _, label in DWELL_BUCKETS} | {DWELL_OVERFLOW_BUCKET: 0}}
+        for stage in PIPELINE_STAGES
+    }
+    for row in rows:
+        bucket = totals.get(row["stage"])
+        if bucket is None:
+            continue
+        for key in ["entered", "exited", "dwell_seconds_total", "dwell_samples"]:
+            bucket[key] += row.get(key, 0)
+        for label, count in row.get("dwell_histogram", {}).items():
+            bucket["dwell_histogram"][label] = bucket["dwell_histogram"].get(label, 0) + count
+
+    stages = []
+    previous_entered = None
+    for stage in PIPELINE_STAGES:
+        bucket = totals[stage]
+        conversion = None
+        if stage != "lost" and previous_entered:
+            conversion = round(bucket["entered"] / previous_entered, 4)
+        avg_dwell = None
+        if bucket["dwell_samples"]:
+            avg_dwell = round(bucket["dwell_seconds_total"] / bucket["dwell_samples"] / 86400, 2)
+        stages.append(StageVelocity(
+            stage=stage,
+            entered=bucket["entered"],
+            exited=bucket["exited"],
+            conversion_from_previous=conversion,
+            avg_dwell_days=avg_dwell,
+            dwell_histogram=bucket["dwell_histogram"]
+        ))
+        if stage in OPEN_STAGES:
+            previous_entered = bucket["entered"]
+
+    closed = totals["won"]["entered"] + totals["lost"]["entered"]
+    win_rate = round(totals["won"]["entered"] / closed, 4) if closed else None
+    return PipelineVelocity(start=start, end=end, win_rate=win_rate, stages=stages)
+
 # ============== SEED DATA ==============
 
 @api_router.post("/seed")
@@ -931,9 +1535,114 @@ async def seed_database():
         })
     
     await db.deals.insert_many(deals_data)
+    await bump_collection_versions("clients", "products", "orders", "deals")
     
     return {"message": "Database seeded successfully", "seeded": True}
 
+# ============== SYNTHETIC DATA ==============
+
+class SyntheticDataJob(BaseModel):
+    id: str
+    status: str
+    spec: SyntheticDataSpec
+    inserted: dict = {}
+    started_at: str
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+
+# Jobs started by this process, newest last
+synthetic_data_jobs: dict = {}
+
+async def run_synthetic_data_job(job: dict):
+    try:
+        counts = await generate_dataset(db, job["spec"], lambda collection, inserted: job["inserted"].update({collection: inserted}))
+        job["inserted"] = counts
+        job["status"] = "completed"
+    except Exception as e:
+        logger.exception("Synthetic data job %s failed", job["id"])
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+        if job["inserted"]:
+            await bump_collection_versions(*job["inserted"])
+
+@api_router.post("/admin/synthetic-data", response_model=SyntheticDataJob, status_code=202)
+async def start_synthetic_data(spec: SyntheticDataSpec, current_user: dict = Depends(get_current_user)):
+    """Generate a large consistent dataset in the background; poll the returned job for progress"""
+    if any(job["status"] == "running" for job in synthetic_data_jobs.values()):
+        raise HTTPException(status_code=409, detail="A synthetic data job is already running")
+    job = {
+        "id": str(uuid.uuid4()),
+        "status": "running",
+        "spec": spec,
+        "inserted": {},
+        "started_at": datetime.now(timezone.utc).isoformat(),
+    }
+    synthetic_data_jobs[job["id"]] = job
+    job["task"] = asyncio.create_task(run_synthetic_data_job(job))
+    return SyntheticDataJob(**job)
+
+@api_router.get("/admin/synthetic-data/{job_id}", response_model=SyntheticDataJob)
+async def get_synthetic_data_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = synthetic_data_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return SyntheticDataJob(**job)
+
+# ============== SNAPSHOTS ==============
+
+class SnapshotCreate(BaseModel):
+    name: str
+    collections: Optional[List[str]] = None
+
+class SnapshotInfo(BaseModel):
+    name: str
+    created_at: str
+    collections: dict
+
+# Bookkeeping collections that describe the live database rather than its data
+SNAPSHOT_EXCLUDED = {"collection_versions", slow_query_log.collection_name}
+
+@api_router.get("/admin/snapshots", response_model=List[SnapshotInfo])
+async def list_snapshots(current_user: dict = Depends(get_current_user)):
+    return model_response(snapshot_store.list(), SnapshotInfo)
+
+@api_router.post("/admin/snapshots", response_model=SnapshotInfo)
+async def create_snapshot(snapshot: SnapshotCreate, current_user: dict = Depends(get_current_user)):
+    """Capture collections (default: all application data) to a named snapshot, replacing one with the same name"""
+    collections = snapshot.collections or [
+        name for name in await db.list_collection_names()
+        if name not in SNAPSHOT_EXCLUDED and not name.startswith("system.") and "__restore_" not in name
+    ]
+    try:
+        manifest = await snapshot_store.save(db, snapshot.name, collections)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SnapshotInfo(**manifest)
+
+@api_router.post("/admin/snapshots/{name}/restore")
+async def restore_snapshot(name: str, collections: Optional[List[str]] = Query(None), current_user: dict = Depends(get_current_user)):
+    """Swap the snapshot's collections in for the live ones"""
+    try:
+        counts = await snapshot_store.restore(db, name, collections)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await bump_collection_versions(*counts)
+    return {"message": "Snapshot restored", "data": counts}
+
+@api_router.delete("/admin/snapshots/{name}")
+async def delete_snapshot(name: str, current_user: dict = Depends(get_current_user)):
+    try:
+        deleted = snapshot_store.delete(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return {"message": "Snapshot deleted"}
+
 # ============== ROLES & TEAM MANAGEMENT ==============
 
 class RoleCreate(BaseModel):
@@ -950,6 +1659,7 @@ class RoleResponse(BaseModel):
     color: str
     user_count: int = 0
     created_at: str
+    version: int = 0
 
 class RoleUpdate(BaseModel):
     name: Optional[str] = None
@@ -966,6 +1676,7 @@ class TeamMemberResponse(BaseModel):
     initials: str
     status: str = "active"
     created_at: str
+    version: int = 0
 
 class TeamMemberUpdate(BaseModel):
     name: Optional[str] = None
@@ -989,12 +1700,16 @@ DEFAULT_PERMISSIONS = {
 async def get_roles(current_user: dict = Depends(get_current_user)):
     roles = await db.roles.find({}, {"_id": 0}).to_list(100)
     
-    # Count users per role
+    # Count users per role in one round trip
+    counts = await db.users.aggregate([
+        {"$match": {"role_id": {"$in": [role["id"] for role in roles]}}},
+        {"$group": {"_id": "$role_id", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    user_counts = {c["_id"]: c["count"] for c in counts}
     for role in roles:
-        user_count = await db.users.count_documents({"role_id": role["id"]})
-        role["user_count"] = user_count
+        role["user_count"] = user_counts.get(role["id"], 0)
     
-    return [RoleResponse(**r) for r in roles]
+    return model_response(roles, RoleResponse)
 
 @api_router.get("/roles/{role_id}", response_model=RoleResponse)
 async def get_role(role_id: str, current_user: dict = Depends(get_current_user)):
@@ -1031,16 +1746,17 @@ async def create_role(role: RoleCreate, current_user: dict = Depends(get_current
     return RoleResponse(**{k: v for k, v in role_doc.items() if k != "_id"})
 
 @api_router.put("/roles/{role_id}", response_model=RoleResponse)
-async def update_role(role_id: str, update: RoleUpdate, current_user: dict = Depends(get_current_user)):
+async def update_role(
+    role_id: str,
+    update: RoleUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    result = await db.roles.update_one({"id": role_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Role not found")
-    
-    role = await db.roles.find_one({"id": role_id}, {"_id": 0})
+    role = await update_document(db.roles, {"id": role_id}, update_data, "Role not found", if_match=if_match)
     user_count = await db.users.count_documents({"role_id": role_id})
     role["user_count"] = user_count
     
@@ -1062,19 +1778,23 @@ async def delete_role(role_id: str, current_user: dict = Depends(get_current_use
 @api_router.get("/team", response_model=List[TeamMemberResponse])
 async def get_team_members(current_user: dict = Depends(get_current_user)):
     users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(100)
-    return [TeamMemberResponse(**{**u, "status": u.get("status", "active")}) for u in users]
+    return model_response([{**u, "status": u.get("status", "active")} for u in users], TeamMemberResponse)
 
 @api_router.put("/team/{user_id}", response_model=TeamMemberResponse)
-async def update_team_member(user_id: str, update: TeamMemberUpdate, current_user: dict = Depends(get_current_user)):
+async def update_team_member(
+    user_id: str,
+    update: TeamMemberUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
-    result = await db.users.update_one({"id": user_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    user = await update_document(
+        db.users, {"id": user_id}, update_data, "User not found",
+        projection={"password": 0}, if_match=if_match
+    )
     return TeamMemberResponse(**{**user, "status": user.get("status", "active")})
 
 @api_router.post("/team/invite")
@@ -1198,130 +1918,25 @@ async def seed_default_roles():
     await db.roles.insert_many(default_roles)
     return {"message": "Default roles created", "seeded": True, "count": len(default_roles)}
 
-# ============== BROKERS MANAGEMENT ==============
-
-class BrokerCreate(BaseModel):
-    name: str
-    company: str
-    email: EmailStr
-    phone: str = ""
-    territory: str = ""
-    commission_rate: float = 10.0
-    status: str = "active"
-    notes: str = ""
-
-class BrokerResponse(BaseModel):
-    id: str
-    name: str
-    company: str
-    email: str
-    phone: str
-    territory: str
-    commission_rate: float
-    status: str
-    notes: str
-    total_sales: float
-    total_deals: int
-    created_at: str
-
-class BrokerUpdate(BaseModel):
-    name: Optional[str] = None
-    company: Optional[str] = None
-    email: Optional[EmailStr] = None
-    phone: Optional[str] = None
-    territory: Optional[str] = None
-    commission_rate: Optional[float] = None
-    status: Optional[str] = None
-    notes: Optional[str] = None
-
-@api_router.get("/brokers", response_model=List[BrokerResponse])
-async def get_brokers(
-    status: Optional[str] = None,
-    search: Optional[str] = None,
-    current_user: dict = Depends(get_current_user)
-):
-    query = {}
-    if status:
-        query["status"] = status
-    if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"company": {"$regex": search, "$options": "i"}},
-            {"email": {"$regex": search, "$options": "i"}}
-        ]
-    
-    brokers = await db.brokers.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return [BrokerResponse(**b) for b in brokers]
-
-@api_router.get("/brokers/{broker_id}", response_model=BrokerResponse)
-async def get_broker(broker_id: str, current_user: dict = Depends(get_current_user)):
-    broker = await db.brokers.find_one({"id": broker_id}, {"_id": 0})
-    if not broker:
-        raise HTTPException(status_code=404, detail="Broker not found")
-    return BrokerResponse(**broker)
-
-@api_router.post("/brokers", response_model=BrokerResponse)
-async def create_broker(broker: BrokerCreate, current_user: dict = Depends(get_current_user)):
-    broker_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
-    broker_doc = {
-        "id": broker_id,
-        **broker.model_dump(),
-        "total_sales": 0,
-        "total_deals": 0,
-        "created_at": now
-    }
-    await db.brokers.insert_one(broker_doc)
-    return BrokerResponse(**{k: v for k, v in broker_doc.items() if k != "_id"})
-
-@api_router.put("/brokers/{broker_id}", response_model=BrokerResponse)
-async def update_broker(broker_id: str, update: BrokerUpdate, current_user: dict = Depends(get_current_user)):
-    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
-    if not update_data:
-        raise HTTPException(status_code=400, detail="No fields to update")
-    
-    result = await db.brokers.update_one({"id": broker_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Broker not found")
-    
-    broker = await db.brokers.find_one({"id": broker_id}, {"_id": 0})
-    return BrokerResponse(**broker)
-
-@api_router.delete("/brokers/{broker_id}")
-async def delete_broker(broker_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.brokers.delete_one({"id": broker_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Broker not found")
-    return {"message": "Broker deleted"}
-
-@api_router.post("/brokers/{broker_id}/record-sale")
-async def record_broker_sale(
-    broker_id: str,
-    amount: float,
-    current_user: dict = Depends(get_current_user)
-):
-    """Record a sale for a broker"""
-    result = await db.brokers.update_one(
-        {"id": broker_id},
-        {"$inc": {"total_sales": amount, "total_deals": 1}}
-    )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Broker not found")
-    
-    broker = await db.brokers.find_one({"id": broker_id}, {"_id": 0})
-    return BrokerResponse(**broker)
+# ============== DEMO DATA ==============
 
 # Reset and create clean demo data
 @api_router.post("/reset-demo")
 async def reset_demo_data(current_user: dict = Depends(get_current_user)):
     """Clear all data and create clean demo data with one deal per stage"""
+    snapshot = snapshot_store.manifest(DEMO_SNAPSHOT)
+    if snapshot and datetime.fromisoformat(snapshot["created_at"]) > datetime.now(timezone.utc) - timedelta(hours=DEMO_SNAPSHOT_MAX_AGE_HOURS):
+        counts = await snapshot_store.restore(db, DEMO_SNAPSHOT, DEMO_COLLECTIONS)
+        await bump_collection_versions(*DEMO_COLLECTIONS)
+        return {
+            "message": "Demo data reset successfully",
+            "data": {name: counts[name] for name in ("clients", "products", "deals", "orders")},
+            "snapshot": DEMO_SNAPSHOT
+        }
     
-    # Clear existing data (except users and roles)
-    await db.deals.delete_many({})
-    await db.orders.delete_many({})
-    await db.clients.delete_many({})
-    await db.products.delete_many({})
-    await db.brokers.delete_many({})
+    # Clear existing data (except users and roles); dropping is constant time, unlike delete_many
+    await asyncio.gather(*(db[name].drop() for name in DEMO_COLLECTIONS))
+    await ensure_indexes(db)
     
     now = datetime.now(timezone.utc)
     
@@ -1453,6 +2068,8 @@ async def reset_demo_data(current_user: dict = Depends(get_current_user)):
         },
     ]
     await db.orders.insert_many(orders_data)
+    await bump_collection_versions(*DEMO_COLLECTIONS)
+    await snapshot_store.save(db, DEMO_SNAPSHOT, DEMO_COLLECTIONS)
     
     return {
         "message": "Demo data reset successfully",
@@ -1464,230 +2081,6 @@ async def reset_demo_data(current_user: dict = Depends(get_current_user)):
         }
     }
 
-# ============== MESSAGES ==============
-
-class MessageCreate(BaseModel):
-    recipient_id: Optional[str] = None
-    recipient_name: str
-    subject: str
-    content: str
-    message_type: str = "internal"  # internal, client, system
-
-class MessageResponse(BaseModel):
-    id: str
-    sender_id: str
-    sender_name: str
-    recipient_id: Optional[str]
-    recipient_name: str
-    subject: str
-    content: str
-    message_type: str
-    is_read: bool
-    created_at: str
-
-@api_router.get("/messages", response_model=List[MessageResponse])
-async def get_messages(
-    message_type: Optional[str] = None,
-    is_read: Optional[bool] = None,
-    current_user: dict = Depends(get_current_user)
-):
-    query = {"$or": [{"sender_id": current_user["id"]}, {"recipient_id": current_user["id"]}]}
-    if message_type:
-        query["message_type"] = message_type
-    if is_read is not None:
-        query["is_read"] = is_read
-    
-    messages = await db.messages.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return [MessageResponse(**m) for m in messages]
-
-@api_router.post("/messages", response_model=MessageResponse)
-async def create_message(message: MessageCreate, current_user: dict = Depends(get_current_user)):
-    message_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
-    message_doc = {
-        "id": message_id,
-        "sender_id": current_user["id"],
-        "sender_name": current_user["name"],
-        **message.model_dump(),
-        "is_read": False,
-        "created_at": now
-    }
-    await db.messages.insert_one(message_doc)
-    return MessageResponse(**{k: v for k, v in message_doc.items() if k != "_id"})
-
-@api_router.put("/messages/{message_id}/read")
-async def mark_message_read(message_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.messages.update_one({"id": message_id}, {"$set": {"is_read": True}})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Message not found")
-    return {"message": "Message marked as read"}
-
-@api_router.delete("/messages/{message_id}")
-async def delete_message(message_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.messages.delete_one({"id": message_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Message not found")
-    return {"message": "Message deleted"}
-
-# ============== CHANNELS ==============
-
-class ChannelCreate(BaseModel):
-    name: str
-    channel_type: str  # direct, retail, online, wholesale, referral
-    description: str = ""
-    contact_email: str = ""
-    commission_rate: float = 0.0
-    status: str = "active"
-
-class ChannelResponse(BaseModel):
-    id: str
-    name: str
-    channel_type: str
-    description: str
-    contact_email: str
-    commission_rate: float
-    status: str
-    total_revenue: float
-    total_orders: int
-    created_at: str
-
-class ChannelUpdate(BaseModel):
-    name: Optional[str] = None
-    channel_type: Optional[str] = None
-    description: Optional[str] = None
-    contact_email: Optional[str] = None
-    commission_rate: Optional[float] = None
-    status: Optional[str] = None
-
-@api_router.get("/channels", response_model=List[ChannelResponse])
-async def get_channels(
-    status: Optional[str] = None,
-    channel_type: Optional[str] = None,
-    current_user: dict = Depends(get_current_user)
-):
-    query = {}
-    if status:
-        query["status"] = status
-    if channel_type:
-        query["channel_type"] = channel_type
-    
-    channels = await db.channels.find(query, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return [ChannelResponse(**c) for c in channels]
-
-@api_router.post("/channels", response_model=ChannelResponse)
-async def create_channel(channel: ChannelCreate, current_user: dict = Depends(get_current_user)):
-    channel_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
-    channel_doc = {
-        "id": channel_id,
-        **channel.model_dump(),
-        "total_revenue": 0,
-        "total_orders": 0,
-        "created_at": now
-    }
-    await db.channels.insert_one(channel_doc)
-    return ChannelResponse(**{k: v for k, v in channel_doc.items() if k != "_id"})
-
-@api_router.put("/channels/{channel_id}", response_model=ChannelResponse)
-async def update_channel(channel_id: str, update: ChannelUpdate, current_user: dict = Depends(get_current_user)):
-    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
-    if not update_data:
-        raise HTTPException(status_code=400, detail="No fields to update")
-    
-    result = await db.channels.update_one({"id": channel_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Channel not found")
-    
-    channel = await db.channels.find_one({"id": channel_id}, {"_id": 0})
-    return ChannelResponse(**channel)
-
-@api_router.delete("/channels/{channel_id}")
-async def delete_channel(channel_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.channels.delete_one({"id": channel_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Channel not found")
-    return {"message": "Channel deleted"}
-
-# ============== INTEGRATIONS ==============
-
-class IntegrationCreate(BaseModel):
-    name: str
-    integration_type: str  # payment, email, shipping, analytics, crm
-    provider: str
-    api_key: str = ""
-    webhook_url: str = ""
-    settings: dict = {}
-    status: str = "inactive"
-
-class IntegrationResponse(BaseModel):
-    id: str
-    name: str
-    integration_type: str
-    provider: str
-    status: str
-    settings: dict
-    last_sync: Optional[str]
-    created_at: str
-
-class IntegrationUpdate(BaseModel):
-    name: Optional[str] = None
-    api_key: Optional[str] = None
-    webhook_url: Optional[str] = None
-    settings: Optional[dict] = None
-    status: Optional[str] = None
-
-@api_router.get("/integrations", response_model=List[IntegrationResponse])
-async def get_integrations(current_user: dict = Depends(get_current_user)):
-    integrations = await db.integrations.find({}, {"_id": 0, "api_key": 0}).to_list(100)
-    return [IntegrationResponse(**i) for i in integrations]
-
-@api_router.post("/integrations", response_model=IntegrationResponse)
-async def create_integration(integration: IntegrationCreate, current_user: dict = Depends(get_current_user)):
-    integration_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
-    integration_doc = {
-        "id": integration_id,
-        **integration.model_dump(),
-        "last_sync": None,
-        "created_at": now
-    }
-    await db.integrations.insert_one(integration_doc)
-    response_doc = {k: v for k, v in integration_doc.items() if k not in ["_id", "api_key", "webhook_url"]}
-    return IntegrationResponse(**response_doc)
-
-@api_router.put("/integrations/{integration_id}", response_model=IntegrationResponse)
-async def update_integration(integration_id: str, update: IntegrationUpdate, current_user: dict = Depends(get_current_user)):
-    update_data = {k: v for k, v in update.model_dump().items() if v is not None}
-    if not update_data:
-        raise HTTPException(status_code=400, detail="No fields to update")
-    
-    result = await db.integrations.update_one({"id": integration_id}, {"$set": update_data})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Integration not found")
-    
-    integration = await db.integrations.find_one({"id": integration_id}, {"_id": 0, "api_key": 0, "webhook_url": 0})
-    return IntegrationResponse(**integration)
-
-@api_router.delete("/integrations/{integration_id}")
-async def delete_integration(integration_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.integrations.delete_one({"id": integration_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Integration not found")
-    return {"message": "Integration deleted"}
-
-@api_router.post("/integrations/{integration_id}/test")
-async def test_integration(integration_id: str, current_user: dict = Depends(get_current_user)):
-    integration = await db.integrations.find_one({"id": integration_id}, {"_id": 0})
-    if not integration:
-        raise HTTPException(status_code=404, detail="Integration not found")
-    
-    # Simulate test - in production would actually test the API
-    await db.integrations.update_one(
-        {"id": integration_id}, 
-        {"$set": {"last_sync": datetime.now(timezone.utc).isoformat(), "status": "active"}}
-    )
-    return {"success": True, "message": f"Integration {integration['name']} tested successfully"}
-
 # ============== SETTINGS ==============
 
 class SettingsUpdate(BaseModel):
@@ -1738,7 +2131,11 @@ async def get_settings(current_user: dict = Depends(get_current_user)):
     return settings
 
 @api_router.put("/settings")
-async def update_settings(update: SettingsUpdate, current_user: dict = Depends(get_current_user)):
+async def update_settings(
+    update: SettingsUpdate,
+    if_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
     update_data = {k: v for k, v in update.model_dump().items() if v is not None}
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
@@ -1746,54 +2143,286 @@ async def update_settings(update: SettingsUpdate, current_user: dict = Depends(g
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     update_data["updated_by"] = current_user["id"]
     
-    await db.settings.update_one(
-        {"type": "global"},
-        {"$set": update_data},
-        upsert=True
+    settings = await update_document(
+        db.settings, {"type": "global"}, update_data, "Settings not found",
+        if_match=if_match, upsert=True
     )
-    
-    settings = await db.settings.find_one({"type": "global"}, {"_id": 0})
     return settings
 
 # ============== EXPORT ENDPOINTS ==============
 
 @api_router.get("/export/clients")
 async def export_clients(current_user: dict = Depends(get_current_user)):
-    clients = await db.clients.find({}, {"_id": 0}).to_list(1000)
+    clients = await db.analytics.clients.find({}, {"_id": 0}).to_list(1000)
     return {"data": clients, "count": len(clients), "type": "clients"}
 
 @api_router.get("/export/orders")
 async def export_orders(current_user: dict = Depends(get_current_user)):
-    orders = await db.orders.find({}, {"_id": 0}).to_list(1000)
+    orders = await db.analytics.orders.find({}, {"_id": 0}).to_list(1000)
     return {"data": orders, "count": len(orders), "type": "orders"}
 
 @api_router.get("/export/deals")
 async def export_deals(current_user: dict = Depends(get_current_user)):
-    deals = await db.deals.find({}, {"_id": 0}).to_list(1000)
+    deals = await db.analytics.deals.find({}, {"_id": 0}).to_list(1000)
     return {"data": deals, "count": len(deals), "type": "deals"}
 
 @api_router.get("/export/products")
 async def export_products(current_user: dict = Depends(get_current_user)):
-    products = await db.products.find({}, {"_id": 0}).to_list(1000)
+    products = await db.analytics.products.find({}, {"_id": 0}).to_list(1000)
     return {"data": products, "count": len(products), "type": "products"}
 
+# ============== QUERY DIAGNOSTICS ==============
+
+class SlowQueryShape(BaseModel):
+    shape: str
+    command: str
+    collection: str
+    count: int
+    total_ms: float
+    avg_ms: float
+    max_ms: float
+    last_seen: str
+    paths: List[str] = []
+    plan: Optional[dict] = None
+
+@api_router.get("/admin/slow-queries", response_model=List[SlowQueryShape])
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    hours: int = Query(24, ge=1),
+    current_user: dict = Depends(get_current_user)
+):
+    """Worst query shapes by total time spent in slow operations, with the latest explained plan"""
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+    groups = await db[slow_query_log.collection_name].aggregate([
+        {"$match": {"at": {"$gte": since}}},
+        {"$group": {
+            "_id": "$shape",
+            "command": {"$first": "$command"},
+            "collection": {"$first": "$collection"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "avg_ms": {"$avg": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "last_seen": {"$max": "$at"},
+            "paths": {"$addToSet": "$path"},
+            # null sorts below documents, so $max keeps the most recent explained entry
+            "latest_plan": {"$max": {"$cond": [{"$ifNull": ["$plan", False]}, {"at": "$at", "plan": "$plan"}, None]}}
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit}
+    ]).to_list(None)
+    for group in groups:
+        group["shape"] = group.pop("_id")
+        group["paths"] = sorted(p for p in group["paths"] if p)
+        group["plan"] = (group.pop("latest_plan") or {}).get("plan")
+    return model_response(groups, SlowQueryShape)
+
+class IndexAdvice(BaseModel):
+    collection: str
+    keys: List[list]
+    executions: int
+    shapes: List[str]
+    current_plan: Optional[List[str]] = None
+    current_ratio: float
+    estimated_ratio: float
+    covered: bool
+    score: float
+    create_index: str
+
+@api_router.get("/admin/index-advice", response_model=List[IndexAdvice])
+async def get_index_advice(
+    limit: int = Query(20, ge=1, le=100),
+    explain: bool = True,
+    current_user: dict = Depends(get_current_user)
+):
+    """Compound indexes the recorded query shapes want but no existing index provides, best first"""
+    advice = await index_advisor.report(db, limit=limit, explain=explain)
+    return model_response(advice, IndexAdvice)
+
 # ============== ROOT ROUTE ==============
 
 @api_router.get("/")
 async def root():
     return {"message": "SOA East LLC CRM API", "version": "1.0.0"}
 
-# Include router and middleware
-app.include_router(api_router)
+# ============== APP FACTORY ==============
+
+# Response validators built at startup rather than by each list route's first request
+WARM_RESPONSE_MODELS = [ClientResponse, ProductResponse, OrderResponse, DealResponse, ClientNoteResponse, RoleResponse]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the database and warm what the first requests would otherwise pay for"""
+    timer = StartupTimer()
+    if DB_BACKEND == 'mongo':
+        db.connect(
+            os.environ['MONGO_URL'], os.environ['DB_NAME'],
+            event_listeners=[MongoCommandMetrics(), MongoPoolMetrics(), QueryAccountingListener(), slow_query_log, index_advisor],
+            analytics_read_preference=MONGO_ANALYTICS_READ_PREFERENCE,
+            analytics_max_staleness=MONGO_ANALYTICS_MAX_STALENESS_SECONDS,
+            **MONGO_CLIENT_OPTIONS
+        )
+        await db.warm(DB_WARM_CONNECTIONS)
+    else:
+        # Command listeners are Mongo-only, so query diagnostics stay empty on other backends
+        db.bind(open_database(DB_BACKEND, os.environ.get('DB_NAME', 'soa_crm'), os.environ.get('DB_PATH')))
+    timer.mark("connect")
+    await ensure_indexes(db)
+    timer.mark("indexes")
+    for model in WARM_RESPONSE_MODELS:
+        response_adapter(model, None, True)
+    timer.mark("caches")
+    tasks = [
+        asyncio.create_task(forecast_recalibration_loop()),
+        asyncio.create_task(monitor_event_loop_lag()),
+        await slow_query_log.start(db),
+        # Domain routers and the OpenAPI schema load once the worker is already serving
+        asyncio.create_task(warm_up(app)),
+    ]
+    if app.state.rate_limiter and RATE_LIMIT_SYNC_SECONDS > 0:
+        tasks.append(await app.state.rate_limiter.start(db, RATE_LIMIT_SYNC_SECONDS))
+    app.state.startup_timings = timer.finish()
+    logger.info("Worker ready in %.3fs %s", sum(app.state.startup_timings.values()), app.state.startup_timings)
+    yield
+    for task in tasks:
+        task.cancel()
+    db.close()
+
+async def warm_up(app: FastAPI):
+    await routers.load_all(app)
+    await asyncio.to_thread(app.openapi)
+
+# Served from their own, smaller concurrency pool (see load_shedding.py)
+REPORT_PATH_PREFIXES = ("/api/dashboard", "/api/forecast", "/api/analytics", "/api/export")
+
+AUTH_PATHS = ("/api/auth/login", "/api/auth/register")
+
+# Read-only views served from their last good response while the database is degraded
+STALE_PATH_PREFIXES = ("/api/products", "/api/settings", "/api/dashboard/")
+
+# Drawn from the small "reports" bucket. The dashboard makes several calls per page load, so it counts as reads
+RATE_LIMITED_REPORT_PREFIXES = ("/api/forecast", "/api/analytics", "/api/export")
+
+def rate_limit_class(method: str, path: str) -> Optional[str]:
+    """RATE_LIMITS bucket a request draws from; probes and CORS preflights are not limited"""
+    if not path.startswith("/api/") or method == "OPTIONS":
+        return None
+    if path in AUTH_PATHS:
+        return "auth"
+    if path.startswith(RATE_LIMITED_REPORT_PREFIXES):
+        return "reports"
+    return "read" if method in ("GET", "HEAD") else "write"
+
+@lru_cache(maxsize=4096)
+def token_claims(token: str) -> Optional[tuple]:
+    """(subject, expiry) of a validly signed token; cached since verifying the signature dominates"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False})
+        return payload["sub"], payload["exp"]
+    except (jwt.InvalidTokenError, KeyError):
+        return None
+
+def token_subject(scope) -> Optional[str]:
+    """Subject of the request's bearer token if it is validly signed and unexpired"""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            claims = token_claims(token) if scheme.lower() == "bearer" else None
+            if claims and claims[1] > time.time():
+                return claims[0]
+            break
+    return None
+
+def rate_limit_key(scope) -> str:
+    """Subject of an unexpired bearer token, else the client address"""
+    if subject := token_subject(scope):
+        return f"user:{subject}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+async def database_unavailable(request: Request, exc: ConnectionFailure):
+    """No pooled connection within waitQueueTimeoutMS, or no server selectable: ask the client to retry"""
+    logger.warning("Database unavailable for %s %s: %s", request.method, request.url.path, exc)
+    return ORJSONResponse({"detail": "Database temporarily unavailable"}, status_code=503, headers={"Retry-After": "1"})
+
+def create_app() -> FastAPI:
+    """Build the API app; `server:app` is one instance, `uvicorn --factory server:create_app` makes its own"""
+    # Routes returning plain dicts are rendered with orjson; model lists go through model_response
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.add_exception_handler(ConnectionFailure, database_unavailable)
+    routers.include_routes(app, probe_router)
+    routers.include_routes(app, api_router)
+    # brokers, messages, channels and integrations are imported on first use
+    routers.install(app)
+
+    # Innermost, so it sees the data layer's 503s and caches uncompressed bodies
+    if CIRCUIT_BREAKER_ENABLED:
+        app.add_middleware(
+            CircuitBreakerMiddleware,
+            breaker=CircuitBreaker(
+                failure_ratio=float(os.environ.get('CIRCUIT_FAILURE_RATIO', 0.5)),
+                window=int(os.environ.get('CIRCUIT_WINDOW', 20)),
+                min_calls=int(os.environ.get('CIRCUIT_MIN_CALLS', 10)),
+                open_seconds=float(os.environ.get('CIRCUIT_OPEN_SECONDS', 10)),
+                half_open_probes=int(os.environ.get('CIRCUIT_HALF_OPEN_PROBES', 3)),
+            ),
+            slow_call_seconds=float(os.environ.get('CIRCUIT_SLOW_CALL_MS', DEFAULT_TIME_BUDGET_MS)) / 1000,
+            cache=StaleCache(max_entries=int(os.environ.get('STALE_CACHE_ENTRIES', 256))),
+            stale_paths=STALE_PATH_PREFIXES,
+            authenticated=lambda scope: token_subject(scope) is not None,
+        )
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    # Routes opt out of compression by sending Cache-Control: no-transform
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+        level=int(os.environ.get('COMPRESSION_LEVEL', 6)),
+        exclude_paths=["/health"],
+    )
+
+    # Adaptive concurrency limits; over the limit requests queue, then get a 503 with Retry-After.
+    # Inside CORS so browsers can read the 503
+    app.add_middleware(
+        LoadSheddingMiddleware,
+        default=AIMDLimiter(
+            "crud",
+            initial=int(os.environ.get('CRUD_CONCURRENCY', 64)),
+            max_limit=int(os.environ.get('CRUD_CONCURRENCY_MAX', 256)),
+            latency_target=float(os.environ.get('CRUD_LATENCY_TARGET_MS', 500)) / 1000,
+            queue_size=int(os.environ.get('CRUD_QUEUE_SIZE', 256)),
+            queue_timeout=float(os.environ.get('CRUD_QUEUE_TIMEOUT_MS', 1000)) / 1000,
+        ),
+        pools=[(REPORT_PATH_PREFIXES, AIMDLimiter(
+            "reports",
+            initial=int(os.environ.get('REPORT_CONCURRENCY', 4)),
+            max_limit=int(os.environ.get('REPORT_CONCURRENCY_MAX', 16)),
+            latency_target=float(os.environ.get('REPORT_LATENCY_TARGET_MS', 3000)) / 1000,
+            queue_size=int(os.environ.get('REPORT_QUEUE_SIZE', 32)),
+            queue_timeout=float(os.environ.get('REPORT_QUEUE_TIMEOUT_MS', 5000)) / 1000,
+        ))],
+    )
+
+    app.state.rate_limiter = RateLimiter(RATE_LIMITS) if RATE_LIMIT_ENABLED else None
+    if app.state.rate_limiter:
+        # Ahead of the load shedder, so a throttled user never takes a concurrency slot
+        app.add_middleware(
+            RateLimitMiddleware, limiter=app.state.rate_limiter, classify=rate_limit_class, identify=rate_limit_key
+        )
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["ETag", "Server-Timing", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After", "Age", "Warning"],
+    )
+
+    # Server-Timing reports Mongo round trips; warns when one query shape repeats within a request
+    app.add_middleware(QueryAccountingMiddleware, n_plus_one_threshold=int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10)))
+
+    # Outermost so latency includes compression and CORS handling
+    app.add_middleware(MetricsMiddleware, exclude_paths=["/metrics", "/health"])
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+app = create_app()
@@ -0,0 +1,163 @@
+"""
+Slow MongoDB operation log
+Commands slower than a threshold are written to a capped collection with their
+query shape, duration and the request that issued them. The first occurrence
+of each shape (and a random sample after that) is re-run through
+explain("executionStats") in the background so the entry carries the winning
+plan and how many documents it examined per document returned.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timezone
+
+from bson import SON
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid
+
+from query_profiler import command_shape, current_request_queries
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+
+# Fields the driver adds to a command that explain must not forward
+DRIVER_FIELDS = {
+    "lsid", "txnNumber", "autocommit", "startTransaction", "$clusterTime", "$db",
+    "$readPreference", "readConcern", "writeConcern",
+}
+
+def find_key(document, key):
+    """First value stored under key anywhere in a nested explain document"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        values = document.values()
+    elif isinstance(document, list):
+        values = document
+    else:
+        return None
+    for value in values:
+        found = find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+def plan_stages(plan: dict) -> list:
+    """Stage names of a winning plan from the root down, e.g. ["FETCH", "IXSCAN"]"""
+    stages = []
+    while plan:
+        stages.append(plan.get("stage"))
+        children = plan.get("inputStages") or [plan.get("inputStage")]
+        plan = children[0]
+    return [stage for stage in stages if stage]
+
+def summarize_explain(explain: dict) -> dict:
+    winning = find_key(explain, "winningPlan") or {}
+    # Slot-based engine nests the classic plan tree under queryPlan
+    winning = winning.get("queryPlan", winning)
+    stats = find_key(explain, "executionStats") or {}
+    stages = plan_stages(winning)
+    return {
+        "stages": stages,
+        "index": find_key(winning, "indexName"),
+        "collscan": "COLLSCAN" in stages,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "n_returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis"),
+        "winning_plan": winning,
+    }
+
+async def explain_command(client, database: str, command) -> dict:
+    """Run explain("executionStats") for a command captured from the driver"""
+    body = SON((key, value) for key, value in command.items() if key not in DRIVER_FIELDS)
+    explain = await client[database].command(SON([("explain", body), ("verbosity", "executionStats")]))
+    return summarize_explain(explain)
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Command listener feeding slow operations to a background writer.
+
+    Listener callbacks run on driver threads, so records are handed to the
+    event loop with call_soon_threadsafe; when the queue is full they are
+    dropped rather than slowing the request down.
+    """
+
+    def __init__(self, threshold_ms: float = 100, sample_rate: float = 0.1,
+                 collection_name: str = "slow_queries", max_bytes: int = 16 * 1024 * 1024, queue_size: int = 1000):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.collection_name = collection_name
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._pending = {}
+        self._explained_shapes = set()
+        self._db = None
+        self._loop = None
+        self._queue = None
+
+    async def start(self, db) -> asyncio.Task:
+        """Create the capped collection if needed and start the writer task"""
+        self._db = db
+        try:
+            await db.create_collection(self.collection_name, capped=True, size=self.max_bytes)
+        except CollectionInvalid:
+            pass
+        self._queue = asyncio.Queue(self.queue_size)
+        self._loop = asyncio.get_running_loop()
+        return asyncio.create_task(self._write_records())
+
+    def started(self, event):
+        if self._loop is not None and event.command_name in EXPLAINABLE_COMMANDS:
+            self._pending[(event.connection_id, event.request_id)] = (event.command, event.database_name)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < self.threshold_ms:
+            return
+        command, database = pending
+        shape = command_shape(event.command_name, command)
+        if shape is None:
+            return
+        queries = current_request_queries.get()
+        record = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "shape": shape.key,
+            "command": shape.command,
+            "collection": shape.collection,
+            "filter": shape.filter,
+            "sort": shape.sort,
+            "duration_ms": round(duration_ms, 3),
+            "failed": failed,
+            "method": queries.method if queries else None,
+            "path": queries.path if queries else None,
+        }
+        self._loop.call_soon_threadsafe(self._enqueue, record, command, database)
+
+    def _enqueue(self, record: dict, command, database: str):
+        try:
+            self._queue.put_nowait((record, command, database))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _write_records(self):
+        while True:
+            record, command, database = await self._queue.get()
+            if record["shape"] not in self._explained_shapes or random.random() < self.sample_rate:
+                self._explained_shapes.add(record["shape"])
+                try:
+                    record["plan"] = await explain_command(self._db.client, database, command)
+                except Exception as exc:
+                    logger.warning("Could not explain slow %s on %s: %s", record["command"], record["collection"], exc)
+            try:
+                await self._db[self.collection_name].insert_one(record)
+            except Exception:
+                logger.exception("Failed to record slow %s on %s", record["command"], record["collection"])
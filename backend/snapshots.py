@@ -0,0 +1,187 @@
+"""
+Named dataset snapshots
+Captures collections to gzip-compressed BSON files under SNAPSHOT_DIR and
+restores them by bulk-loading raw BSON into a staging collection per
+collection (in parallel), building its indexes, then swapping it in with
+renameCollection(dropTarget=True). Old data is dropped with the target
+collection instead of deleted document by document, so a reset costs the
+size of the snapshot, not of whatever the database had grown to.
+
+Layout:
+    SNAPSHOT_DIR/<name>/manifest.json
+    SNAPSHOT_DIR/<name>/<collection>.bson.gz
+
+Documents in `versioned` collections carry the per-document version their
+ETags are built from. A restore moves every restored version past the
+highest live one, so a document edited after the snapshot was taken never
+comes back under an ETag it has already been served with.
+"""
+import asyncio
+import gzip
+import json
+import re
+import shutil
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from bson import decode_file_iter
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from indexes import INDEXES
+
+SNAPSHOT_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+RAW_CODEC = CodecOptions(document_class=RawBSONDocument)
+# Level 1 compresses BSON roughly 4x at a fraction of the default level's cost
+COMPRESS_LEVEL = 1
+
+def check_collection_names(collections: Iterable[str]):
+    """Collection names become file names, so they share the snapshot name alphabet"""
+    invalid = [c for c in collections if not SNAPSHOT_NAME.match(c)]
+    if invalid:
+        raise ValueError(f"Invalid collection name(s) {', '.join(map(repr, invalid))}")
+
+class SnapshotStore:
+    def __init__(self, directory: Path, batch_size: int = 10000, concurrency: int = 4, versioned: Iterable[str] = ()):
+        self.directory = Path(directory)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.versioned = set(versioned)
+
+    def path(self, name: str) -> Path:
+        if not SNAPSHOT_NAME.match(name):
+            raise ValueError("Snapshot names may only contain letters, digits, '-' and '_'")
+        return self.directory / name
+
+    def manifest(self, name: str) -> Optional[dict]:
+        try:
+            return json.loads((self.path(name) / "manifest.json").read_text())
+        except FileNotFoundError:
+            return None
+
+    def list(self) -> list:
+        if not self.directory.is_dir():
+            return []
+        manifests = (self.manifest(p.name) for p in self.directory.iterdir() if SNAPSHOT_NAME.match(p.name))
+        return sorted((m for m in manifests if m), key=lambda m: m["created_at"], reverse=True)
+
+    def delete(self, name: str) -> bool:
+        path = self.path(name)
+        if not path.is_dir():
+            return False
+        shutil.rmtree(path)
+        return True
+
+    async def save(self, db, name: str, collections: Iterable[str]) -> dict:
+        """Dump the collections to a new snapshot, replacing any snapshot with this name"""
+        collections = list(collections)
+        check_collection_names(collections)
+        target = self.path(name)
+        staging = self.directory / f".{name}.{uuid.uuid4().hex[:8]}"
+        staging.mkdir(parents=True)
+        try:
+            counts = await asyncio.gather(*(self._dump(db[c], staging / f"{c}.bson.gz") for c in collections))
+            manifest = {
+                "name": name,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "collections": {c: {"count": count, "bytes": size} for c, (count, size) in zip(collections, counts)},
+            }
+            (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+            # Swap directories so a concurrent restore never sees a half-written snapshot
+            if target.exists():
+                retired = self.directory / f".{name}.old.{uuid.uuid4().hex[:8]}"
+                target.rename(retired)
+                staging.rename(target)
+                shutil.rmtree(retired, ignore_errors=True)
+            else:
+                staging.rename(target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return manifest
+
+    async def _dump(self, collection, path: Path) -> tuple:
+        """Stream raw BSON batches straight to disk without decoding documents"""
+        count = 0
+        out = await asyncio.to_thread(gzip.open, path, "wb", COMPRESS_LEVEL)
+        try:
+            async for batch in collection.find_raw_batches({}, batch_size=self.batch_size):
+                await asyncio.to_thread(out.write, batch)
+                count += count_documents(batch)
+        finally:
+            await asyncio.to_thread(out.close)
+        return count, path.stat().st_size
+
+    async def restore(self, db, name: str, collections: Optional[Iterable[str]] = None) -> dict:
+        """Replace the snapshot's collections (or the given subset) with its contents"""
+        manifest = self.manifest(name)
+        if manifest is None:
+            raise FileNotFoundError(f"Snapshot {name!r} not found")
+        names = list(collections or manifest["collections"])
+        check_collection_names(names)
+        missing = [c for c in names if c not in manifest["collections"]]
+        if missing:
+            raise ValueError(f"Snapshot {name!r} has no collection(s) {', '.join(missing)}")
+        counts = await asyncio.gather(*(self._load(db, c, self.path(name) / f"{c}.bson.gz") for c in names))
+        return dict(zip(names, counts))
+
+    async def _load(self, db, name: str, path: Path) -> int:
+        staging = db[f"{name}__restore_{uuid.uuid4().hex[:8]}"]
+        await db.create_collection(staging.name)
+        try:
+            count = await self._bulk_load(staging, path)
+            if name in self.versioned:
+                await self._advance_versions(staging, db[name])
+            if name in INDEXES:
+                await staging.create_indexes(INDEXES[name])
+            await staging.rename(name, dropTarget=True)
+        except BaseException:
+            await staging.drop()
+            raise
+        return count
+
+    async def _advance_versions(self, staging, live):
+        """Offset restored versions by the live collection's highest version plus one"""
+        newest = await live.find({}, {"_id": 0, "version": 1}).sort("version", -1).limit(1).to_list(1)
+        offset = (newest[0].get("version") or 0) + 1 if newest else 1
+        await staging.update_many({}, {"$inc": {"version": offset}})
+
+    async def _bulk_load(self, collection, path: Path) -> int:
+        """Insert raw BSON batches with up to `concurrency` insert_many calls in flight"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batches = read_batches(path, self.batch_size)
+        tasks, count = [], 0
+
+        async def insert(batch):
+            try:
+                await collection.insert_many(batch, ordered=False)
+            finally:
+                semaphore.release()
+
+        while batch := await asyncio.to_thread(next, batches, None):
+            count += len(batch)
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(insert(batch)))
+        await asyncio.gather(*tasks)
+        return count
+
+def read_batches(path: Path, batch_size: int):
+    with gzip.open(path, "rb") as f:
+        batch = []
+        for document in decode_file_iter(f, RAW_CODEC):
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def count_documents(data: bytes) -> int:
+    """Documents in a buffer of concatenated BSON, read from their length prefixes"""
+    count = offset = 0
+    while offset < len(data):
+        offset += int.from_bytes(data[offset:offset + 4], "little")
+        count += 1
+    return count
@@ -0,0 +1,360 @@
+"""
+Embedded SQLite backend
+For single-box deployments where running mongod is pure overhead:
+    DB_BACKEND=sqlite DB_PATH=/var/lib/soa-crm/crm.sqlite3 uvicorn server:app
+
+Each collection is a table of BSON documents. Every field that appears in an
+index (indexes.INDEXES covers id, email, client_id, stage, status,
+created_at, ...) gets its own column with a SQLite index, so equality, $in
+and range conditions and sorts on those fields run in SQL; the rest of the
+filter is applied with the same matcher as the in-memory backend, keeping
+query semantics identical across backends.
+
+Statements run inline on the event loop thread: they are local and short,
+and it keeps every repository operation atomic without extra locking.
+"""
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import bson
+from bson import ObjectId
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from repositories import DocumentRepository, duplicate_key, is_operator_dict, resolve
+
+SQL_COMPARISONS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+META_TABLES = """
+CREATE TABLE IF NOT EXISTS __indexes (
+    collection TEXT NOT NULL, name TEXT NOT NULL, keys TEXT NOT NULL, is_unique INTEGER NOT NULL, sql_name TEXT NOT NULL,
+    PRIMARY KEY (collection, name)
+);
+CREATE TABLE IF NOT EXISTS __multikey (collection TEXT NOT NULL, field TEXT NOT NULL, PRIMARY KEY (collection, field));
+"""
+# Stands in for array and subdocument values, which cannot be looked up through a column
+MULTIKEY = object()
+
+def quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+def column_name(field: str) -> str:
+    return quote(f"k_{field}")
+
+def column_value(value):
+    """A document value as stored in, and compared against, an index column"""
+    if value is None or isinstance(value, (str, float)):
+        return value
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return MULTIKEY
+    return str(value)
+
+def pushable(value) -> bool:
+    """Whether a query value compares the same way in SQL as in Mongo"""
+    return isinstance(value, (str, int, float, ObjectId)) and not isinstance(value, bool)
+
+def pushdown(column: str, condition, params: list) -> Optional[str]:
+    """SQL for the part of a field condition an index column can answer, or None.
+
+    The result may match a superset of documents; the full filter is re-checked in Python.
+    """
+    if not is_operator_dict(condition):
+        if condition is None:
+            return f"{column} IS NULL"
+        if pushable(condition):
+            params.append(column_value(condition))
+            return f"{column} = ?"
+        return None
+    clauses = []
+    for operator, argument in condition.items():
+        if operator == "$eq" and pushable(argument):
+            clauses.append(f"{column} = ?")
+            params.append(column_value(argument))
+        elif operator == "$in" and argument and all(v is None or pushable(v) for v in argument):
+            values = [column_value(v) for v in argument if v is not None]
+            parts = [f"{column} IN ({', '.join('?' * len(values))})"] if values else []
+            if len(values) < len(argument):
+                parts.append(f"{column} IS NULL")
+            clauses.append("(" + " OR ".join(parts) + ")")
+            params.extend(values)
+        elif operator in SQL_COMPARISONS and pushable(argument):
+            clauses.append(f"{column} {SQL_COMPARISONS[operator]} ?")
+            params.append(column_value(argument))
+    return " AND ".join(clauses) or None
+
+class SQLiteRepository(DocumentRepository):
+    @property
+    def table(self) -> str:
+        return quote(self.name)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        return self.database.connection
+
+    def _exists(self) -> bool:
+        return self.name in self.database.tables()
+
+    def _ensure_table(self):
+        if self._exists():
+            return
+        with self.database.transaction():
+            self.connection.execute(f"CREATE TABLE {self.table} (pos INTEGER PRIMARY KEY, doc BLOB NOT NULL, {column_name('_id')})")
+            self._create_sql_index("_id_", [("_id", 1)], unique=True)
+        self.database.invalidate()
+
+    def _create_sql_index(self, name: str, keys: list, unique: bool):
+        sql_name = quote(f"{self.name}__{name}")
+        columns = ", ".join(f"{column_name(field)} {'DESC' if direction == -1 else 'ASC'}" for field, direction in keys)
+        try:
+            self.connection.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {sql_name} ON {self.table} ({columns})")
+        except sqlite3.IntegrityError:
+            raise duplicate_key(self, name)
+        self.connection.execute(
+            "INSERT INTO __indexes (collection, name, keys, is_unique, sql_name) VALUES (?, ?, ?, ?, ?)",
+            (self.name, name, json.dumps(keys), int(unique), sql_name)
+        )
+
+    def _fields(self) -> list:
+        """Fields with an index column, in column order"""
+        return self.database.fields(self.name)
+
+    def _row_values(self, document: dict) -> list:
+        values = []
+        for field in self._fields():
+            found = resolve(document, field)
+            value = column_value(found[0]) if len(found) == 1 else (MULTIKEY if found else None)
+            if value is MULTIKEY:
+                if field not in self.database.multikey(self.name):
+                    self.database.mark_multikey(self.name, field)
+                value = None
+            values.append(value)
+        return values
+
+    # ---- storage primitives ----
+
+    def _scan(self, query: Optional[dict], sort: list) -> tuple:
+        if not self._exists():
+            return [], True
+        fields = set(self._fields()) - self.database.multikey(self.name)
+        where, params = [], []
+        for field, condition in (query or {}).items():
+            if field in fields:
+                clause = pushdown(column_name(field), condition, params)
+                if clause:
+                    where.append(clause)
+        ordered = all(field in fields for field, _ in sort)
+        sql = f"SELECT pos, doc FROM {self.table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if sort and ordered:
+            sql += " ORDER BY " + ", ".join(f"{column_name(f)} {'DESC' if d == -1 else 'ASC'}" for f, d in sort) + ", pos"
+        rows = self.connection.execute(sql, params)
+        return ((position, bson.decode(doc)) for position, doc in rows), ordered
+
+    def _store(self, document: dict) -> int:
+        self._ensure_table()
+        columns = "".join(f", {column_name(f)}" for f in self._fields())
+        values = [bson.encode(document), *self._row_values(document)]
+        try:
+            cursor = self.connection.execute(
+                f"INSERT INTO {self.table} (doc{columns}) VALUES ({', '.join('?' * len(values))})", values
+            )
+        except sqlite3.IntegrityError as e:
+            raise duplicate_key(self, str(e))
+        return cursor.lastrowid
+
+    def _replace(self, position: int, before: dict, after: dict):
+        assignments = "".join(f", {column_name(f)} = ?" for f in self._fields())
+        try:
+            self.connection.execute(
+                f"UPDATE {self.table} SET doc = ?{assignments} WHERE pos = ?",
+                [bson.encode(after), *self._row_values(after), position]
+            )
+        except sqlite3.IntegrityError as e:
+            raise duplicate_key(self, str(e))
+
+    def _discard(self, position: int, document: dict):
+        self.connection.execute(f"DELETE FROM {self.table} WHERE pos = ?", (position,))
+
+    def _batch(self):
+        return self.database.transaction()
+
+    # ---- collection management ----
+
+    async def create_indexes(self, indexes: list, **kwargs) -> List[str]:
+        self._ensure_table()
+        existing = await self.index_information()
+        names = []
+        with self.database.transaction():
+            for model in indexes:
+                document = model.document
+                name = document["name"]
+                names.append(name)
+                if name in existing:
+                    continue
+                keys = list(document["key"].items())
+                for field, _ in keys:
+                    if field not in self._fields():
+                        self._add_column(field)
+                self._create_sql_index(name, keys, document.get("unique", False))
+        return names
+
+    def _add_column(self, field: str):
+        """Add and backfill the index column for a field"""
+        self.connection.execute(f"ALTER TABLE {self.table} ADD COLUMN {column_name(field)}")
+        self.database.invalidate()
+        rows = self.connection.execute(f"SELECT pos, doc FROM {self.table}").fetchall()
+        for position, doc in rows:
+            self._replace(position, None, bson.decode(doc))
+
+    async def index_information(self) -> dict:
+        rows = self.connection.execute("SELECT name, keys, is_unique FROM __indexes WHERE collection = ?", (self.name,))
+        return {
+            name: {"key": [tuple(k) for k in json.loads(keys)], **({"unique": True} if unique and name != "_id_" else {})}
+            for name, keys, unique in rows
+        }
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        if not self._exists():
+            return 0
+        return self.connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    async def find_raw_batches(self, filter: Optional[dict] = None, batch_size: int = 1000, **kwargs):
+        if filter or not self._exists():
+            async for batch in super().find_raw_batches(filter, batch_size):
+                yield batch
+            return
+        # Documents are stored as BSON, so an unfiltered dump needs no decoding
+        cursor = self.connection.execute(f"SELECT doc FROM {self.table} ORDER BY pos")
+        while rows := cursor.fetchmany(batch_size):
+            yield b"".join(doc for doc, in rows)
+
+    async def drop(self, **kwargs):
+        with self.database.transaction():
+            self.connection.execute(f"DROP TABLE IF EXISTS {self.table}")
+            self.connection.execute("DELETE FROM __indexes WHERE collection = ?", (self.name,))
+            self.connection.execute("DELETE FROM __multikey WHERE collection = ?", (self.name,))
+        self.database.invalidate()
+
+    async def rename(self, new_name: str, dropTarget: bool = False, **kwargs):
+        target = self.database[new_name]
+        if target._exists():
+            if not dropTarget:
+                raise OperationFailure("target namespace exists")
+            await target.drop()
+        with self.database.transaction():
+            self.connection.execute(f"ALTER TABLE {self.table} RENAME TO {quote(new_name)}")
+            self.connection.execute("UPDATE __indexes SET collection = ? WHERE collection = ?", (new_name, self.name))
+            self.connection.execute("UPDATE __multikey SET collection = ? WHERE collection = ?", (new_name, self.name))
+        self.database.invalidate()
+        self.name = new_name
+        return {"ok": 1}
+
+class SQLiteDatabase:
+    """Repositories stored as tables of one SQLite file"""
+
+    client = None
+
+    def __init__(self, path: str, name: str):
+        self.name = name
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(META_TABLES)
+        self._depth = 0
+        self._tables = None
+        self._fields = {}
+        self._multikey = None
+
+    @contextmanager
+    def transaction(self):
+        """Group writes into one transaction; nested uses join the outer one"""
+        if self._depth == 0:
+            self.connection.execute("BEGIN")
+        self._depth += 1
+        try:
+            yield
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self.connection.execute("ROLLBACK")
+                self.invalidate()
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            self.connection.execute("COMMIT")
+
+    # ---- schema cache ----
+
+    def invalidate(self):
+        self._tables = None
+        self._fields = {}
+        self._multikey = None
+
+    def tables(self) -> set:
+        if self._tables is None:
+            rows = self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            self._tables = {name for name, in rows if not name.startswith(("__", "sqlite_"))}
+        return self._tables
+
+    def fields(self, collection: str) -> list:
+        if collection not in self._fields:
+            columns = self.connection.execute(f"PRAGMA table_info({quote(collection)})").fetchall()
+            self._fields[collection] = [name[2:] for _, name, *_ in columns if name.startswith("k_")]
+        return self._fields[collection]
+
+    def multikey(self, collection: str) -> set:
+        if self._multikey is None:
+            self._multikey = {}
+            for name, field in self.connection.execute("SELECT collection, field FROM __multikey"):
+                self._multikey.setdefault(name, set()).add(field)
+        return self._multikey.get(collection, set())
+
+    def mark_multikey(self, collection: str, field: str):
+        """Stop answering a field from its column once any document holds an array or subdocument there"""
+        self.connection.execute("INSERT OR IGNORE INTO __multikey VALUES (?, ?)", (collection, field))
+        self._multikey = None
+
+    # ---- database API ----
+
+    def __getitem__(self, name: str) -> SQLiteRepository:
+        return SQLiteRepository(self, name)
+
+    def __getattr__(self, name: str) -> SQLiteRepository:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> SQLiteRepository:
+        return self[name]
+
+    async def list_collection_names(self, **kwargs) -> List[str]:
+        return sorted(self.tables())
+
+    async def create_collection(self, name: str, **options) -> SQLiteRepository:
+        # Options such as capped sizes have no SQLite equivalent and are ignored
+        if name in self.tables():
+            raise CollectionInvalid(f"collection {name} already exists")
+        repository = self[name]
+        repository._ensure_table()
+        return repository
+
+    async def drop_collection(self, name: str, **kwargs):
+        await self[name].drop()
+
+    async def command(self, command, *args, **kwargs):
+        raise OperationFailure(f"{command!r} is not supported by the SQLite backend")
+
+def default_path(name: str) -> str:
+    return str(Path(__file__).parent / f"{name}.sqlite3")
@@ -0,0 +1,394 @@
+"""
+Synthetic data generator for scale testing
+Produces internally consistent clients, products, orders with line items,
+deals, client notes and messages at arbitrary volume. Values are generated
+with NumPy a chunk at a time and written with parallel, unordered
+insert_many batches. Orders, deals and notes pick their client from a Zipf
+distribution so a few clients carry most of the activity, as in real data.
+
+Client totals (total_orders, total_revenue, last_order_date) and product
+totals (total_orders, total_clients) are computed from the generated orders,
+and order totals follow calculate_order_totals.
+
+Run from backend/ (uses MONGO_URL / DB_NAME like server.py):
+    python synthetic_data.py --clients 1000000 --orders 5000000 --deals 2000000 --zipf-a 1.1
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+INDUSTRIES = ["Healthcare", "Technology", "Real Estate", "Fitness", "Food & Beverage", "Consulting", "Education", "Insurance", "Services", "Automotive"]
+NAME_PREFIXES = ["Summit", "Premier", "Urban", "Blue", "Green", "Nexus", "Pinnacle", "Bright", "Metro", "Apex", "Harbor", "Vertex"]
+NAME_SUFFIXES = ["Solutions", "Partners", "Group", "Holdings", "Labs", "Dynamics", "Works", "Co", "Industries", "Collective"]
+CITIES = [("Boston", "MA"), ("Austin", "TX"), ("Denver", "CO"), ("Seattle", "WA"), ("Atlanta", "GA"), ("Chicago", "IL"), ("Phoenix", "AZ"), ("Miami", "FL")]
+PRODUCT_KINDS = [
+    ("Polo Shirt", "apparel", 24.99), ("T-Shirt", "apparel", 12.99), ("Hoodie", "apparel", 38.99),
+    ("Travel Mug", "drinkware", 18.99), ("Coffee Mug", "drinkware", 8.99), ("Charger Pad", "tech", 22.99),
+    ("Power Bank", "tech", 28.99), ("Tote Bag", "bags", 14.99), ("Notebook", "office", 16.99),
+    ("Pen Set", "office", 9.99), ("Gift Box", "gifts", 45.99), ("Golf Umbrella", "outdoor", 32.99),
+]
+PRODUCT_STYLES = ["Classic", "Premium", "Eco", "Executive", "Sport", "Deluxe", "Custom", "Branded"]
+BADGES = [None, None, "popular", "new", "seasonal"]
+ORDER_STATUSES = np.array(["draft", "production", "shipped", "delivered"])
+ORDER_PROGRESS = np.array([0, 50, 95, 100])
+PRIORITIES = np.array(["high", "medium", "low"])
+DEAL_STAGES = np.array(["prospecting", "proposal", "negotiation", "won", "lost"])
+DEAL_STAGE_WEIGHTS = [0.25, 0.2, 0.15, 0.25, 0.15]
+DEAL_DESCRIPTIONS = ["Employee welcome kits", "Trade show giveaways", "Client appreciation gifts", "Team uniforms", "Conference swag bags"]
+TAG_OPTIONS = [["Apparel"], ["Drinkware"], ["Tech"], ["Bags"], ["Office"], ["Gifts"], ["Outdoor"], ["Apparel", "Gifts"], ["Tech", "Office"]]
+LOSS_REASONS = ["Budget constraints", "Went with competitor", "Project cancelled"]
+NOTE_TYPES = np.array(["general", "call", "meeting", "email", "task"])
+NOTE_TEMPLATES = ["Discussed reorder timing", "Sent updated proof", "Confirmed delivery address", "Asked about bulk pricing", "Follow up next quarter"]
+MESSAGE_SUBJECTS = ["Order update", "Proof approval needed", "Pricing question", "Shipping delay", "New client intro"]
+OWNER_COLORS = ["#2d6a4f", "#4a5fd7", "#7c3aed"]
+# Tier thresholds on total revenue, highest first
+TIERS = [(50000, "gold"), (20000, "silver"), (5000, "bronze"), (0, "new")]
+DAY = 86400.0
+
+class SyntheticDataSpec(BaseModel):
+    clients: int = Field(10000, ge=1)
+    products: int = Field(500, ge=1)
+    orders: int = Field(50000, ge=0)
+    deals: int = Field(20000, ge=0)
+    notes: int = Field(20000, ge=0)
+    messages: int = Field(10000, ge=0)
+    zipf_a: float = Field(1.1, gt=0, description="Zipf exponent for clients per order/deal/note")
+    history_days: int = Field(730, ge=1)
+    max_line_items: int = Field(5, ge=1)
+    batch_size: int = Field(5000, ge=1)
+    concurrency: int = Field(8, ge=1)
+    chunk_size: int = Field(100000, ge=1)
+    seed: Optional[int] = None
+
+def uuid_strings(rng: np.random.Generator, count: int) -> list:
+    """Random (version 4) UUID strings without a uuid4() call per record"""
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    h = raw.tobytes().hex()
+    return [f"{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}" for i in range(0, 32 * count, 32)]
+
+def iso_strings(seconds: np.ndarray) -> list:
+    """Epoch seconds to the datetime.isoformat() strings the API stores"""
+    stamps = np.datetime_as_string((seconds * 1e6).astype("int64").astype("datetime64[us]"), unit="us")
+    return [s + "+00:00" for s in stamps.tolist()]
+
+def date_strings(seconds: np.ndarray) -> list:
+    return np.datetime_as_string(seconds.astype("int64").astype("datetime64[s]"), unit="D").tolist()
+
+class ZipfSampler:
+    """Zipf-distributed indexes over a finite population (any exponent > 0).
+
+    Ranks are shuffled so the busiest clients are not simply the first ones generated.
+    """
+
+    def __init__(self, rng: np.random.Generator, population: int, a: float):
+        self.rng = rng
+        cdf = np.cumsum(np.arange(1, population + 1, dtype=float) ** -a)
+        self.cdf = cdf / cdf[-1]
+        self.ranked = rng.permutation(population)
+
+    def sample(self, size: int) -> np.ndarray:
+        return self.ranked[np.minimum(np.searchsorted(self.cdf, self.rng.random(size), side="right"), len(self.cdf) - 1)]
+
+class BatchWriter:
+    """Parallel unordered insert_many batches, at most `concurrency` in flight"""
+
+    def __init__(self, db, batch_size: int, concurrency: int, progress: Optional[Callable[[str, int], None]] = None):
+        self.db = db
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.progress = progress
+        self.inserted = Counter()
+        self.tasks = set()
+
+    async def write(self, collection: str, docs: list):
+        for start in range(0, len(docs), self.batch_size):
+            await self.semaphore.acquire()
+            task = asyncio.create_task(self._insert(collection, docs[start:start + self.batch_size]))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _insert(self, collection: str, docs: list):
+        try:
+            await self.db[collection].insert_many(docs, ordered=False)
+            self.inserted[collection] += len(docs)
+            if self.progress:
+                self.progress(collection, self.inserted[collection])
+        finally:
+            self.semaphore.release()
+
+    async def flush(self):
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks))
+
+def chunks(total: int, size: int):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+async def generate_dataset(db, spec: SyntheticDataSpec, progress: Optional[Callable[[str, int], None]] = None) -> dict:
+    """Generate and insert the dataset; returns documents inserted per collection"""
+    rng = np.random.default_rng(spec.seed)
+    writer = BatchWriter(db, spec.batch_size, spec.concurrency, progress)
+    now = time.time()
+    start = now - spec.history_days * DAY
+
+    settings = await db.settings.find_one({"type": "global"}, {"_id": 0, "tax_rate": 1})
+    tax_rate = (settings or {}).get("tax_rate", 8.5)
+    users = await db.users.find({}, {"_id": 0, "id": 1, "name": 1, "initials": 1}).to_list(100)
+    if not users:
+        users = [{"id": "system", "name": "Synthetic Data", "initials": "SD"}]
+    user_ids = np.array([u["id"] for u in users])
+    user_names = np.array([u["name"] for u in users])
+    user_initials = np.array([u.get("initials") or u["name"][:2].upper() for u in users])
+
+    # Clients: identity and creation time now; totals once orders exist
+    n_clients = spec.clients
+    client_ids = np.array(uuid_strings(rng, n_clients))
+    client_created = start + rng.random(n_clients) * (now - start) * 0.8
+    prefix = rng.integers(0, len(NAME_PREFIXES), n_clients)
+    suffix = rng.integers(0, len(NAME_SUFFIXES), n_clients)
+    client_names = np.array([f"{NAME_PREFIXES[p]} {NAME_SUFFIXES[s]} {i}" for i, (p, s) in enumerate(zip(prefix.tolist(), suffix.tolist()))])
+    client_zipf = ZipfSampler(rng, n_clients, spec.zipf_a)
+
+    # Products: catalog variants priced around their kind's base price
+    n_products = spec.products
+    kind = rng.integers(0, len(PRODUCT_KINDS), n_products)
+    style = rng.integers(0, len(PRODUCT_STYLES), n_products)
+    base = np.array([k[2] for k in PRODUCT_KINDS])[kind]
+    product_prices = np.round(base * rng.uniform(0.8, 1.3, n_products), 2)
+    product_names = np.array([f"{PRODUCT_STYLES[s]} {PRODUCT_KINDS[k][0]}" for k, s in zip(kind.tolist(), style.tolist())])
+    product_created = start + rng.random(n_products) * (now - start) * 0.5
+
+    client_orders = np.zeros(n_clients, dtype=np.int64)
+    client_revenue = np.zeros(n_clients)
+    client_last_order = np.full(n_clients, -np.inf)
+    product_orders = np.zeros(n_products, dtype=np.int64)
+    product_client_pairs = []
+
+    # Orders
+    for offset, size in chunks(spec.orders, spec.chunk_size):
+        owner = client_zipf.sample(size)
+        created = client_created[owner] + rng.random(size) * (now - client_created[owner])
+        n_items = rng.integers(1, spec.max_line_items + 1, size)
+        item_product = rng.integers(0, n_products, int(n_items.sum()))
+        item_qty = rng.integers(10, 501, len(item_product))
+        item_price = product_prices[item_product]
+        starts = np.concatenate(([0], np.cumsum(n_items)[:-1]))
+        subtotal = np.add.reduceat(item_qty * item_price, starts)
+        tax_amount = np.round(subtotal * (tax_rate / 100), 2)
+        total = np.round(subtotal + tax_amount, 2)
+        status = rng.integers(0, len(ORDER_STATUSES), size)
+
+        client_orders += np.bincount(owner, minlength=n_clients)
+        client_revenue += np.bincount(owner, weights=total, minlength=n_clients)
+        np.maximum.at(client_last_order, owner, created)
+        product_orders += np.bincount(item_product, minlength=n_products)
+        product_client_pairs.append(np.unique(item_product.astype(np.int64) * n_clients + np.repeat(owner, n_items)))
+
+        items = [
+            {"product_name": name, "quantity": qty, "unit_price": price}
+            for name, qty, price in zip(product_names[item_product].tolist(), item_qty.tolist(), item_price.tolist())
+        ]
+        bounds = np.append(starts, len(items)).tolist()
+        docs = [{
+            "id": order_id,
+            "order_id": f"SOA-{10_000_000 + offset + i}",
+            "client_id": client_id,
+            "line_items": items[bounds[i]:bounds[i + 1]],
+            "subtotal": sub,
+            "tax_rate": tax_rate,
+            "tax_amount": tax,
+            "total": tot,
+            "status": st,
+            "progress_percent": progress_percent,
+            "due_date": due,
+            "priority": priority,
+            "notes": "",
+            "created_at": created_at,
+        } for i, (order_id, client_id, sub, tax, tot, st, progress_percent, due, priority, created_at) in enumerate(zip(
+            uuid_strings(rng, size), client_ids[owner].tolist(), np.round(subtotal, 2).tolist(), tax_amount.tolist(),
+            total.tolist(), ORDER_STATUSES[status].tolist(), ORDER_PROGRESS[status].tolist(),
+            date_strings(created + rng.integers(14, 61, size) * DAY), PRIORITIES[rng.integers(0, 3, size)].tolist(),
+            iso_strings(created),
+        ))]
+        await writer.write("orders", docs)
+
+    # Clients, with totals derived from their orders
+    revenue_thresholds = np.array([t[0] for t in TIERS])
+    tier_names = np.array([t[1] for t in TIERS])
+    tiers = tier_names[np.argmax(client_revenue[:, None] >= revenue_thresholds[None, :], axis=1)]
+    has_orders = client_orders > 0
+    last_order = np.where(has_orders, client_last_order, 0)
+    city = rng.integers(0, len(CITIES), n_clients)
+    industry = rng.integers(0, len(INDUSTRIES), n_clients)
+    active = rng.random(n_clients) > 0.2
+    for offset, size in chunks(n_clients, spec.chunk_size):
+        part = slice(offset, offset + size)
+        last_order_dates = iso_strings(last_order[part])
+        docs = [{
+            "id": client_id,
+            "name": name,
+            "email": f"contact{offset + i}@{name.split()[0].lower()}{name.split()[1].lower()}.example.com",
+            "industry": INDUSTRIES[ind],
+            "tier": tier,
+            "total_revenue": round(revenue, 2),
+            "total_orders": orders,
+            "last_order_date": last_order_dates[i] if ordered else None,
+            "status": "active" if is_active else "inactive",
+            "created_at": created_at,
+            "phone": f"(555) {100 + (offset + i) % 900:03d}-{(offset + i) % 10000:04d}",
+            "city": CITIES[c][0],
+            "state": CITIES[c][1],
+        } for i, (client_id, name, ind, tier, revenue, orders, ordered, is_active, created_at, c) in enumerate(zip(
+            client_ids[part].tolist(), client_names[part].tolist(), industry[part].tolist(), tiers[part].tolist(),
+            client_revenue[part].tolist(), client_orders[part].tolist(), has_orders[part].tolist(), active[part].tolist(),
+            iso_strings(client_created[part]), city[part].tolist(),
+        ))]
+        await writer.write("clients", docs)
+
+    # Products, with order and distinct-client counts from the line items
+    pairs = np.unique(np.concatenate(product_client_pairs)) if product_client_pairs else np.array([], dtype=np.int64)
+    product_clients = np.bincount(pairs // n_clients, minlength=n_products)
+    badge = rng.integers(0, len(BADGES), n_products)
+    docs = [{
+        "id": product_id,
+        "name": name,
+        "category": PRODUCT_KINDS[k][1],
+        "description": f"{name} with custom logo placement",
+        "base_price": price,
+        "badge": BADGES[b],
+        "total_orders": orders,
+        "total_clients": clients,
+        "margin_percent": margin,
+        "image_url": None,
+        "created_at": created_at,
+    } for product_id, name, k, price, b, orders, clients, margin, created_at in zip(
+        uuid_strings(rng, n_products), product_names.tolist(), kind.tolist(), product_prices.tolist(), badge.tolist(),
+        product_orders.tolist(), product_clients.tolist(), rng.integers(25, 56, n_products).tolist(),
+        iso_strings(product_created),
+    )]
+    await writer.write("products", docs)
+
+    # Deals
+    for offset, size in chunks(spec.deals, spec.chunk_size):
+        owner = client_zipf.sample(size)
+        entered = client_created[owner] + rng.random(size) * (now - client_created[owner])
+        stage = rng.choice(len(DEAL_STAGES), size, p=DEAL_STAGE_WEIGHTS)
+        closed = stage >= 3
+        closed_at = np.minimum(entered + rng.gamma(2.0, 15.0, size) * DAY, now)
+        stage_entered = np.where(closed, closed_at, entered + rng.random(size) * (now - entered))
+        rep = rng.integers(0, len(users), size)
+        closed_strings = iso_strings(closed_at)
+        docs = [{
+            "id": deal_id,
+            "client_name": client_name,
+            "client_id": client_id,
+            "amount": amount,
+            "product_description": DEAL_DESCRIPTIONS[d],
+            "stage": st,
+            "priority": priority,
+            "tags": TAG_OPTIONS[t],
+            "owner_initials": initials,
+            "owner_color": OWNER_COLORS[r % len(OWNER_COLORS)],
+            "date_entered": entered_at,
+            "date_closed": closed_strings[i] if is_closed else None,
+            "stage_entered_at": stage_entered_at,
+            "loss_reason": LOSS_REASONS[lr] if st == "lost" else None,
+        } for i, (deal_id, client_name, client_id, amount, d, st, priority, t, initials, r, entered_at, is_closed, stage_entered_at, lr) in enumerate(zip(
+            uuid_strings(rng, size), client_names[owner].tolist(), client_ids[owner].tolist(),
+            np.round(rng.lognormal(8.5, 0.6, size), 2).tolist(), rng.integers(0, len(DEAL_DESCRIPTIONS), size).tolist(),
+            DEAL_STAGES[stage].tolist(), PRIORITIES[rng.integers(0, 3, size)].tolist(),
+            rng.integers(0, len(TAG_OPTIONS), size).tolist(), user_initials[rep].tolist(), rep.tolist(),
+            iso_strings(entered), closed.tolist(), iso_strings(stage_entered), rng.integers(0, len(LOSS_REASONS), size).tolist(),
+        ))]
+        await writer.write("deals", docs)
+
+    # Client notes
+    for offset, size in chunks(spec.notes, spec.chunk_size):
+        owner = client_zipf.sample(size)
+        author = rng.integers(0, len(users), size)
+        created = client_created[owner] + rng.random(size) * (now - client_created[owner])
+        docs = [{
+            "id": note_id,
+            "client_id": client_id,
+            "content": NOTE_TEMPLATES[c],
+            "note_type": note_type,
+            "created_by": created_by,
+            "created_by_name": created_by_name,
+            "created_at": created_at,
+        } for note_id, client_id, c, note_type, created_by, created_by_name, created_at in zip(
+            uuid_strings(rng, size), client_ids[owner].tolist(), rng.integers(0, len(NOTE_TEMPLATES), size).tolist(),
+            NOTE_TYPES[rng.integers(0, len(NOTE_TYPES), size)].tolist(), user_ids[author].tolist(),
+            user_names[author].tolist(), iso_strings(created),
+        )]
+        await writer.write("client_notes", docs)
+
+    # Messages between team members
+    for offset, size in chunks(spec.messages, spec.chunk_size):
+        sender = rng.integers(0, len(users), size)
+        recipient = rng.integers(0, len(users), size)
+        docs = [{
+            "id": message_id,
+            "sender_id": user_ids[s],
+            "sender_name": user_names[s],
+            "recipient_id": user_ids[r],
+            "recipient_name": user_names[r],
+            "subject": MESSAGE_SUBJECTS[subject],
+            "content": f"{MESSAGE_SUBJECTS[subject]} - see the latest details in the client record.",
+            "message_type": "internal",
+            "is_read": is_read,
+            "created_at": created_at,
+        } for message_id, s, r, subject, is_read, created_at in zip(
+            uuid_strings(rng, size), sender.tolist(), recipient.tolist(),
+            rng.integers(0, len(MESSAGE_SUBJECTS), size).tolist(), (rng.random(size) < 0.7).tolist(),
+            iso_strings(start + rng.random(size) * (now - start)),
+        )]
+        await writer.write("messages", docs)
+
+    await writer.flush()
+    return dict(writer.inserted)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = SyntheticDataSpec()
+    for name, field in SyntheticDataSpec.model_fields.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=field.annotation if name != "seed" else int,
+                            default=getattr(defaults, name), dest=name)
+    args = parser.parse_args()
+    spec = SyntheticDataSpec(**{k: v for k, v in vars(args).items() if v is not None})
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pathlib import Path
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    started = time.perf_counter()
+    last_report = [0.0]
+
+    def report(collection: str, inserted: int):
+        if time.perf_counter() - last_report[0] > 2:
+            last_report[0] = time.perf_counter()
+            print(f"  {collection}: {inserted:,}", flush=True)
+
+    counts = await generate_dataset(db, spec, report)
+    # Invalidate list ETags (see bump_collection_versions in deps.py)
+    for collection in counts:
+        await db.collection_versions.update_one({"_id": collection}, {"$inc": {"version": 1}}, upsert=True)
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"Inserted {total:,} documents in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s)")
+    for collection, count in sorted(counts.items()):
+        print(f"  {collection:<14} {count:>12,}")
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
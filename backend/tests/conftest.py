@@ -0,0 +1,59 @@
+"""
+Shared setup for the API test suites.
+
+The tests call a running API at REACT_APP_BACKEND_URL. When that is not set,
+an API process is started on a free local port with an embedded backend
+(TEST_DB_BACKEND: "memory" by default, or "sqlite"), so the suite runs
+without MongoDB or network access.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mongo: needs a reachable mongod; skipped (and reported) without one")
+    if os.environ.get('REACT_APP_BACKEND_URL'):
+        return
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    backend = os.environ.get('TEST_DB_BACKEND', 'memory')
+    # A low compression threshold so the compression tests never depend on payload sizes
+    env = {**os.environ, "DB_BACKEND": backend, "DB_NAME": "soa_crm_test", "COMPRESSION_MIN_SIZE": "256"}
+    if backend == "sqlite":
+        env["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="crm-test-"), "crm.sqlite3")
+    config._local_api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                break
+        except requests.ConnectionError:
+            pass
+        if time.monotonic() > deadline or config._local_api.poll() is not None:
+            config._local_api.terminate()
+            raise RuntimeError(f"API on the {backend} backend did not start")
+        time.sleep(0.1)
+    # The suites seed through the API and log in as the demo admin
+    requests.post(f"{base_url}/api/seed")
+    os.environ['REACT_APP_BACKEND_URL'] = base_url
+    # Tests that need Mongo's command monitoring skip on embedded backends
+    os.environ['TEST_DB_BACKEND'] = backend
+
+def pytest_unconfigure(config):
+    api = getattr(config, "_local_api", None)
+    if api is not None:
+        api.terminate()
+        api.wait(timeout=30)
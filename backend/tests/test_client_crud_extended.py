@@ -221,6 +221,154 @@ class TestClientCRUDExtended:
         # Cleanup
         requests.delete(f"{BASE_URL}/api/clients/{client_id}", headers=auth_headers)
     
+    def test_update_with_stale_version_conflicts(self, auth_headers):
+        """Test PUT /api/clients/{id} with If-Match - stale versions are rejected with 412"""
+        unique_suffix = uuid.uuid4().hex[:8]
+        create_resp = requests.post(f"{BASE_URL}/api/clients", json={
+            "name": f"TEST_Version_{unique_suffix}",
+            "email": f"test_version_{unique_suffix}@company.com",
+            "industry": "Retail"
+        }, headers=auth_headers)
+        assert create_resp.status_code == 200
+        client_id = create_resp.json()["id"]
+        version = create_resp.json()["version"]
+        
+        # First editor wins and bumps the version
+        first_resp = requests.put(f"{BASE_URL}/api/clients/{client_id}", json={"notes": "First editor"},
+                                  headers={**auth_headers, "If-Match": f'"{version}"'})
+        assert first_resp.status_code == 200
+        assert first_resp.json()["version"] == version + 1
+        
+        # Second editor still holds the old version
+        second_resp = requests.put(f"{BASE_URL}/api/clients/{client_id}", json={"notes": "Second editor"},
+                                   headers={**auth_headers, "If-Match": f'"{version}"'})
+        assert second_resp.status_code == 412
+        
+        get_resp = requests.get(f"{BASE_URL}/api/clients/{client_id}", headers=auth_headers)
+        assert get_resp.json()["notes"] == "First editor"
+        
+        print("Concurrent edit detected via If-Match")
+        
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/clients/{client_id}", headers=auth_headers)
+    
+    def test_get_etag_round_trips_into_if_match(self, auth_headers):
+        """Test GET /api/clients/{id} ETag - accepted as If-Match by PUT until the client changes"""
+        unique_suffix = uuid.uuid4().hex[:8]
+        create_resp = requests.post(f"{BASE_URL}/api/clients", json={
+            "name": f"TEST_RoundTrip_{unique_suffix}",
+            "email": f"test_roundtrip_{unique_suffix}@company.com",
+            "industry": "Retail"
+        }, headers=auth_headers)
+        assert create_resp.status_code == 200
+        client_id = create_resp.json()["id"]
+        
+        get_resp = requests.get(f"{BASE_URL}/api/clients/{client_id}", headers=auth_headers)
+        etag = get_resp.headers.get("ETag")
+        assert etag and not etag.startswith("W/"), "Entity GET should carry a strong ETag"
+        
+        cached_resp = requests.get(f"{BASE_URL}/api/clients/{client_id}", headers={**auth_headers, "If-None-Match": etag})
+        assert cached_resp.status_code == 304
+        
+        put_resp = requests.put(f"{BASE_URL}/api/clients/{client_id}", json={"notes": "Edited"},
+                                headers={**auth_headers, "If-Match": etag})
+        assert put_resp.status_code == 200
+        
+        # The tag now names an old version
+        stale_resp = requests.put(f"{BASE_URL}/api/clients/{client_id}", json={"notes": "Lost update"},
+                                  headers={**auth_headers, "If-Match": etag})
+        assert stale_resp.status_code == 412
+        
+        # Collection ETags are weak and never satisfy If-Match
+        list_etag = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers).headers["ETag"]
+        weak_resp = requests.put(f"{BASE_URL}/api/clients/{client_id}", json={"notes": "Weak"},
+                                 headers={**auth_headers, "If-Match": list_etag})
+        assert weak_resp.status_code == 412
+        
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/clients/{client_id}", headers=auth_headers)
+    
+    def test_new_order_invalidates_client_etag(self, auth_headers):
+        """Test GET /api/clients/{id} after POST /api/orders - order totals change the ETag"""
+        unique_suffix = uuid.uuid4().hex[:8]
+        create_resp = requests.post(f"{BASE_URL}/api/clients", json={
+            "name": f"TEST_OrderEtag_{unique_suffix}",
+            "email": f"test_orderetag_{unique_suffix}@company.com",
+            "industry": "Retail"
+        }, headers=auth_headers)
+        assert create_resp.status_code == 200
+        client_id = create_resp.json()["id"]
+        
+        get_resp = requests.get(f"{BASE_URL}/api/clients/{client_id}", headers=auth_headers)
+        etag = get_resp.headers["ETag"]
+        assert get_resp.json()["total_orders"] == 0
+        
+        order_resp = requests.post(f"{BASE_URL}/api/orders", json={
+            "client_id": client_id,
+            "line_items": [{"product_name": "TEST Custom T-Shirts", "quantity": 10, "unit_price": 12.50}],
+            "due_date": "2026-03-15"
+        }, headers=auth_headers)
+        assert order_resp.status_code == 200
+        
+        refreshed_resp = requests.get(f"{BASE_URL}/api/clients/{client_id}", headers={**auth_headers, "If-None-Match": etag})
+        assert refreshed_resp.status_code == 200, "Client totals changed, the old ETag must not match"
+        assert refreshed_resp.json()["total_orders"] == 1
+        assert refreshed_resp.headers["ETag"] != etag
+        
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/orders/{order_resp.json()['id']}", headers=auth_headers)
+        requests.delete(f"{BASE_URL}/api/clients/{client_id}", headers=auth_headers)
+    
+    def test_list_clients_conditional_get(self, auth_headers):
+        """Test GET /api/clients with If-None-Match - unchanged list returns 304"""
+        first_resp = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers)
+        assert first_resp.status_code == 200
+        etag = first_resp.headers.get("ETag")
+        assert etag and etag.startswith('W/"'), "List should carry a weak ETag"
+        
+        cached_resp = requests.get(f"{BASE_URL}/api/clients", headers={**auth_headers, "If-None-Match": etag})
+        assert cached_resp.status_code == 304
+        assert cached_resp.content == b""
+        
+        # Any client write invalidates the ETag
+        unique_suffix = uuid.uuid4().hex[:8]
+        create_resp = requests.post(f"{BASE_URL}/api/clients", json={
+            "name": f"TEST_ETag_{unique_suffix}",
+            "email": f"test_etag_{unique_suffix}@company.com",
+            "industry": "Retail"
+        }, headers=auth_headers)
+        assert create_resp.status_code == 200
+        
+        fresh_resp = requests.get(f"{BASE_URL}/api/clients", headers={**auth_headers, "If-None-Match": etag})
+        assert fresh_resp.status_code == 200
+        assert fresh_resp.headers.get("ETag") != etag
+        
+        print("Conditional GET honoured ETag")
+        
+        # Cleanup
+        requests.delete(f"{BASE_URL}/api/clients/{create_resp.json()['id']}", headers=auth_headers)
+    
+    def test_list_clients_sparse_fields(self, auth_headers):
+        """Test GET /api/clients?fields= - only requested fields (plus id) are returned"""
+        response = requests.get(f"{BASE_URL}/api/clients?fields=name", headers=auth_headers)
+        assert response.status_code == 200
+        for client in response.json():
+            assert set(client) == {"id", "name"}, f"Unexpected fields: {set(client)}"
+        
+        bad_resp = requests.get(f"{BASE_URL}/api/clients?fields=name,not_a_field", headers=auth_headers)
+        assert bad_resp.status_code == 400
+        
+        print("Sparse field selection returned trimmed clients")
+
+    def test_list_clients_server_timing(self, auth_headers):
+        """Test GET /api/clients reports Mongo round trips in Server-Timing"""
+        response = requests.get(f"{BASE_URL}/api/clients", headers=auth_headers)
+        assert response.status_code == 200
+        timing = response.headers.get("Server-Timing", "")
+        assert timing.startswith("db;dur="), f"Missing db timing: {timing}"
+        assert 'queries"' in timing
+        print(f"Server-Timing: {timing}")
+
     def test_create_client_minimal_fields(self, auth_headers):
         """Test POST /api/clients - Create client with only required fields (name, email, industry)"""
         unique_suffix = uuid.uuid4().hex[:8]
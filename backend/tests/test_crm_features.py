@@ -6,6 +6,7 @@ import pytest
 import requests
 import os
 import uuid
+import time
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
 
@@ -553,6 +554,86 @@ class TestExport:
         assert "type" in data
         assert data["type"] == "products"
         print(f"Exported {data['count']} products")
+    
+    def test_export_orders_compressed(self, auth_headers):
+        """Test GET /api/export/orders is gzip-encoded when the client accepts it"""
+        response = requests.get(f"{BASE_URL}/api/export/orders",
+                                headers={**auth_headers, "Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers.get("Content-Encoding") == "gzip"
+        assert "Accept-Encoding" in response.headers.get("Vary", "")
+        assert response.json()["type"] == "orders"
+        
+        health = requests.get(f"{BASE_URL}/health", headers={"Accept-Encoding": "gzip"})
+        assert health.headers.get("Content-Encoding") is None, "Health probe must not be compressed"
+        print(f"Export encoding: {response.headers.get('Content-Encoding')}")
+
+
+class TestMetrics:
+    """Prometheus /metrics endpoint tests"""
+
+    def test_metrics_exposes_route_templates(self):
+        """Test GET /metrics labels request latency by route template, not raw path"""
+        requests.get(f"{BASE_URL}/api/clients/TEST_missing_client")
+        response = requests.get(f"{BASE_URL}/metrics")
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/plain")
+        body = response.text
+        assert 'route="/api/clients/{client_id}"' in body
+        assert "TEST_missing_client" not in body
+        assert "http_requests_in_flight" in body
+        assert "mongodb_command_duration_seconds" in body
+        print("Metrics endpoint OK")
+
+
+class TestQueryDiagnostics:
+    """Slow-query log API tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_headers(self):
+        """Get auth headers for tests"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": TEST_EMAIL,
+            "password": TEST_PASSWORD
+        })
+        token = response.json().get("access_token")
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_slow_queries_grouped_by_shape(self, auth_headers):
+        """Test GET /api/admin/slow-queries - worst shapes first, one entry per shape"""
+        response = requests.get(f"{BASE_URL}/api/admin/slow-queries?limit=10", headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) <= 10
+        shapes = [entry["shape"] for entry in data]
+        assert len(shapes) == len(set(shapes))
+        totals = [entry["total_ms"] for entry in data]
+        assert totals == sorted(totals, reverse=True)
+        print(f"Slow query shapes: {len(data)}")
+
+    @pytest.mark.skipif(os.environ.get('TEST_DB_BACKEND', 'mongo') != 'mongo',
+                        reason="query shapes are recorded by Mongo command listeners only")
+    def test_index_advice_ranked(self, auth_headers):
+        """Test GET /api/admin/index-advice - suggestions carry keys and ratios, best score first"""
+        # No index covers a badge filter sorted by created_at
+        requests.get(f"{BASE_URL}/api/products?badge=TEST_unindexed", headers=auth_headers)
+        response = requests.get(f"{BASE_URL}/api/admin/index-advice?limit=100", headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert 0 < len(data) <= 100
+        assert any(a["collection"] == "products" and a["keys"][0][0] == "badge" for a in data)
+        for advice in data:
+            assert advice["keys"] and advice["collection"]
+            assert advice["create_index"].startswith(f"db.{advice['collection']}.createIndex(")
+            assert advice["executions"] >= 1
+        scores = [advice["score"] for advice in data]
+        assert scores == sorted(scores, reverse=True)
+        print(f"Index suggestions: {[a['create_index'] for a in data]}")
+
+    def test_slow_queries_requires_auth(self):
+        """Test GET /api/admin/slow-queries without a token is rejected"""
+        response = requests.get(f"{BASE_URL}/api/admin/slow-queries")
+        assert response.status_code in [401, 403]
 
 
 class TestCleanup:
@@ -599,5 +680,191 @@ class TestCleanup:
         print(f"Cleaned up {cleanup_count} test items")
 
 
+class TestSyntheticData:
+    """Synthetic data generator API tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_headers(self):
+        """Get auth headers for tests"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": TEST_EMAIL,
+            "password": TEST_PASSWORD
+        })
+        token = response.json().get("access_token")
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_generate_small_dataset(self, auth_headers):
+        """Test POST /api/admin/synthetic-data - job completes with the requested counts"""
+        spec = {"clients": 20, "products": 5, "orders": 50, "deals": 10, "notes": 10, "messages": 5, "seed": 1}
+        response = requests.post(f"{BASE_URL}/api/admin/synthetic-data", json=spec, headers=auth_headers)
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+
+        for _ in range(60):
+            job = requests.get(f"{BASE_URL}/api/admin/synthetic-data/{job_id}", headers=auth_headers).json()
+            if job["status"] != "running":
+                break
+            time.sleep(0.5)
+        assert job["status"] == "completed", job.get("error")
+        assert job["inserted"] == {
+            "clients": 20, "products": 5, "orders": 50, "deals": 10, "client_notes": 10, "messages": 5
+        }
+        print(f"Synthetic data inserted: {job['inserted']}")
+
+    def test_unknown_job_returns_404(self, auth_headers):
+        """Test GET /api/admin/synthetic-data/{job_id} - 404 for unknown job"""
+        response = requests.get(f"{BASE_URL}/api/admin/synthetic-data/{uuid.uuid4()}", headers=auth_headers)
+        assert response.status_code == 404
+
+
+class TestSnapshots:
+    """Dataset snapshot API tests"""
+
+    @pytest.fixture(scope="class")
+    def auth_headers(self):
+        """Get auth headers for tests"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": TEST_EMAIL,
+            "password": TEST_PASSWORD
+        })
+        token = response.json().get("access_token")
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_snapshot_round_trip(self, auth_headers):
+        """Test snapshot create, list, restore and delete - restore brings back the captured documents"""
+        name = f"TEST_{uuid.uuid4().hex[:8]}"
+        response = requests.post(f"{BASE_URL}/api/admin/snapshots", json={"name": name, "collections": ["products"]}, headers=auth_headers)
+        assert response.status_code == 200
+        captured = response.json()["collections"]["products"]["count"]
+
+        listed = requests.get(f"{BASE_URL}/api/admin/snapshots", headers=auth_headers).json()
+        assert name in [s["name"] for s in listed]
+
+        requests.post(f"{BASE_URL}/api/products", json={"name": "TEST_Snapshot_Product", "category": "gifts", "description": "TEST", "base_price": 1}, headers=auth_headers)
+        response = requests.post(f"{BASE_URL}/api/admin/snapshots/{name}/restore", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["data"] == {"products": captured}
+        products = requests.get(f"{BASE_URL}/api/products", headers=auth_headers).json()
+        assert "TEST_Snapshot_Product" not in [p["name"] for p in products]
+
+        assert requests.delete(f"{BASE_URL}/api/admin/snapshots/{name}", headers=auth_headers).status_code == 200
+        print(f"Snapshot round trip restored {captured} products")
+
+    def test_invalid_snapshot_name_rejected(self, auth_headers):
+        """Test POST /api/admin/snapshots - names are restricted to a safe file name alphabet"""
+        response = requests.post(f"{BASE_URL}/api/admin/snapshots", json={"name": "../etc"}, headers=auth_headers)
+        assert response.status_code == 400
+
+    def test_invalid_collection_names_rejected(self, auth_headers):
+        """Test POST /api/admin/snapshots - collection names become file names and cannot leave the snapshot"""
+        name = f"TEST_{uuid.uuid4().hex[:8]}"
+        for collection in ("/tmp/escape_test", "a/b", "../products"):
+            response = requests.post(f"{BASE_URL}/api/admin/snapshots", json={"name": name, "collections": [collection]}, headers=auth_headers)
+            assert response.status_code == 400, f"{collection!r}: {response.text}"
+        assert name not in [s["name"] for s in requests.get(f"{BASE_URL}/api/admin/snapshots", headers=auth_headers).json()]
+
+        response = requests.post(f"{BASE_URL}/api/admin/snapshots", json={"name": name, "collections": ["products"]}, headers=auth_headers)
+        assert response.status_code == 200
+        response = requests.post(f"{BASE_URL}/api/admin/snapshots/{name}/restore", params={"collections": "../products"}, headers=auth_headers)
+        assert response.status_code == 400
+        requests.delete(f"{BASE_URL}/api/admin/snapshots/{name}", headers=auth_headers)
+
+    def test_restore_never_reuses_an_etag(self, auth_headers):
+        """Test POST /api/admin/snapshots/{name}/restore - restored documents get versions past the live ones"""
+        name = f"TEST_{uuid.uuid4().hex[:8]}"
+        product_id = requests.get(f"{BASE_URL}/api/products", headers=auth_headers).json()[0]["id"]
+        assert requests.post(f"{BASE_URL}/api/admin/snapshots", json={"name": name, "collections": ["products"]}, headers=auth_headers).status_code == 200
+        original = requests.get(f"{BASE_URL}/api/products/{product_id}", headers=auth_headers)
+
+        # Restoring undoes the edit; the product must not come back under the tag it had before the edit
+        assert requests.put(f"{BASE_URL}/api/products/{product_id}", json={"description": "TEST_Edited"}, headers=auth_headers).status_code == 200
+        edited_etag = requests.get(f"{BASE_URL}/api/products/{product_id}", headers=auth_headers).headers["ETag"]
+        assert requests.post(f"{BASE_URL}/api/admin/snapshots/{name}/restore", headers=auth_headers).status_code == 200
+
+        restored = requests.get(f"{BASE_URL}/api/products/{product_id}", headers=auth_headers)
+        assert restored.json()["description"] == original.json()["description"]
+        assert restored.headers["ETag"] not in (original.headers["ETag"], edited_etag)
+        for etag in (original.headers["ETag"], edited_etag):
+            response = requests.get(f"{BASE_URL}/api/products/{product_id}", headers={**auth_headers, "If-None-Match": etag})
+            assert response.status_code == 200
+        requests.delete(f"{BASE_URL}/api/admin/snapshots/{name}", headers=auth_headers)
+
+
+class TestAppStartup:
+    """Lifespan startup and lazily loaded domain router tests"""
+
+    def test_startup_phases_reported(self):
+        """Test GET /metrics - the worker reports how long each startup phase took"""
+        body = requests.get(f"{BASE_URL}/metrics").text
+        for phase in ("connect", "indexes", "caches"):
+            assert f'app_startup_phase_seconds{{phase="{phase}"}}' in body
+
+    def test_openapi_documents_lazy_routers(self):
+        """Test GET /openapi.json - domain routes are documented even if not requested yet"""
+        response = requests.get(f"{BASE_URL}/openapi.json")
+        assert response.status_code == 200
+        paths = response.json()["paths"]
+        for path in ("/api/clients", "/api/brokers", "/api/messages", "/api/channels", "/api/integrations/{integration_id}/test"):
+            assert path in paths
+
+    def test_lazy_router_unknown_path(self):
+        """Test unknown paths under a domain prefix are still plain 404s"""
+        response = requests.get(f"{BASE_URL}/api/brokers/TEST_missing/nothing")
+        assert response.status_code == 404
+
+
+class TestLoadShedding:
+    """Adaptive concurrency limiter tests"""
+
+    def test_pools_reported(self):
+        """Test GET /metrics - CRUD and report routes are limited in separate pools"""
+        requests.get(f"{BASE_URL}/api/")
+        body = requests.get(f"{BASE_URL}/metrics").text
+        assert 'concurrency_limit{pool="crud"}' in body
+        assert 'concurrency_limit{pool="reports"}' in body
+        assert 'concurrency_in_flight{pool="crud"}' in body
+
+
+class TestRateLimits:
+    """Per-user rate limit tests"""
+
+    def test_rate_limit_headers(self):
+        """Test authenticated requests report their bucket in RateLimit-* headers"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD})
+        assert "RateLimit-Limit" in response.headers
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        first = requests.get(f"{BASE_URL}/api/clients", headers=headers)
+        second = requests.get(f"{BASE_URL}/api/clients", headers=headers)
+        assert first.status_code == 200
+        assert int(first.headers["RateLimit-Limit"]) > 0
+        assert int(second.headers["RateLimit-Remaining"]) <= int(first.headers["RateLimit-Remaining"])
+
+    def test_dashboard_reloads_not_limited(self):
+        """Test GET /api/dashboard/* - repeated dashboard loads stay within the read bucket"""
+        token = requests.post(f"{BASE_URL}/api/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for _ in range(8):
+            for path in ("stats", "pipeline-summary", "sales-trend", "recent-deals"):
+                response = requests.get(f"{BASE_URL}/api/dashboard/{path}", headers=headers)
+                assert response.status_code == 200, f"dashboard/{path} answered {response.status_code}"
+
+    def test_health_not_limited(self):
+        """Test GET /health - probes are never rate limited"""
+        response = requests.get(f"{BASE_URL}/health")
+        assert "RateLimit-Limit" not in response.headers
+
+
+class TestCircuitBreaker:
+    """Database circuit breaker tests"""
+
+    def test_healthy_circuit_serves_fresh(self):
+        """Test GET /api/products - with the database up, responses are fresh and the circuit is closed"""
+        token = requests.post(f"{BASE_URL}/api/auth/login", json={"email": TEST_EMAIL, "password": TEST_PASSWORD}).json()["access_token"]
+        response = requests.get(f"{BASE_URL}/api/products", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        assert "Warning" not in response.headers
+        assert "db_circuit_state 0.0" in requests.get(f"{BASE_URL}/metrics").text
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,164 @@
+"""
+Backend API Tests for Pipeline Analytics
+Tests the weighted forecast, deal stage history, pipeline velocity and bulk move endpoints
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', 'https://client-hub-crm-3.preview.emergentagent.com').rstrip('/')
+
+class TestPipelineForecast:
+    """Forecast endpoint tests"""
+    
+    @pytest.fixture(scope="class")
+    def headers(self):
+        """Return headers with auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "scott@soaeast.com",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    
+    def test_01_get_forecast(self, headers):
+        """Test GET /api/forecast/pipeline returns monthly and owner buckets"""
+        response = requests.get(f"{BASE_URL}/api/forecast/pipeline", headers=headers)
+        assert response.status_code == 200, f"GET /api/forecast/pipeline failed: {response.text}"
+        
+        data = response.json()
+        for stage in ["prospecting", "proposal", "negotiation"]:
+            assert 0 < data["probabilities"][stage] <= 1, f"Invalid probability for {stage}"
+        assert data["probabilities"]["prospecting"] <= data["probabilities"]["negotiation"], \
+            "Later stages should not be less likely to close"
+        
+        month_total = sum(b["expected_revenue"] for b in data["by_month"])
+        owner_total = sum(b["expected_revenue"] for b in data["by_owner"])
+        assert abs(month_total - data["total_expected"]) < 1, "Monthly buckets don't add up"
+        assert abs(owner_total - data["total_expected"]) < 1, "Owner buckets don't add up"
+        print(f"Expected pipeline revenue: ${data['total_expected']}")
+    
+    def test_02_recalibrate_forecast(self, headers):
+        """Test POST /api/forecast/recalibrate refreshes the cached model"""
+        response = requests.post(f"{BASE_URL}/api/forecast/recalibrate", headers=headers)
+        assert response.status_code == 200, f"POST /api/forecast/recalibrate failed: {response.text}"
+        
+        data = response.json()
+        assert "calibrated_at" in data
+        assert data["sample_size"] >= 0
+        print(f"Recalibrated on {data['sample_size']} closed deals")
+
+
+class TestStageHistory:
+    """Stage transition log and velocity analytics tests"""
+    
+    @pytest.fixture(scope="class")
+    def headers(self):
+        """Return headers with auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "scott@soaeast.com",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    
+    def test_01_stage_changes_are_logged(self, headers):
+        """Test PUT /api/deals/{id} appends to /api/deals/{id}/history"""
+        response = requests.post(f"{BASE_URL}/api/deals", json={
+            "client_name": f"TEST_History_{str(uuid.uuid4())[:8]}",
+            "amount": 1000,
+            "product_description": "Stage history test deal"
+        }, headers=headers)
+        assert response.status_code == 200, f"POST /api/deals failed: {response.text}"
+        deal_id = response.json()["id"]
+        
+        for stage in ["proposal", "proposal", "won"]:
+            response = requests.put(f"{BASE_URL}/api/deals/{deal_id}", json={"stage": stage}, headers=headers)
+            assert response.status_code == 200, f"PUT /api/deals/{deal_id} failed: {response.text}"
+        
+        response = requests.get(f"{BASE_URL}/api/deals/{deal_id}/history", headers=headers)
+        assert response.status_code == 200, f"GET /api/deals/{deal_id}/history failed: {response.text}"
+        history = response.json()
+        # Creation + two real moves; the repeated "proposal" is not a transition
+        assert [(t["from_stage"], t["to_stage"]) for t in history] == [
+            (None, "prospecting"), ("prospecting", "proposal"), ("proposal", "won")
+        ]
+        assert history[2]["dwell_seconds"] >= 0
+        
+        requests.delete(f"{BASE_URL}/api/deals/{deal_id}", headers=headers)
+    
+    def test_02_pipeline_velocity(self, headers):
+        """Test GET /api/analytics/pipeline-velocity returns every stage"""
+        response = requests.get(f"{BASE_URL}/api/analytics/pipeline-velocity", headers=headers)
+        assert response.status_code == 200, f"GET /api/analytics/pipeline-velocity failed: {response.text}"
+        
+        data = response.json()
+        assert [s["stage"] for s in data["stages"]] == ["prospecting", "proposal", "negotiation", "won", "lost"]
+        for stage in data["stages"]:
+            assert sum(stage["dwell_histogram"].values()) <= stage["exited"]
+        print(f"Win rate over {data['start']}..{data['end']}: {data['win_rate']}")
+
+
+class TestBulkDealMoves:
+    """PATCH /api/deals/bulk tests"""
+    
+    @pytest.fixture(scope="class")
+    def headers(self):
+        """Return headers with auth token"""
+        response = requests.post(f"{BASE_URL}/api/auth/login", json={
+            "email": "scott@soaeast.com",
+            "password": "admin123"
+        })
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    
+    def test_01_bulk_move_and_reorder(self, headers):
+        """Test moving and reordering several deals in one request"""
+        deal_ids = []
+        for i in range(2):
+            response = requests.post(f"{BASE_URL}/api/deals", json={
+                "client_name": f"TEST_Bulk_{i}_{str(uuid.uuid4())[:8]}",
+                "amount": 500,
+                "product_description": "Bulk move test deal"
+            }, headers=headers)
+            assert response.status_code == 200, f"POST /api/deals failed: {response.text}"
+            deal_ids.append(response.json()["id"])
+        missing_id = str(uuid.uuid4())
+        
+        response = requests.patch(f"{BASE_URL}/api/deals/bulk", json={"moves": [
+            {"id": deal_ids[0], "stage": "won", "position": 2048},
+            {"id": deal_ids[1], "stage": "won", "position": 1024},
+            {"id": missing_id, "stage": "lost"}
+        ]}, headers=headers)
+        assert response.status_code == 200, f"PATCH /api/deals/bulk failed: {response.text}"
+        
+        data = response.json()
+        assert data["not_found"] == [missing_id]
+        assert [d["id"] for d in data["updated"]] == deal_ids
+        for deal in data["updated"]:
+            assert deal["stage"] == "won"
+            assert deal["date_closed"], "date_closed should be set for won deals"
+        
+        # Persisted order within the column follows position
+        response = requests.get(f"{BASE_URL}/api/deals?stage=won", headers=headers)
+        ordered = [d["id"] for d in response.json() if d["id"] in deal_ids]
+        assert ordered == [deal_ids[1], deal_ids[0]]
+        
+        # Reopening clears date_closed
+        response = requests.patch(f"{BASE_URL}/api/deals/bulk", json={"moves": [
+            {"id": deal_ids[0], "stage": "negotiation"}
+        ]}, headers=headers)
+        assert response.json()["updated"][0]["date_closed"] is None
+        
+        for deal_id in deal_ids:
+            requests.delete(f"{BASE_URL}/api/deals/{deal_id}", headers=headers)
+    
+    def test_02_bulk_requires_moves(self, headers):
+        """Test PATCH /api/deals/bulk rejects an empty batch"""
+        response = requests.patch(f"{BASE_URL}/api/deals/bulk", json={"moves": []}, headers=headers)
+        assert response.status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,192 @@
+"""
+Query-plan regression tests
+Runs every GET route in-process against a local mongod seeded with a few
+thousand documents per collection, captures the queries each route sends via
+the index advisor's command listener, and explains them. A route fails when a
+filtered or sorted query falls back to COLLSCAN or examines many more
+documents than it returns.
+
+Needs a mongod at QUERY_PLAN_MONGO_URL (default mongodb://localhost:27017).
+The tests are marked `mongo` and reported as skipped when none is reachable;
+select or deselect them with -m mongo / -m "not mongo". A throwaway database
+is created and dropped.
+"""
+import pytest
+import os
+import sys
+import uuid
+import random
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+from bson import SON
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+MONGO_URL = os.environ.get('QUERY_PLAN_MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = f"crm_query_plans_{uuid.uuid4().hex[:8]}"
+SCALE = int(os.environ.get('QUERY_PLAN_SCALE', 2000))
+# docsExamined may exceed nReturned by at most this factor
+MAX_EXAMINED_RATIO = float(os.environ.get('QUERY_PLAN_MAX_RATIO', 2))
+
+sync_client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=1000)
+try:
+    sync_client.admin.command("ping")
+    MONGO_AVAILABLE = True
+except PyMongoError:
+    MONGO_AVAILABLE = False
+
+pytestmark = [
+    pytest.mark.mongo,
+    pytest.mark.skipif(not MONGO_AVAILABLE, reason=f"no mongod reachable at {MONGO_URL} (set QUERY_PLAN_MONGO_URL)"),
+]
+
+# server.py reads its connection settings at import time
+os.environ['MONGO_URL'] = MONGO_URL
+os.environ['DB_NAME'] = DB_NAME
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from slow_queries import DRIVER_FIELDS, summarize_explain  # noqa: E402
+
+ROUTES = [
+    "/api/auth/me",
+    "/api/clients",
+    "/api/clients?status=active",
+    "/api/clients/{client_id}",
+    "/api/clients/{client_id}/orders",
+    "/api/clients/{client_id}/deals",
+    "/api/clients/{client_id}/notes",
+    "/api/products",
+    "/api/products?category={category}",
+    "/api/products/{product_id}",
+    "/api/orders",
+    "/api/orders?status=pending",
+    "/api/orders?client_id={client_id}",
+    "/api/orders/{order_id}",
+    "/api/deals",
+    "/api/deals?stage=proposal",
+    "/api/deals/{deal_id}",
+    "/api/deals/{deal_id}/history",
+    "/api/dashboard/stats",
+    "/api/dashboard/pipeline-summary",
+    "/api/dashboard/recent-deals",
+    "/api/forecast/pipeline",
+    "/api/analytics/pipeline-velocity",
+    "/api/roles",
+    "/api/team",
+    "/api/brokers",
+    "/api/brokers?status=active",
+    "/api/brokers/{broker_id}",
+    "/api/messages",
+    "/api/channels",
+    "/api/channels?status=active",
+    "/api/settings",
+]
+
+def clone_documents(db, collection, count, vary):
+    """Insert count copies of the collection's existing documents with fresh ids"""
+    templates = list(db[collection].find({}, {"_id": 0}))
+    docs = []
+    for i in range(count):
+        doc = {**templates[i % len(templates)], "id": str(uuid.uuid4())}
+        doc.update(vary(i))
+        docs.append(doc)
+    db[collection].insert_many(docs, ordered=False)
+
+def seed_volume(db, scale):
+    now = datetime.now(timezone.utc)
+
+    def ago(i):
+        return (now - timedelta(minutes=i)).isoformat()
+
+    user_ids = [u["id"] for u in db.users.find({}, {"id": 1})]
+
+    clone_documents(db, "clients", scale, lambda i: {
+        "name": f"TEST_Client_{i}", "status": random.choice(["active", "inactive", "prospect"]), "created_at": ago(i)
+    })
+    client_ids = [c["id"] for c in db.clients.find({}, {"id": 1})]
+    client_names = [c["name"] for c in db.clients.find({}, {"name": 1})]
+
+    clone_documents(db, "products", scale // 4, lambda i: {"created_at": ago(i)})
+    clone_documents(db, "orders", scale * 5, lambda i: {
+        "client_id": random.choice(client_ids), "status": random.choice(["pending", "processing", "shipped", "delivered"]),
+        "created_at": ago(i)
+    })
+    clone_documents(db, "deals", scale * 2, lambda i: {
+        "client_name": random.choice(client_names),
+        "stage": random.choice(["prospecting", "proposal", "negotiation", "won", "lost"]),
+        "date_entered": ago(i)
+    })
+    deal_ids = [d["id"] for d in db.deals.find({}, {"id": 1})]
+
+    clone_documents(db, "client_notes", scale * 2, lambda i: {"client_id": random.choice(client_ids), "created_at": ago(i)})
+    clone_documents(db, "deal_stage_history", scale * 4, lambda i: {
+        "deal_id": random.choice(deal_ids), "changed_at": ago(i)
+    })
+    clone_documents(db, "messages", scale * 2, lambda i: {
+        "sender_id": random.choice(user_ids), "recipient_id": f"TEST_{uuid.uuid4().hex[:8]}", "created_at": ago(i)
+    })
+    clone_documents(db, "brokers", scale // 4, lambda i: {
+        "status": random.choice(["active", "inactive"]), "created_at": ago(i)
+    })
+    clone_documents(db, "channels", scale // 4, lambda i: {
+        "status": random.choice(["active", "inactive"]), "created_at": ago(i)
+    })
+
+def explain(command, database):
+    body = SON((key, value) for key, value in command.items() if key not in DRIVER_FIELDS)
+    return summarize_explain(sync_client[database].command(SON([("explain", body), ("verbosity", "executionStats")])))
+
+@pytest.fixture(scope="module")
+def app_client():
+    """In-process app over the seeded database, logged in as the demo admin"""
+    with TestClient(server.app) as client:
+        assert client.post("/api/seed").status_code == 200
+        response = client.post("/api/auth/login", json={"email": "scott@soaeast.com", "password": "admin123"})
+        assert response.status_code == 200, f"Login failed: {response.text}"
+        client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+        # One of each document the seed endpoint does not create, to clone from
+        client_id = client.get("/api/clients").json()[0]["id"]
+        deal_id = client.get("/api/deals").json()[0]["id"]
+        client.post(f"/api/clients/{client_id}/notes", json={"content": "TEST_note"})
+        client.post("/api/messages", json={"recipient_name": "TEST", "subject": "TEST", "content": "TEST"})
+        client.post("/api/brokers", json={"name": "TEST", "company": "TEST", "email": "test_broker@soaeast.com"})
+        client.post("/api/channels", json={"name": "TEST", "channel_type": "direct"})
+        client.put(f"/api/deals/{deal_id}", json={"stage": "proposal"})
+
+        seed_volume(sync_client[DB_NAME], SCALE)
+        yield client
+    sync_client.drop_database(DB_NAME)
+
+@pytest.fixture(scope="module")
+def ids(app_client):
+    db = sync_client[DB_NAME]
+    return {
+        "client_id": db.clients.find_one({}, {"id": 1})["id"],
+        "product_id": db.products.find_one({}, {"id": 1})["id"],
+        "category": db.products.find_one({}, {"category": 1})["category"],
+        "order_id": db.orders.find_one({}, {"id": 1})["id"],
+        "deal_id": db.deal_stage_history.find_one({}, {"deal_id": 1})["deal_id"],
+        "broker_id": db.brokers.find_one({}, {"id": 1})["id"],
+    }
+
+@pytest.mark.parametrize("route", ROUTES)
+def test_route_queries_use_indexes(app_client, ids, route):
+    """Every query a GET route issues is index-backed unless it reads the whole collection"""
+    server.index_advisor.reset()
+    response = app_client.get(route.format(**ids))
+    assert response.status_code == 200, f"GET {route} failed: {response.text}"
+
+    shapes = server.index_advisor.shapes()
+    for shape, count, query, command, database in shapes:
+        plan = explain(command, database)
+        if plan["collscan"]:
+            assert not shape.filter and not shape.sort, \
+                f"{route}: {shape.key} falls back to COLLSCAN ({' > '.join(plan['stages'])})"
+        examined, returned = plan["docs_examined"] or 0, plan["n_returned"] or 0
+        assert examined <= MAX_EXAMINED_RATIO * max(returned, 1), \
+            f"{route}: {shape.key} examined {examined} documents to return {returned}"
+    print(f"{route}: {len(shapes)} query shapes index-backed")
@@ -0,0 +1,57 @@
+"""
+Per-route Mongo time budgets
+Each request runs inside pymongo.timeout() for its route's budget, so every
+command it sends (find, aggregate, count, getMore and writes) carries
+maxTimeMS for what is left of the budget. Connection checkout and server
+selection are bounded by the same deadline. A slow aggregation or unanchored
+regex scan is stopped by the server instead of holding a pool connection,
+and the request gets a structured 503. Each overrun is counted in
+request_budget_exceeded_total{route}.
+
+Routers opt in with APIRouter(route_class=time_budget_route(budgets, default_ms)).
+Budgets are keyed by route template; None disables the budget. The deadline is a
+context variable, so tasks a request starts inherit it; give such routes None.
+The embedded backends run in-process and ignore budgets.
+"""
+from typing import Optional
+
+import pymongo
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+from pymongo.errors import PyMongoError
+
+from metrics import REQUEST_BUDGET_EXCEEDED
+
+class TimeBudgetRoute(APIRoute):
+    budgets: dict = {}
+    default_ms: Optional[int] = None
+
+    @property
+    def budget_ms(self) -> Optional[int]:
+        return self.budgets.get(self.path, self.default_ms)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        budget_ms = self.budget_ms
+        if budget_ms is None:
+            return handler
+
+        async def budgeted_handler(request: Request) -> Response:
+            with pymongo.timeout(budget_ms / 1000):
+                try:
+                    return await handler(request)
+                except PyMongoError as exc:
+                    if not exc.timeout:
+                        raise
+            REQUEST_BUDGET_EXCEEDED.labels(self.path).inc()
+            return ORJSONResponse(
+                {"detail": "Request exceeded its time budget", "route": self.path, "budget_ms": budget_ms},
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+        return budgeted_handler
+
+def time_budget_route(budgets: dict, default_ms: Optional[int]) -> type:
+    """Route class applying `budgets` (route template -> ms, or None) and `default_ms` to other routes"""
+    return type("TimeBudgetRoute", (TimeBudgetRoute,), {"budgets": budgets, "default_ms": default_ms})
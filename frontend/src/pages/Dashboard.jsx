@@ -45,7 +45,7 @@ const Dashboard = () => {
         axios.get(`${API}/dashboard/pipeline-summary`),
         axios.get(`${API}/dashboard/sales-trend`),
         axios.get(`${API}/dashboard/recent-deals`),
-        axios.get(`${API}/clients`)
+        axios.get(`${API}/clients`, { params: { fields: 'id,name' } })
       ]);
       setStats(statsRes.data);
       setPipelineSummary(pipelineRes.data);
@@ -50,7 +50,7 @@ const Orders = () => {
     try {
       const [ordersRes, clientsRes] = await Promise.all([
         axios.get(`${API}/orders`),
-        axios.get(`${API}/clients`)
+        axios.get(`${API}/clients`, { params: { fields: 'id,name' } })
       ]);
       setOrders(ordersRes.data);
       setClients(clientsRes.data);
@@ -14,6 +14,17 @@ import { Plus, Filter, List } from 'lucide-react';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
+// Gap between persisted card positions within a column
+const POSITION_STEP = 1024;
+
+// Mirrors the server's ordering: cards never reordered (no position) come first
+const comparePositions = (a, b) => {
+  if (a.position == null || b.position == null) {
+    return (a.position == null ? 0 : 1) - (b.position == null ? 0 : 1);
+  }
+  return a.position - b.position;
+};
+
 const Pipeline = () => {
   const [deals, setDeals] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -52,17 +63,32 @@ const Pipeline = () => {
   const handleDragEnd = async (result) => {
     if (!result.destination) return;
     
-    const { draggableId, destination } = result;
+    const { draggableId, source, destination } = result;
     const newStage = destination.droppableId;
+    const stageChanged = source.droppableId !== newStage;
+    if (!stageChanged && source.index === destination.index) return;
+    
+    // Renumber the destination column so the new card order is persisted
+    const column = getDealsByStage(newStage).filter(d => d.id !== draggableId);
+    column.splice(destination.index, 0, deals.find(d => d.id === draggableId));
+    const moves = column.map((d, index) => ({ id: d.id, position: (index + 1) * POSITION_STEP }));
+    if (stageChanged) {
+      moves[destination.index].stage = newStage;
+    }
+    const positions = Object.fromEntries(moves.map(m => [m.id, m.position]));
     
     // Optimistic update
-    setDeals(prev => prev.map(d => 
-      d.id === draggableId ? { ...d, stage: newStage } : d
-    ));
+    setDeals(prev => prev
+      .map(d => d.id in positions
+        ? { ...d, stage: d.id === draggableId ? newStage : d.stage, position: positions[d.id] }
+        : d)
+      .sort(comparePositions));
     
     try {
-      await axios.put(`${API}/deals/${draggableId}`, { stage: newStage });
-      toast.success(`Deal moved to ${stages.find(s => s.id === newStage)?.name}`);
+      await axios.patch(`${API}/deals/bulk`, { moves });
+      if (stageChanged) {
+        toast.success(`Deal moved to ${stages.find(s => s.id === newStage)?.name}`);
+      }
     } catch (error) {
       toast.error('Failed to update deal');
       fetchDeals(); // Revert on error